@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import numpy as np
+
+from functions.result_cache import data_fingerprint, code_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Bump when the content of the checkpoint files changes, older checkpoints are then discarded instead of resumed
+CHECKPOINT_VERSION = '2'
+
+
+def run_key(module_name, in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash, options=None):
+    # Hash of everything a WFO run depends on, a checkpoint left by a different run must not be resumed.
+    # module_name is the module whose code the results come from, or a tuple of them (e.g. the strategy and the WFO script).
+    # options holds any other setting that changes the results, e.g. {'history_indicators': True}
+    h = hashlib.sha1(CHECKPOINT_VERSION.encode())
+    for name in ((module_name,) if isinstance(module_name, str) else module_name):
+        h.update(code_fingerprint(name).encode())
+    for i in range(len(in_indexes)):
+        for frame, index in ((in_ohlcv[i], in_indexes[i]), (out_ohlcv[i], out_indexes[i])):
+            h.update(data_fingerprint(frame).encode())
+            h.update(np.ascontiguousarray(np.asarray(index).astype('datetime64[ns]')).tobytes())
+    h.update(repr(sorted((name, list(values)) for name, values in param_ranges.items())).encode())
+    h.update(f'{freq}|{float(fees)!r}|{float(init_cash)!r}|{sorted((options or {}).items())!r}'.encode())
+    return h.hexdigest()
+
+class RunCheckpoint:
+    """
+    Checkpoints of a walk-forward run, so a crash, an out-of-memory kill or a Ctrl-C doesn't lose the
+    windows already done. Every finished in-sample chunk is appended to the window's chunk file as soon
+    as it comes back from the pool, the parameters chosen for a window are saved before its
+    out-of-sample test, and the whole window result once it is complete (which drops its chunk file).
+
+    With resume=True a checkpoint of the same run (same run_key) is picked up where it stopped, anything
+    else in the folder is cleared first.
+    """
+
+    def __init__(self, directory, key, resume=True):
+        self.directory = directory
+        self.key = key
+        manifest_path = os.path.join(directory, 'manifest.json')
+        previous = None
+        if resume and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous = json.load(f).get('key')
+        if previous != key:
+            if os.path.isdir(directory):
+                logger.info(f"Discarding the checkpoint in {directory}" + (" (different run)" if previous else ""))
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+            with open(manifest_path, 'w') as f:
+                json.dump({'key': key}, f)
+        else:
+            logger.info(f"Resuming from the checkpoint in {directory}")
+
+    def _path(self, kind, i):
+        return os.path.join(self.directory, f'window_{i}_{kind}.pkl')
+
+    def _load(self, kind, i):
+        try:
+            with open(self._path(kind, i), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _save(self, kind, i, obj):
+        path = self._path(kind, i)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def save_chunk(self, i, param_combinations, results):
+        # Appended as one pickle record per chunk, a record cut short by a crash is ignored on load
+        with open(self._path('chunks', i), 'ab') as f:
+            pickle.dump((list(param_combinations), results), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load_chunks(self, i):
+        # {params tuple: metrics row (METRIC_NAMES order)} of the in-sample combinations already evaluated for window i
+        done = {}
+        try:
+            with open(self._path('chunks', i), 'rb') as f:
+                while True:
+                    param_combinations, results = pickle.load(f)
+                    done.update(zip(map(tuple, param_combinations), results))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        return done
+
+    def save_selection(self, i, chosen_params):
+        self._save('selection', i, chosen_params)
+
+    def load_selection(self, i):
+        return self._load('selection', i)
+
+    def save_window(self, i, result):
+        self._save('result', i, result)
+        for kind in ('chunks', 'selection'):
+            try:
+                os.remove(self._path(kind, i))
+            except OSError:
+                pass
+
+    def load_window(self, i):
+        return self._load('result', i)
+
+class WindowStore:
+    """
+    Results of finished walk-forward windows, kept across runs. Each window is stored under a hash of its
+    position, its in-sample and out-of-sample candles, the code, param_ranges and settings (plus anything
+    else passed as context, e.g. the candles the indicators were warmed up on). With a fixed-length split
+    (wfo_split) candles appended to the data file only add windows at the end: every other window is
+    loaded from the store and only the new trailing windows are computed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, module_name, i, in_ohlcv_i, out_ohlcv_i, in_index, out_index, param_ranges, freq, fees, init_cash, context=None):
+        return run_key(module_name, [in_ohlcv_i], [out_ohlcv_i], [in_index], [out_index], param_ranges, freq, fees, init_cash,
+                       {'window': i, 'context': repr(context)})
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, key, result):
+        with open(self.path(key) + '.tmp', 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path(key) + '.tmp', self.path(key))
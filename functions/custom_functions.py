@@ -13,3 +13,34 @@ def wfo_rolling_split_params(total_candles, insample_percentage, n):
 
 
 
+
+def wfo_split(ohlcv, insample_len, outsample_len, anchored=False):
+    # Walk-forward split with fixed lengths in candles: out-of-sample segments of outsample_len candles follow each other
+    # from candle insample_len on, as many as fit in the data, each after an in-sample window of insample_len candles
+    # (or of every candle before it when anchored). Candles appended to ohlcv only add windows at the end, the
+    # existing windows keep their candles. Returns ((in_ohlcv, in_indexes), (out_ohlcv, out_indexes)) laid out like
+    # raw_ohlcv.vbt.rolling_split (in_ohlcv[i] with a RangeIndex, in_indexes[i] its dates)
+    n = (len(ohlcv) - insample_len) // outsample_len
+    if insample_len < 1 or outsample_len < 1 or n < 1:
+        raise ValueError(f"Cannot split {len(ohlcv)} candles into windows of {insample_len} in-sample and {outsample_len} out-of-sample candles")
+
+    in_ohlcv, in_indexes, out_ohlcv, out_indexes = [], [], [], []
+    for i in range(n):
+        end = insample_len + i * outsample_len
+        start = 0 if anchored else end - insample_len
+        for frames, indexes, part in ((in_ohlcv, in_indexes, ohlcv.iloc[start:end]), (out_ohlcv, out_indexes, ohlcv.iloc[end:end + outsample_len])):
+            frames.append(part.reset_index(drop=True))
+            indexes.append(part.index)
+    return (in_ohlcv, in_indexes), (out_ohlcv, out_indexes)
+
+def wfo_anchored_split(ohlcv, n, insample_percentage):
+    # Anchored (expanding) walk-forward split: every in-sample window starts at the first candle and ends where its
+    # out-of-sample segment starts. The n out-of-sample segments have the same length and follow each other up to the
+    # last candle, the first in-sample window holds insample_percentage of the first in-sample + out-of-sample span
+    total_candles = len(ohlcv)
+    window_len = total_candles / (insample_percentage + n * (1 - insample_percentage))
+    out_len = int(window_len * (1 - insample_percentage))
+    first_end = total_candles - n * out_len
+    if out_len < 1 or first_end < 1:
+        raise ValueError(f"Cannot split {total_candles} candles into {n} anchored windows with insample_percentage={insample_percentage}")
+    return wfo_split(ohlcv, first_end, out_len, anchored=True)
@@ -0,0 +1,41 @@
+from itertools import zip_longest
+
+from functions.indicators import slice_indicators
+from functions.patterns import calculate_candle_patterns_df
+from functions.result_cache import data_fingerprint
+
+
+class HistoryIndicators:
+    """
+    Candle patterns and a strategy's grid indicators (its calculate_grid_indicators) computed once over
+    the whole history instead of once per WFO window. Overlapping windows share them, and every window
+    starts with indicators warmed up on the bars before it instead of a cold ATR/EWM/rolling window.
+
+    window(df) returns (patterns, indicators, key) for a window whose index holds dates of the
+    history, key identifying the data the warm-up came from (for functions.result_cache).
+    """
+
+    def __init__(self, history, calculate_grid_indicators, param_ranges):
+        self.history = history
+        self.patterns = calculate_candle_patterns_df(history)
+        # Every value of every parameter appears in at least one of these combinations, that is all the
+        # indicator banks need, without building the whole grid
+        values = list(param_ranges.values())
+        cover = [tuple(v[min(k, len(v) - 1)] for v in values) for k, _ in enumerate(zip_longest(*values))]
+        self.indicators = calculate_grid_indicators(history['Open'].values, history['High'].values,
+                                                    history['Low'].values, history['Close'].values, cover)
+        self._keys = {}
+
+    def locate(self, index):
+        # (start, end) of the bars of index in the history
+        start = self.history.index.get_loc(index[0])
+        end = start + len(index)
+        if end > len(self.history) or self.history.index[end-1] != index[-1]:
+            raise ValueError("The window is not a contiguous slice of the history")
+        return start, end
+
+    def window(self, df):
+        start, end = self.locate(df.index)
+        if start not in self._keys:
+            self._keys[start] = data_fingerprint(self.history.iloc[:start])
+        return self.patterns[start:end], slice_indicators(self.indicators, start, end), self._keys[start]
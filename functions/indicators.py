@@ -0,0 +1,105 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def calculate_prefix_sum(arr):
+    # prefix[i] holds the sum of arr[:i] with NaNs counted as 0, nan_count[i] the number of NaNs in arr[:i]
+    n = len(arr)
+    prefix = np.zeros(n + 1)
+    nan_count = np.zeros(n + 1, dtype=np.int64)
+    for i in range(n):
+        if np.isnan(arr[i]):
+            prefix[i+1] = prefix[i]
+            nan_count[i+1] = nan_count[i] + 1
+        else:
+            prefix[i+1] = prefix[i] + arr[i]
+            nan_count[i+1] = nan_count[i]
+    return prefix, nan_count
+
+@njit(cache=True)
+def rolling_sum_from_prefix(prefix, nan_count, window, mean):
+    # Expanding window for the first `window` bars, then a fixed window. Any NaN inside the window yields NaN
+    n = len(prefix) - 1
+    result = np.empty(n)
+    for i in range(n):
+        start = i - window + 1 if i >= window else 0
+        if nan_count[i+1] - nan_count[start] > 0:
+            result[i] = np.nan
+        elif mean:
+            result[i] = (prefix[i+1] - prefix[start]) / (i + 1 - start)
+        else:
+            result[i] = prefix[i+1] - prefix[start]
+    return result
+
+@njit(cache=True)
+def calculate_rolling_sum(arr, window):
+    prefix, nan_count = calculate_prefix_sum(arr)
+    return rolling_sum_from_prefix(prefix, nan_count, window, False)
+
+@njit(cache=True)
+def calculate_rolling_mean(arr, window):
+    prefix, nan_count = calculate_prefix_sum(arr)
+    return rolling_sum_from_prefix(prefix, nan_count, window, True)
+
+@njit(cache=True)
+def calculate_rolling_sum_bank(arr, windows):
+    # One prefix pass shared by every window, row w holds the rolling sum for windows[w]
+    prefix, nan_count = calculate_prefix_sum(arr)
+    bank = np.empty((len(windows), len(arr)))
+    for w in range(len(windows)):
+        bank[w] = rolling_sum_from_prefix(prefix, nan_count, windows[w], False)
+    return bank
+
+@njit(cache=True)
+def calculate_rolling_mean_bank(arr, windows):
+    prefix, nan_count = calculate_prefix_sum(arr)
+    bank = np.empty((len(windows), len(arr)))
+    for w in range(len(windows)):
+        bank[w] = rolling_sum_from_prefix(prefix, nan_count, windows[w], True)
+    return bank
+
+@njit(cache=True)
+def calculate_ewm(arr, span):
+    # Same recursion and NaN handling as pandas ewm(span=span, adjust=False).mean(), so results match it exactly
+    n = len(arr)
+    result = np.empty(n)
+    if n == 0:
+        return result
+    com = (span - 1) / 2
+    alpha = 1. / (1. + com)
+    old_wt_factor = 1. - alpha
+
+    weighted = arr[0]
+    nobs = 0 if np.isnan(weighted) else 1
+    result[0] = weighted if nobs > 0 else np.nan
+    old_wt = 1.
+    for i in range(1, n):
+        cur = arr[i]
+        is_observation = not np.isnan(cur)
+        if is_observation:
+            nobs += 1
+        if not np.isnan(weighted):
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = ((old_wt * weighted) + (alpha * cur)) / (old_wt + alpha)
+                old_wt = 1.
+        elif is_observation:
+            weighted = cur
+        result[i] = weighted if nobs > 0 else np.nan
+    return result
+
+@njit(cache=True)
+def calculate_ewm_bank(arr, spans):
+    # Row s holds the EWM for spans[s], all spans computed in one compiled call
+    bank = np.empty((len(spans), len(arr)))
+    for s in range(len(spans)):
+        bank[s] = calculate_ewm(arr, spans[s])
+    return bank
+
+def slice_indicators(indicators, start, end):
+    # Bars start:end of indicators computed over a whole history (e.g. a strategy's calculate_grid_indicators).
+    # Arrays are indexed by bar on their last axis and sliced as views, anything else (the parameter values the
+    # banks were computed for) is kept as is
+    return {name: values[..., start:end] if isinstance(values, np.ndarray) else values for name, values in indicators.items()}
@@ -0,0 +1,189 @@
+import glob
+import hashlib
+import importlib
+import logging
+import os
+import time
+import types
+import numba
+import numpy as np
+import pandas as pd
+from numba.core.dispatcher import Dispatcher
+
+from functions import portfolio
+from functions.patterns import calculate_candle_patterns
+from functions.indicators import slice_indicators
+
+logger = logging.getLogger(__name__)
+
+# Every @njit kernel in strats/ and functions/ is compiled with cache=True, so the machine code is written next to
+# the source (__pycache__, or NUMBA_CACHE_DIR when set) and later runs and spawned workers load it instead of
+# compiling again. Numba only invalidates a cache entry when its own file changes, while a kernel's machine code also
+# holds the kernels it calls from other files: warm_up drops the cache of every module whose dependencies changed
+# (see invalidate_stale_kernels).
+
+
+def make_warmup_ohlcv(n_bars=256, freq='1h'):
+    # Small deterministic float64 OHLC random walk, long enough for the ATR seed and the rolling windows
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    open_prices = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.005, n_bars)) * close
+    high = np.maximum(open_prices, close) + spread
+    low = np.minimum(open_prices, close) - spread
+    index = pd.date_range('2020-01-01', periods=n_bars, freq=freq)
+    return pd.DataFrame({'Open': open_prices, 'High': high, 'Low': low, 'Close': close}, index=index)
+
+def collect_dispatchers(modules):
+    # Every numba kernel reachable from the given modules, including the ones they import from functions/
+    dispatchers = {}
+    for module in modules:
+        for obj in vars(module).values():
+            if isinstance(obj, Dispatcher):
+                dispatchers[id(obj)] = obj
+    return list(dispatchers.values())
+
+def kernel_modules(modules):
+    # The given modules and every strats/ or functions/ module they take code from, directly or through another one
+    found = {}
+    stack = list(modules)
+    while stack:
+        module = stack.pop()
+        if module.__name__ in found:
+            continue
+        found[module.__name__] = module
+        for obj in vars(module).values():
+            owner = obj.__name__ if isinstance(obj, types.ModuleType) else getattr(obj, '__module__', None)
+            if isinstance(owner, str) and owner.split('.')[0] in ('strats', 'functions') and owner not in found:
+                stack.append(importlib.import_module(owner))
+    return [found[name] for name in sorted(found)]
+
+def sources_fingerprint(modules):
+    h = hashlib.sha1()
+    for module in sorted(modules, key=lambda module: module.__name__):
+        with open(module.__file__, 'rb') as f:
+            h.update(module.__name__.encode())
+            h.update(f.read())
+    return h.hexdigest()
+
+def is_cached(dispatcher):
+    # Compiled with cache=True (numba gives the other kernels a NullCache). numba's cache object is private: without it
+    # the kernel is taken as cached, as every kernel of strats/ and functions/ is
+    cache = getattr(dispatcher, '_cache', None)
+    return cache is None or type(cache).__name__ != 'NullCache'
+
+def kernel_cache_dir(module, dispatchers):
+    # Folder of the cache files of the module's kernels, from numba's (private) cache object when it has one, otherwise
+    # the way numba places them: __pycache__ next to the source, or the source folder mirrored under NUMBA_CACHE_DIR
+    path = getattr(getattr(dispatchers[0], '_cache', None), '_cache_path', None)
+    if path is not None:
+        return path
+    source_dir = os.path.dirname(os.path.abspath(module.__file__))
+    if numba.config.CACHE_DIR:
+        return os.path.join(numba.config.CACHE_DIR, os.path.splitdrive(source_dir)[1].lstrip(os.sep))
+    return os.path.join(source_dir, '__pycache__')
+
+def flush_kernels(module, dispatchers, cache_dir):
+    # Drops the cached machine code of the module's kernels with numba's (private) Cache.flush, or when this numba
+    # version has none by deleting their index (.nbi) and data (.nbc) files, named <module file>.<kernel>-<line>...
+    flushes = [getattr(getattr(dispatcher, '_cache', None), 'flush', None) for dispatcher in dispatchers]
+    if all(callable(flush) for flush in flushes):
+        for flush in flushes:
+            flush()
+        return
+    logger.info(f"numba has no Cache.flush, deleting the cache files of {module.__name__} in {cache_dir}")
+    stem = glob.escape(os.path.splitext(os.path.basename(module.__file__))[0])
+    for pattern in (f'{stem}.*.nbi', f'{stem}.*.nbc'):
+        for path in glob.glob(os.path.join(glob.escape(cache_dir), pattern)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def invalidate_stale_kernels(modules):
+    """
+    Drop numba's on-disk cache of the kernels of every module reachable from modules (see kernel_modules)
+    when the source of that module or of any module it depends on changed since the cache was written.
+    The fingerprint of a module's dependencies is kept next to its cache files ('<module>.deps'). Call it
+    before the kernels run, the flushed ones are compiled again on their first call.
+
+    Returns the number of kernels whose cache was dropped.
+    """
+    n_flushed = 0
+    for module in kernel_modules(modules):
+        dispatchers = [d for d in collect_dispatchers([module]) if d.__module__ == module.__name__ and is_cached(d)]
+        if not dispatchers:
+            continue
+        fingerprint = sources_fingerprint(kernel_modules([module]))
+        cache_dir = kernel_cache_dir(module, dispatchers)
+        deps_path = os.path.join(cache_dir, f'{module.__name__}.deps')
+        try:
+            with open(deps_path) as f:
+                stored = f.read()
+        except OSError:
+            stored = None
+        if stored == fingerprint:
+            continue
+        flush_kernels(module, dispatchers, cache_dir)
+        n_flushed += len(dispatchers)
+        os.makedirs(os.path.dirname(deps_path), exist_ok=True)
+        with open(deps_path + '.tmp', 'w') as f:
+            f.write(fingerprint)
+        os.replace(deps_path + '.tmp', deps_path)
+    return n_flushed
+
+def cache_counts(dispatchers):
+    hits = sum(sum(dispatcher.stats.cache_hits.values()) for dispatcher in dispatchers)
+    misses = sum(sum(dispatcher.stats.cache_misses.values()) for dispatcher in dispatchers)
+    return hits, misses
+
+def warm_up(strategy_module, params, freq='1h', fees=0.0005, init_cash=100000):
+    """
+    Compile, or load from numba's on-disk cache, the kernels a WFO run uses for strategy_module, with the
+    same argument types as the real run: float64 OHLC arrays and params, one parameter combination in
+    the order of the WFO param_ranges. Call it in the parent process before creating a Pool so forked
+    workers inherit the compiled kernels (spawned workers load them from the cache instead).
+
+    Kernels whose code, or the code of a kernel they call, changed since they were cached are compiled
+    again (invalidate_stale_kernels). Returns a dict with the wall time in 'compile_seconds', the number
+    of signatures loaded from the cache ('cache_hits') or compiled ('cache_misses') and the number of
+    kernels whose cache was dropped ('invalidated').
+    """
+    invalidated = invalidate_stale_kernels([strategy_module, portfolio])
+    dispatchers = collect_dispatchers(kernel_modules([strategy_module, portfolio]))
+    hits_before, misses_before = cache_counts(dispatchers)
+    start = time.perf_counter()
+
+    df = make_warmup_ohlcv(freq=freq)
+    open_values, high_values, low_values, close_values = (df[column].values for column in ['Open', 'High', 'Low', 'Close'])
+    patterns = calculate_candle_patterns(open_values, high_values, low_values, close_values)
+
+    # Out-of-sample path: one combination through process_arrays
+    result = strategy_module.process_arrays(open_values, high_values, low_values, close_values, *params, patterns=patterns)
+    portfolio.simulate_portfolio(open_values, result['bullish_signal'], result['bearish_signal'],
+                                 result['direction'], result['exit_price'], freq, fees, init_cash)
+
+    # In-sample path: the batched grid kernel and the native simulator
+    if hasattr(strategy_module, 'process_param_grid'):
+        grid = strategy_module.process_param_grid(df, [params], patterns=patterns)
+        portfolio.simulate_grid(open_values, grid['bullish_signal'], grid['bearish_signal'],
+                                grid['direction'], grid['exit_price'], freq, fees, init_cash)
+
+    # Both paths again with indicators precomputed over the whole history (sliced here as the WFO does)
+    if hasattr(strategy_module, 'calculate_grid_indicators'):
+        indicators = slice_indicators(strategy_module.calculate_grid_indicators(open_values, high_values, low_values, close_values, [params]), 0, len(df))
+        strategy_module.process_arrays(open_values, high_values, low_values, close_values, *params, patterns=patterns, indicators=indicators)
+        strategy_module.process_param_grid(df, [params], patterns=patterns, indicators=indicators)
+
+    seconds = time.perf_counter() - start
+    hits_after, misses_after = cache_counts(dispatchers)
+    stats = {
+        'compile_seconds': seconds,
+        'cache_hits': hits_after - hits_before,
+        'cache_misses': misses_after - misses_before,
+        'invalidated': invalidated
+    }
+    logger.info(f"JIT warm-up of {strategy_module.__name__} took {seconds:.2f}s "
+                f"({stats['cache_hits']} kernels loaded from cache, {stats['cache_misses']} compiled, "
+                f"{invalidated} dropped from the cache after a code change)")
+    return stats
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the cache changes, older caches are then rebuilt
+OHLCV_CACHE_VERSION = '2'
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def default_cache_dir(path):
+    # <folder of the csv>/.ohlcv_cache/<csv name without extension>
+    return os.path.join(os.path.dirname(os.path.abspath(path)), '.ohlcv_cache', os.path.splitext(os.path.basename(path))[0])
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(cache_dir, meta):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def _build(path, cache_dir, source):
+    # Parses the csv once and writes every column to its own .npy, the Date index as int64. The files go to a new data-*
+    # folder that meta.json is then switched to: files already memory-mapped by a load are never written to (a process
+    # reading them would crash on a truncated mapping), they are only unlinked and their pages stay valid. A build cut
+    # short by a crash leaves meta.json on the previous data
+    df = pd.read_csv(path, parse_dates=['Date'], index_col='Date')
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='tmp-', dir=cache_dir)
+    np.save(os.path.join(tmp_dir, 'Date.npy'), df.index.values.view(np.int64))
+    for column in df.columns:
+        np.save(os.path.join(tmp_dir, f'{column}.npy'), np.ascontiguousarray(df[column].to_numpy()))
+    data = 'data-' + os.path.basename(tmp_dir)[len('tmp-'):]
+    os.rename(tmp_dir, os.path.join(cache_dir, data))
+    _write_meta(cache_dir, {'version': OHLCV_CACHE_VERSION, 'source': source, 'columns': list(df.columns),
+                            'unit': np.datetime_data(df.index.dtype)[0], 'data': data})
+
+    # Earlier data folders (and the files of a version 1 cache) are removed, processes mapping them keep the unlinked files
+    for entry in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, entry)
+        if entry.startswith('data-') and entry != data:
+            shutil.rmtree(entry_path, ignore_errors=True)
+        elif entry.endswith('.npy'):
+            os.remove(entry_path)
+    return df
+
+def load_ohlcv(path, cache_dir=None):
+    """
+    Same DataFrame as pd.read_csv(path, parse_dates=['Date'], index_col='Date') for the OHLCV files of
+    data/binance_data, without parsing the csv on every run. The first load writes each column to a .npy
+    file in cache_dir (default: .ohlcv_cache next to the csv), the Date index as int64, and the following
+    loads memory-map them (copy-on-write, so the frame can still be modified). The cache is built again
+    when the csv changes: its size or mtime differ and so does its hash. A rebuild writes new files, frames
+    loaded before it keep their data.
+    """
+    cache_dir = cache_dir or default_cache_dir(path)
+    stat = os.stat(path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    meta = _read_meta(cache_dir)
+
+    if meta is None or meta.get('version') != OHLCV_CACHE_VERSION:
+        logger.info(f"Building the binary cache of {path}")
+        return _build(path, cache_dir, {**source, 'sha1': file_hash(path)})
+    if {key: meta['source'].get(key) for key in source} != source:
+        # A touched but unchanged file keeps its cache
+        sha1 = file_hash(path)
+        if sha1 != meta['source'].get('sha1'):
+            logger.info(f"{path} changed, rebuilding its binary cache")
+            return _build(path, cache_dir, {**source, 'sha1': sha1})
+        meta['source'] = {**source, 'sha1': sha1}
+        _write_meta(cache_dir, meta)
+
+    try:
+        data_dir = os.path.join(cache_dir, meta['data'])
+        dates = np.load(os.path.join(data_dir, 'Date.npy'), mmap_mode='c')
+        columns = {column: np.load(os.path.join(data_dir, f'{column}.npy'), mmap_mode='c') for column in meta['columns']}
+    except FileNotFoundError:
+        # Replaced by a rebuild in another process since meta.json was read (or removed by hand)
+        logger.info(f"Binary cache of {path} is gone, building it again")
+        return _build(path, cache_dir, {**source, 'sha1': meta['source'].get('sha1') or file_hash(path)})
+    index = pd.DatetimeIndex(dates.view(f"datetime64[{meta['unit']}]"), name='Date')
+    return pd.DataFrame(columns, index=index, copy=False)
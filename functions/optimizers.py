@@ -0,0 +1,236 @@
+import inspect
+import math
+from itertools import product
+import numpy as np
+
+# Data subsets of SuccessiveHalving never go below this many bars, the indicators need a warm-up
+MIN_SUBSET_BARS = 500
+
+# Same order as the ranking of the WFO scripts
+RANK_METRICS = ('sharpe_ratio', 'sortino_ratio', 'calmar_ratio', 'total_return')
+
+
+def rank_metrics(metric_names):
+    # The RANK_METRICS among metric_names, in ranking order. Results without any of them can't be ranked
+    present = [name for name in RANK_METRICS if name in metric_names]
+    if not present:
+        raise ValueError(f"Metrics {list(metric_names)} hold none of the ranking metrics {list(RANK_METRICS)}")
+    return present
+
+def rank_key(result):
+    # Higher is better, combinations without trades (or with NaN metrics) come last as in the WFO ranking.
+    # Only the RANK_METRICS present in the result count, the in-sample metric set is configurable
+    metrics = [metric for metric in RANK_METRICS if metric in result]
+    if not result['total_trades'] > 0:
+        return (-math.inf,) * len(metrics)
+    return tuple(-math.inf if np.isnan(result[metric]) else result[metric] for metric in metrics)
+
+def optimizer_settings(optimizer):
+    # Name and constructor arguments of an optimizer (None for the whole grid), what the results of a run depend on
+    if optimizer is None:
+        return None
+    return (type(optimizer).__name__,) + tuple((name, getattr(optimizer, name)) for name in inspect.signature(type(optimizer)).parameters)
+
+def grid_size(param_ranges):
+    return math.prod(len(values) for values in param_ranges.values())
+
+def sample_combinations(rng, param_ranges, n, exclude=()):
+    # n distinct random combinations of the grid, without building the whole product
+    values = [list(v) for v in param_ranges.values()]
+    size = grid_size(param_ranges)
+    n = min(n, size - len(exclude))
+    if size <= 4 * (n + len(exclude)):
+        remaining = [params for params in product(*values) if params not in exclude]
+        return [remaining[j] for j in rng.choice(len(remaining), n, replace=False)]
+    seen = set(exclude)
+    samples = []
+    while len(samples) < n:
+        params = tuple(v[rng.integers(len(v))] for v in values)
+        if params not in seen:
+            seen.add(params)
+            samples.append(params)
+    return samples
+
+class SuccessiveHalving:
+    """
+    Successive halving over the param_ranges grid. Every candidate (the whole grid, or n_candidates
+    random combinations of it) is first tested on the last min_fraction of the in-sample bars, the best
+    1/eta of them on eta times more bars, and so on until the survivors are tested on the whole window.
+    Only the full-window results are returned, ranked like the grid results.
+
+    Usage: start(param_ranges), then ask() for (fraction, combinations) and tell() their results until
+    ask() returns None, then results().
+    """
+
+    def __init__(self, n_candidates=None, eta=3, min_fraction=1/9, seed=0):
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.seed = seed
+
+    def start(self, param_ranges):
+        rng = np.random.default_rng(self.seed)
+        if self.n_candidates is None or self.n_candidates >= grid_size(param_ranges):
+            self.candidates = list(product(*param_ranges.values()))
+        else:
+            self.candidates = sample_combinations(rng, param_ranges, self.n_candidates)
+        n_rungs = max(1, math.ceil(math.log(1 / self.min_fraction, self.eta) - 1e-9) + 1)
+        self.fractions = [min(1.0, self.min_fraction * self.eta ** r) for r in range(n_rungs)]
+        self.fractions[-1] = 1.0
+        self.rung = 0
+        self.final = []
+        return self
+
+    def ask(self):
+        if self.rung >= len(self.fractions) or not self.candidates:
+            return None
+        return self.fractions[self.rung], self.candidates
+
+    def tell(self, param_combinations, results):
+        if self.rung == len(self.fractions) - 1:
+            self.final = list(results)
+            self.candidates = []
+        else:
+            order = sorted(range(len(results)), key=lambda j: rank_key(results[j]), reverse=True)
+            n_keep = max(1, len(results) // self.eta)
+            self.candidates = [param_combinations[j] for j in sorted(order[:n_keep])]
+        self.rung += 1
+
+    def results(self):
+        return self.final
+
+class TPESampler:
+    """
+    Tree-structured Parzen estimator over the param_ranges grid (every parameter is treated as a
+    categorical with the listed values). After n_startup random combinations, each batch samples the
+    values of every parameter from the distribution of the best gamma share of the tested combinations
+    and keeps the candidates most likely under it relative to the rest. Stops after n_trials tested
+    combinations, all on the whole in-sample window.
+    """
+
+    def __init__(self, n_trials=200, n_startup=50, batch_size=25, gamma=0.2, n_ei_candidates=24, seed=0):
+        self.n_trials = n_trials
+        self.n_startup = n_startup
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.n_ei_candidates = n_ei_candidates
+        self.seed = seed
+
+    def start(self, param_ranges):
+        self.rng = np.random.default_rng(self.seed)
+        self.param_ranges = param_ranges
+        self.values = [list(v) for v in param_ranges.values()]
+        self.n_trials_total = min(self.n_trials, grid_size(param_ranges))
+        self.tested = {}
+        return self
+
+    def ask(self):
+        n = min(self.batch_size, self.n_trials_total - len(self.tested))
+        if n <= 0:
+            return None
+        if len(self.tested) < self.n_startup:
+            return 1.0, sample_combinations(self.rng, self.param_ranges, min(n, self.n_startup - len(self.tested)), self.tested)
+
+        ranked = sorted(self.tested, key=lambda params: rank_key(self.tested[params]), reverse=True)
+        n_good = max(1, math.ceil(self.gamma * len(ranked)))
+        good_weights = self._weights(ranked[:n_good])
+        bad_weights = self._weights(ranked[n_good:])
+
+        batch = []
+        chosen = set(self.tested)
+        for _ in range(n):
+            best, best_score = None, -math.inf
+            for _ in range(self.n_ei_candidates):
+                idx = [self.rng.choice(len(w), p=w) for w in good_weights]
+                params = tuple(v[k] for v, k in zip(self.values, idx))
+                if params in chosen:
+                    continue
+                score = sum(math.log(g[k]) - math.log(b[k]) for g, b, k in zip(good_weights, bad_weights, idx))
+                if score > best_score:
+                    best, best_score = params, score
+            if best is None:
+                # Every candidate was already tested, fall back to a random untested combination
+                best = sample_combinations(self.rng, self.param_ranges, 1, chosen)[0]
+            chosen.add(best)
+            batch.append(best)
+        return 1.0, batch
+
+    def _weights(self, param_combinations):
+        # Smoothed frequency of every value of every parameter (one prior count per value)
+        weights = []
+        for d, values in enumerate(self.values):
+            position = {value: k for k, value in enumerate(values)}
+            counts = np.ones(len(values))
+            for params in param_combinations:
+                counts[position[params[d]]] += 1
+            weights.append(counts / counts.sum())
+        return weights
+
+    def tell(self, param_combinations, results):
+        for params, result in zip(param_combinations, results):
+            self.tested[tuple(params)] = result
+
+    def results(self):
+        return list(self.tested.values())
+
+class CoarseToFine:
+    """
+    Coarse-to-fine refinement of the param_ranges grid. The first round tests a coarse lattice of about
+    points_per_param values per parameter (always including both ends). Every following round halves
+    the lattice step and tests the neighbours of the top_k combinations found so far at that step,
+    until the step is one value in every dimension and the neighbours of the top_k are all tested, or
+    budget combinations were tested. Give fine ranges (e.g. a small np.arange step) for continuous
+    parameters, only the regions around the best combinations are tested at full resolution.
+    """
+
+    def __init__(self, points_per_param=4, top_k=5, budget=300):
+        self.points_per_param = points_per_param
+        self.top_k = top_k
+        self.budget = budget
+
+    def start(self, param_ranges):
+        self.values = [list(v) for v in param_ranges.values()]
+        self.steps = [max(1, (len(v) - 1) // max(1, self.points_per_param - 1)) for v in self.values]
+        self.tested = {}
+        self.positions = {}
+        axes = [sorted(set(range(0, len(v), step)) | {len(v) - 1}) for v, step in zip(self.values, self.steps)]
+        self.pending = list(product(*axes))
+        return self
+
+    def ask(self):
+        n = self.budget - len(self.tested)
+        if n <= 0 or not self.pending:
+            return None
+        batch = self.pending[:n]
+        param_combinations = []
+        for idx in batch:
+            params = tuple(v[k] for v, k in zip(self.values, idx))
+            self.positions[params] = idx
+            param_combinations.append(params)
+        return 1.0, param_combinations
+
+    def tell(self, param_combinations, results):
+        for params, result in zip(param_combinations, results):
+            self.tested[self.positions[tuple(params)]] = result
+        self.pending = self._refine()
+
+    def _refine(self):
+        # Untested lattice neighbours of the best combinations, best parents first. When there are none
+        # at the current step the step is halved, refinement stops once there are none at step 1
+        ranked = sorted(self.tested, key=lambda idx: rank_key(self.tested[idx]), reverse=True)[:self.top_k]
+        while True:
+            pending = []
+            seen = set(self.tested)
+            for idx in ranked:
+                for offsets in product(*[(-step, 0, step) for step in self.steps]):
+                    neighbour = tuple(k + o for k, o in zip(idx, offsets))
+                    if neighbour in seen or any(k < 0 or k >= len(v) for k, v in zip(neighbour, self.values)):
+                        continue
+                    seen.add(neighbour)
+                    pending.append(neighbour)
+            if pending or all(step == 1 for step in self.steps):
+                return pending
+            self.steps = [max(1, step // 2) for step in self.steps]
+
+    def results(self):
+        return list(self.tested.values())
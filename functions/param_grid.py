@@ -0,0 +1,80 @@
+import math
+import numpy as np
+
+
+class ParamGrid:
+    """
+    The product of param_ranges (in the order of itertools.product) without building it: the combination
+    at position j is decoded from j (mixed radix, the last parameter varying fastest) when it is needed.
+    grid[j] gives the tuple at position j of the whole product. Positions in skip (e.g. combinations
+    already evaluated) are left out of len(grid) and of the chunks plan_chunks cuts from the grid.
+    """
+
+    def __init__(self, param_ranges, skip=None):
+        self.param_names = list(param_ranges)
+        self.values = [list(values) for values in param_ranges.values()]
+        self.sizes = [len(values) for values in self.values]
+        self.strides = [math.prod(self.sizes[d+1:]) for d in range(len(self.sizes))]
+        self.size = math.prod(self.sizes)
+        self.skip = np.unique(np.asarray([] if skip is None else skip, dtype=np.int64))
+        self._value_positions = [{value: k for k, value in enumerate(values)} for values in self.values]
+
+    def __len__(self):
+        return self.size - len(self.skip)
+
+    def __getitem__(self, position):
+        position = int(position)
+        return tuple(values[(position // stride) % size] for values, stride, size in zip(self.values, self.strides, self.sizes))
+
+    def index(self, params):
+        # Position of a combination in the whole product, None if it is not in the grid
+        if len(params) != len(self.values) or any(value not in positions for positions, value in zip(self._value_positions, params)):
+            return None
+        return sum(positions[value] * stride for positions, value, stride in zip(self._value_positions, params, self.strides))
+
+    def group_order_positions(self, start, stop, group_index):
+        # Positions of the combinations start:stop of the grid ordered by its group_index parameter first (the others in
+        # product order), skipped ones left out. Each value of the group parameter is one contiguous run of that order
+        stride, size = self.strides[group_index], self.sizes[group_index]
+        k = self._without_skipped(np.arange(start, stop, dtype=np.int64), group_index)
+        group, rest = np.divmod(k, self.size // size)
+        return (rest // stride) * (stride * size) + group * stride + rest % stride
+
+    def skipped_in_group_order(self, group_index):
+        # Sorted indices, in the order of group_order_positions, of the skipped positions
+        stride, size = self.strides[group_index], self.sizes[group_index]
+        high, low = np.divmod(self.skip, stride * size)
+        group, low = np.divmod(low, stride)
+        return np.sort(group * (self.size // size) + high * stride + low)
+
+    def count(self, start, stop, group_index, skipped=None):
+        # Number of combinations start:stop in the group order that are not skipped
+        skipped = self.skipped_in_group_order(group_index) if skipped is None else skipped
+        return (stop - start) - int(np.searchsorted(skipped, stop) - np.searchsorted(skipped, start))
+
+    def _without_skipped(self, k, group_index):
+        if len(self.skip) == 0:
+            return k
+        return np.setdiff1d(k, self.skipped_in_group_order(group_index), assume_unique=True)
+
+class GridChunk:
+    """
+    Chunk of a ParamGrid planned by plan_chunks: the combinations start:stop of the grid in group order
+    (see ParamGrid.group_order_positions). Only the bounds are kept, positions() decodes the grid positions
+    when the chunk is sent to the pool.
+    """
+
+    __slots__ = ('grid', 'group_index', 'start', 'stop', 'n')
+
+    def __init__(self, grid, group_index, start, stop, n):
+        self.grid = grid
+        self.group_index = group_index
+        self.start = start
+        self.stop = stop
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def positions(self):
+        return self.grid.group_order_positions(self.start, self.stop, self.group_index)
@@ -0,0 +1,95 @@
+import numpy as np
+from numba import njit
+
+# Bit flags of the candle pattern array, one uint8 per bar.
+# Candlestick reversion layout: bar i compared with the previous bar i-1
+ENGULFING_BULL = np.uint8(1)
+ENGULFING_BEAR = np.uint8(2)
+HAMMER_BULL = np.uint8(4)
+HAMMER_BEAR = np.uint8(8)
+# Envelope layout: bar i+1 compared with bar i-1, hammer wick measured against bar i
+ENVELOPE_ENGULFING_BULL = np.uint8(16)
+ENVELOPE_ENGULFING_BEAR = np.uint8(32)
+ENVELOPE_HAMMER_BULL = np.uint8(64)
+ENVELOPE_HAMMER_BEAR = np.uint8(128)
+
+BULLISH_PATTERNS = ENGULFING_BULL | HAMMER_BULL
+BEARISH_PATTERNS = ENGULFING_BEAR | HAMMER_BEAR
+ENVELOPE_BULLISH_PATTERNS = ENVELOPE_ENGULFING_BULL | ENVELOPE_HAMMER_BULL
+ENVELOPE_BEARISH_PATTERNS = ENVELOPE_ENGULFING_BEAR | ENVELOPE_HAMMER_BEAR
+
+
+@njit(cache=True)
+def candle_pattern_flags(prev_open, prev_high, prev_low, prev_close, open_price, high, low, close):
+    # Candlestick reversion flags of a candle against the previous one
+    flags = 0
+
+    # Engulfing Bullish pattern
+    if prev_open < close and open_price < close and prev_open > prev_close:
+        flags |= ENGULFING_BULL
+
+    # Engulfing Bearish pattern
+    if prev_open > close and open_price > close and prev_open < prev_close:
+        flags |= ENGULFING_BEAR
+
+    # Hammer Bullish pattern
+    if (open_price < close and
+        prev_open < prev_close and
+        (open_price - low) > (0.9 * (prev_close - prev_low))):
+        flags |= HAMMER_BULL
+
+    # Hammer Bearish pattern
+    if (open_price > close and
+        prev_open > prev_close and
+        (high - open_price) > (0.9 * (prev_high - prev_close))):
+        flags |= HAMMER_BEAR
+
+    return flags
+
+@njit(cache=True)
+def envelope_pattern_flags(first_open, first_close, mid_high, mid_low, open_price, high, low, close):
+    # Envelope strategy flags of a candle against the one two bars back, the hammer wick measured against the candle in between
+    flags = 0
+
+    # Engulfing Bullish candle (envelope strategies)
+    if first_open < close and open_price < close and first_open > first_close:
+        flags |= ENVELOPE_ENGULFING_BULL
+
+    # Engulfing Bearish candle (envelope strategies)
+    if first_open > close and open_price > close and first_open < first_close:
+        flags |= ENVELOPE_ENGULFING_BEAR
+
+    # Custom type of bullish hammer (envelope strategies)
+    if (open_price < close and
+        first_open < first_close and
+        (open_price - low) > (0.9 * (first_close - mid_low))):
+        flags |= ENVELOPE_HAMMER_BULL
+
+    # Custom type of bearish hammer (envelope strategies)
+    if (open_price > close and
+        first_open > first_close and
+        (high - open_price) > (0.9 * (mid_high - first_close))):
+        flags |= ENVELOPE_HAMMER_BEAR
+
+    return flags
+
+@njit(cache=True)
+def calculate_candle_patterns(open_prices, high_prices, low_prices, close_prices):
+    # Patterns only depend on OHLC, so they are computed once per data slice and shared by every parameter combination
+    n = len(close_prices)
+    patterns = np.zeros(n, dtype=np.uint8)
+
+    for i in range(1, n):
+        flags = candle_pattern_flags(open_prices[i-1], high_prices[i-1], low_prices[i-1], close_prices[i-1],
+                                     open_prices[i], high_prices[i], low_prices[i], close_prices[i])
+
+        if i < n - 1:
+            flags |= envelope_pattern_flags(open_prices[i-1], close_prices[i-1], high_prices[i], low_prices[i],
+                                            open_prices[i+1], high_prices[i+1], low_prices[i+1], close_prices[i+1])
+
+        patterns[i] = flags
+
+    return patterns
+
+def calculate_candle_patterns_df(df):
+    return calculate_candle_patterns(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values)
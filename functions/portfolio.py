@@ -0,0 +1,447 @@
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+
+from functions.universe import valid_rows
+
+# Order of the metrics returned by the simulator, same names as the WFO result columns
+METRIC_NAMES = ('sharpe_ratio', 'sortino_ratio', 'calmar_ratio', 'total_return', 'max_drawdown', 'total_trades')
+
+# Tolerances and minimum order size used by vectorbt, so fills and rejections match vbt.Portfolio.from_signals
+REL_TOL = 1e-9
+ABS_TOL = 1e-12
+MIN_SIZE = 1e-8
+
+
+@njit(cache=True)
+def is_close(a, b):
+    if np.isnan(a) or np.isnan(b) or np.isinf(a) or np.isinf(b):
+        return False
+    if a == b:
+        return True
+    return abs(a - b) <= max(REL_TOL * max(abs(a), abs(b)), ABS_TOL)
+
+@njit(cache=True)
+def is_less(a, b):
+    if is_close(a, b):
+        return False
+    return a < b
+
+@njit(cache=True)
+def add_close(a, b):
+    # a + b, snapped to exactly 0 when both sides cancel out
+    if np.sign(a) != np.sign(b):
+        if is_close(abs(a), abs(b)):
+            return 0.0
+    elif is_close(a + b, 0.0):
+        return 0.0
+    return a + b
+
+@njit(cache=True)
+def buy(cash, position, debt, free_cash, size, price, fees, short_only):
+    # Buy `size` units (np.inf = all available cash), covering a short position first
+    if short_only:
+        if position == 0:
+            return False, cash, position, debt, free_cash
+        size = min(-position, size)
+    elif cash == 0:
+        return False, cash, position, debt, free_cash
+
+    if size == 0:
+        return False, cash, position, debt, free_cash
+
+    req_cash = size * price
+    req_fees = req_cash * fees
+    total_req_cash = req_cash + req_fees
+
+    if is_close(total_req_cash, cash) or total_req_cash < cash:
+        final_size = size
+        final_req_cash = total_req_cash
+    else:
+        # Not enough cash, buy as much as the cash allows after fees
+        max_req_cash = cash / (1 + fees)
+        if max_req_cash <= 0:
+            return False, cash, position, debt, free_cash
+        final_size = max_req_cash / price
+        final_req_cash = cash
+
+    if is_less(final_size, MIN_SIZE):
+        return False, cash, position, debt, free_cash
+
+    new_cash = add_close(cash, -final_req_cash)
+    new_position = add_close(position, final_size)
+
+    if position < 0:
+        short_size = final_size if new_position < 0 else abs(position)
+        debt_diff = short_size * debt / abs(position)
+        new_debt = add_close(debt, -debt_diff)
+        new_free_cash = add_close(free_cash + 2 * debt_diff, -final_req_cash)
+    else:
+        new_debt = debt
+        new_free_cash = add_close(free_cash, -final_req_cash)
+
+    return True, new_cash, new_position, new_debt, new_free_cash
+
+@njit(cache=True)
+def sell(cash, position, debt, free_cash, size, price, fees, long_only):
+    # Sell `size` units (np.inf = close any long position and short with all free cash)
+    if long_only:
+        if position == 0:
+            return False, cash, position, debt, free_cash
+        size_limit = min(position, size)
+    elif np.isinf(size):
+        long_size = max(position, 0.0)
+        total_free_cash = add_close(free_cash, long_size * price * (1 - fees))
+        if total_free_cash <= 0:
+            if position <= 0:
+                return False, cash, position, debt, free_cash
+            size_limit = long_size
+        else:
+            size_limit = add_close(long_size, total_free_cash / (price * (1 + fees)))
+            if size_limit <= 0:
+                return False, cash, position, debt, free_cash
+    else:
+        size_limit = size
+
+    if is_close(size_limit, 0) or is_less(size_limit, MIN_SIZE):
+        return False, cash, position, debt, free_cash
+
+    acq_cash = size_limit * price
+    final_acq_cash = add_close(acq_cash, -acq_cash * fees)
+    if final_acq_cash < 0:
+        return False, cash, position, debt, free_cash
+
+    new_cash = cash + final_acq_cash
+    new_position = add_close(position, -size_limit)
+
+    if new_position < 0:
+        short_size = size_limit if position < 0 else abs(new_position)
+        short_value = short_size * price
+        new_debt = debt + short_value
+        new_free_cash = add_close(free_cash, add_close(final_acq_cash, -2 * short_value))
+    else:
+        new_debt = debt
+        new_free_cash = free_cash + final_acq_cash
+
+    return True, new_cash, new_position, new_debt, new_free_cash
+
+@njit(cache=True)
+def simulate_portfolio_path_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash):
+    # Same entries/exits the WFO scripts pass to vbt.Portfolio.from_signals (accumulate=False, all-in size,
+    # opposite entries reverse the position), filled at the open or at exit_price when the stop was hit.
+    # trades[i] is the trade count of a simulation stopped after bar i (closed trades plus the open position)
+    n = len(open_prices)
+    value = np.empty(n)
+    trades = np.empty(n, dtype=np.int64)
+    cash = float(init_cash)
+    free_cash = float(init_cash)
+    position = 0.0
+    debt = 0.0
+    total_trades = 0
+    last_price = np.nan
+
+    for i in range(n):
+        price = open_prices[i] if np.isnan(exit_price[i]) else exit_price[i]
+        if not np.isnan(price):
+            last_price = price
+
+        long_entry = False
+        short_entry = False
+        long_exit = False
+        short_exit = False
+        if i > 0:
+            long_entry = bullish_signal[i-1] and direction[i-1] != 1
+            short_entry = bearish_signal[i-1] and direction[i-1] != -1
+            long_exit = not np.isnan(exit_price[i]) and direction[i-1] == 1
+            short_exit = not np.isnan(exit_price[i]) and direction[i-1] == -1
+
+        # Conflicting signals are ignored
+        if long_entry and short_entry:
+            long_entry = False
+            short_entry = False
+
+        order = 0
+        if position > 0:
+            if short_entry:
+                order = -2
+            elif long_exit:
+                order = -1
+        elif position < 0:
+            if long_entry:
+                order = 2
+            elif short_exit:
+                order = 1
+        else:
+            if long_entry:
+                order = 2
+            elif short_entry:
+                order = -2
+
+        if order != 0 and not np.isnan(price):
+            # Snap values that are numerically zero before filling
+            cash_now = 0.0 if is_close(cash, 0) else cash
+            position_now = 0.0 if is_close(position, 0) else position
+            debt_now = 0.0 if is_close(debt, 0) else debt
+            free_cash_now = 0.0 if is_close(free_cash, 0) else free_cash
+
+            if order == 2:
+                filled, new_cash, new_position, new_debt, new_free_cash = buy(
+                    cash_now, position_now, debt_now, free_cash_now, np.inf, price, fees, False)
+            elif order == 1:
+                filled, new_cash, new_position, new_debt, new_free_cash = buy(
+                    cash_now, position_now, debt_now, free_cash_now, abs(position), price, fees, True)
+            elif order == -1:
+                filled, new_cash, new_position, new_debt, new_free_cash = sell(
+                    cash_now, position_now, debt_now, free_cash_now, abs(position), price, fees, True)
+            else:
+                filled, new_cash, new_position, new_debt, new_free_cash = sell(
+                    cash_now, position_now, debt_now, free_cash_now, np.inf, price, fees, False)
+
+            if filled:
+                # Every fill that reduces a position closes a trade
+                if (position_now > 0 and new_position < position_now) or (position_now < 0 and new_position > position_now):
+                    total_trades += 1
+                cash = new_cash
+                position = new_position
+                debt = new_debt
+                free_cash = new_free_cash
+
+        value[i] = cash + position * last_price if position != 0 else cash
+        # A position still open at the end counts as a trade as well
+        trades[i] = total_trades + 1 if position != 0 else total_trades
+
+    return value, trades
+
+@njit(cache=True)
+def simulate_portfolio_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash):
+    value, trades = simulate_portfolio_path_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash)
+    return value, trades[-1] if len(trades) > 0 else 0
+
+@njit(cache=True)
+def calculate_metrics_nb(value, init_cash, ann_factor, total_trades, mask):
+    # mask[k] tells whether METRIC_NAMES[k] is wanted, the others are left NaN and the loops only they need are skipped
+    n = len(value)
+    metrics = np.full(len(METRIC_NAMES), np.nan)
+    metrics[5] = total_trades
+    if n == 0:
+        return metrics
+
+    ratios = mask[0] or mask[1]
+    if ratios or mask[2]:
+        returns = np.empty(n)
+        prev_value = float(init_cash)
+        for i in range(n):
+            if prev_value == 0:
+                returns[i] = 0.0 if value[i] == 0 else np.inf * np.sign(value[i])
+            else:
+                returns[i] = (value[i] - prev_value) / prev_value
+                if prev_value < 0:
+                    returns[i] *= -1
+            prev_value = value[i]
+    else:
+        returns = np.empty(0)
+
+    # Sharpe and Sortino ratios
+    if ratios:
+        mean = np.nanmean(returns)
+        count = 0
+        sq_sum = 0.0
+        down_sq_sum = 0.0
+        for i in range(n):
+            if not np.isnan(returns[i]):
+                count += 1
+                sq_sum += (returns[i] - mean) ** 2
+                if returns[i] < 0:
+                    down_sq_sum += returns[i] ** 2
+
+        if n >= 2:
+            std = np.sqrt(sq_sum / (count - 1)) if count > 1 else np.nan
+            if mask[0]:
+                metrics[0] = np.inf if std == 0 else mean / std * np.sqrt(ann_factor)
+            downside_risk = np.sqrt(down_sq_sum / count) * np.sqrt(ann_factor)
+            if mask[1]:
+                metrics[1] = np.inf if downside_risk == 0 else mean * ann_factor / downside_risk
+
+    # Maximum drawdown of the equity curve, NaN when the value never fell below a previous peak
+    if mask[2] or mask[4]:
+        peak = value[0]
+        max_drawdown = 0.0
+        cum_return = 1.0
+        for i in range(n):
+            peak = max(peak, value[i])
+            max_drawdown = min(max_drawdown, value[i] / peak - 1)
+            if mask[2] and not np.isnan(returns[i]):
+                cum_return *= returns[i] + 1
+
+        if max_drawdown != 0:
+            if mask[4]:
+                metrics[4] = -max_drawdown
+            if mask[2]:
+                metrics[2] = (cum_return ** (ann_factor / n) - 1) / abs(max_drawdown)
+
+    if mask[3]:
+        metrics[3] = (value[-1] - init_cash) / init_cash
+
+    return metrics
+
+@njit(cache=True)
+def simulate_metrics_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash, ann_factor, mask):
+    value, total_trades = simulate_portfolio_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash)
+    return calculate_metrics_nb(value, init_cash, ann_factor, total_trades, mask)
+
+@njit(cache=True)
+def simulate_prefix_metrics_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash, ann_factor, ends, mask):
+    # Metrics of the first ends[k] bars for every k from a single simulation. The simulation is causal, so the
+    # value curve and trade count up to a bar don't depend on what comes after it
+    value, trades = simulate_portfolio_path_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash)
+    metrics = np.empty((len(ends), len(METRIC_NAMES)))
+    for k in range(len(ends)):
+        end = ends[k]
+        metrics[k] = calculate_metrics_nb(value[:end], init_cash, ann_factor, trades[end-1] if end > 0 else 0, mask)
+    return metrics
+
+@njit(parallel=True, cache=True)
+def simulate_grid_metrics_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash, ann_factor, mask):
+    # Row c of the 2D signal arrays belongs to parameter combination c
+    n_combos = direction.shape[0]
+    metrics = np.empty((n_combos, len(METRIC_NAMES)))
+    for c in prange(n_combos):
+        metrics[c] = simulate_metrics_nb(open_prices, bullish_signal[c], bearish_signal[c], direction[c], exit_price[c],
+                                         fees, init_cash, ann_factor, mask)
+    return metrics
+
+@njit(parallel=True, cache=True)
+def simulate_grid_prefix_metrics_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash, ann_factor, ends, mask):
+    # simulate_grid_metrics_nb for several prefixes of the bars, returns (n_combos, len(ends), len(METRIC_NAMES))
+    n_combos = direction.shape[0]
+    metrics = np.empty((n_combos, len(ends), len(METRIC_NAMES)))
+    for c in prange(n_combos):
+        metrics[c] = simulate_prefix_metrics_nb(open_prices, bullish_signal[c], bearish_signal[c], direction[c], exit_price[c],
+                                                fees, init_cash, ann_factor, ends, mask)
+    return metrics
+
+@njit(parallel=True, cache=True)
+def simulate_universe_metrics_nb(open_prices, bullish_signal, bearish_signal, direction, exit_price, fees, init_cash, ann_factor, mask):
+    # Column s of the (bars x symbols) arrays belongs to symbol s, simulated on its own candles (valid_rows)
+    n_symbols = open_prices.shape[1]
+    metrics = np.full((n_symbols, len(METRIC_NAMES)), np.nan)
+    for s in prange(n_symbols):
+        rows = valid_rows(open_prices[:, s])
+        if len(rows) < 2:
+            continue
+        metrics[s] = simulate_metrics_nb(open_prices[rows, s], bullish_signal[rows, s], bearish_signal[rows, s],
+                                         direction[rows, s], exit_price[rows, s], fees, init_cash, ann_factor, mask)
+    return metrics
+
+def get_ann_factor(freq, year_freq='365 days'):
+    # Number of bars per year, as vectorbt annualizes returns
+    return pd.Timedelta(year_freq) / pd.Timedelta(freq)
+
+def metric_mask(metric_names=METRIC_NAMES):
+    # Boolean mask over METRIC_NAMES for the metrics kernels, total_trades comes for free and is always computed
+    unknown = set(metric_names) - set(METRIC_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown metrics {sorted(unknown)}, the simulator computes {METRIC_NAMES}")
+    return np.array([name in metric_names or name == 'total_trades' for name in METRIC_NAMES])
+
+def metrics_to_dict(metrics, metric_names=METRIC_NAMES):
+    result = {name: float(m) for name, m in zip(METRIC_NAMES, metrics) if name in metric_names}
+    result['total_trades'] = int(metrics[5])
+    return result
+
+def simulate_portfolio(open_prices, bullish_signal, bearish_signal, direction, exit_price, freq, fees, init_cash, metric_names=METRIC_NAMES):
+    """
+    Compiled replacement for building a vbt.Portfolio and calling stats() when only the selection metrics
+    are needed. Takes the arrays produced by a strategy's process_dataframe and returns a dict with
+    sharpe_ratio, sortino_ratio, calmar_ratio, total_return, max_drawdown (both as fractions) and total_trades,
+    or only the metric_names among them (plus total_trades).
+    """
+    metrics = simulate_metrics_nb(
+        np.asarray(open_prices, dtype=np.float64), np.asarray(bullish_signal, dtype=np.bool_),
+        np.asarray(bearish_signal, dtype=np.bool_), np.asarray(direction, dtype=np.int32),
+        np.asarray(exit_price, dtype=np.float64), float(fees), float(init_cash), get_ann_factor(freq), metric_mask(metric_names)
+    )
+    return metrics_to_dict(metrics, metric_names)
+
+def validate_against_vectorbt(df, bullish_signal, bearish_signal, direction, exit_price, freq, fees, init_cash, rtol=1e-6):
+    """
+    Run the same signals through vbt.Portfolio.from_signals and the native simulator and raise a
+    ValueError listing every metric, and the first bar of the equity curve, that differs by more than
+    rtol. Returns the native metrics.
+    """
+    import vectorbt as vbt
+
+    bullish_signal = pd.Series(np.asarray(bullish_signal, dtype=bool), index=df.index)
+    bearish_signal = pd.Series(np.asarray(bearish_signal, dtype=bool), index=df.index)
+    direction = pd.Series(np.asarray(direction), index=df.index)
+    exit_price = pd.Series(np.asarray(exit_price, dtype=np.float64), index=df.index)
+
+    long_entries = (bullish_signal.shift(1, fill_value=False) & (direction.shift(1) != 1))
+    short_entries = (bearish_signal.shift(1, fill_value=False) & (direction.shift(1) != -1))
+    short_exits = (~np.isnan(exit_price) & (direction.shift(1) == -1))
+    long_exits = (~np.isnan(exit_price) & (direction.shift(1) == 1))
+    open_prices = df['Open'].where(np.isnan(exit_price), exit_price)
+
+    pf = vbt.Portfolio.from_signals(
+        open_prices,
+        entries=long_entries,
+        short_entries=short_entries,
+        exits=long_exits,
+        short_exits=short_exits,
+        freq=freq,
+        fees=fees,
+        init_cash=init_cash,
+        accumulate=False
+    )
+    stats = pf.stats()
+    expected = {
+        'sharpe_ratio': stats['Sharpe Ratio'],
+        'sortino_ratio': stats['Sortino Ratio'],
+        'calmar_ratio': stats['Calmar Ratio'],
+        'total_return': stats['Total Return [%]'] / 100,
+        'max_drawdown': stats['Max Drawdown [%]'] / 100,
+        'total_trades': stats['Total Trades']
+    }
+
+    native = simulate_portfolio(df['Open'].values, bullish_signal.values, bearish_signal.values,
+                                direction.values, exit_price.values, freq, fees, init_cash)
+
+    mismatches = [
+        f"{name}: native={native[name]} vectorbt={expected[name]}"
+        for name in METRIC_NAMES
+        if not np.isclose(native[name], expected[name], rtol=rtol, atol=1e-12, equal_nan=True)
+    ]
+    value, _ = simulate_portfolio_nb(np.asarray(df['Open'].values, dtype=np.float64), bullish_signal.values, bearish_signal.values,
+                                     np.asarray(direction.values, dtype=np.int32), exit_price.values, float(fees), float(init_cash))
+    expected_value = pf.value().values
+    differs = np.flatnonzero(~np.isclose(value, expected_value, rtol=rtol, atol=1e-12, equal_nan=True))
+    if len(differs):
+        i = differs[0]
+        mismatches.append(f"equity at bar {i}: native={value[i]} vectorbt={expected_value[i]}")
+    if mismatches:
+        raise ValueError("Native simulator differs from vectorbt: " + "; ".join(mismatches))
+
+    return native
+
+def simulate_grid(open_prices, bullish_signal, bearish_signal, direction, exit_price, freq, fees, init_cash, metric_names=METRIC_NAMES):
+    # 2D version of simulate_portfolio, returns a (n_combinations, len(METRIC_NAMES)) array, NaN for the metrics not in metric_names
+    return simulate_grid_metrics_nb(
+        np.asarray(open_prices, dtype=np.float64), bullish_signal, bearish_signal, direction, exit_price,
+        float(fees), float(init_cash), get_ann_factor(freq), metric_mask(metric_names)
+    )
+
+def simulate_grid_prefixes(open_prices, bullish_signal, bearish_signal, direction, exit_price, freq, fees, init_cash, ends, metric_names=METRIC_NAMES):
+    # simulate_grid for the first ends[k] bars of every combination (anchored windows sharing their first bar),
+    # each combination is simulated once over all the bars. Returns a (n_combinations, len(ends), len(METRIC_NAMES)) array
+    return simulate_grid_prefix_metrics_nb(
+        np.asarray(open_prices, dtype=np.float64), bullish_signal, bearish_signal, direction, exit_price,
+        float(fees), float(init_cash), get_ann_factor(freq), np.asarray(ends, dtype=np.int64), metric_mask(metric_names)
+    )
+
+def simulate_universe(open_prices, bullish_signal, bearish_signal, direction, exit_price, freq, fees, init_cash, metric_names=METRIC_NAMES):
+    # Multi-symbol version of simulate_portfolio for the output of a strategy's process_universe,
+    # returns a (n_symbols, len(METRIC_NAMES)) array, NaN for symbols with fewer than two candles
+    return simulate_universe_metrics_nb(
+        np.ascontiguousarray(np.asarray(open_prices, dtype=np.float64)), bullish_signal, bearish_signal, direction, exit_price,
+        float(fees), float(init_cash), get_ann_factor(freq), metric_mask(metric_names)
+    )
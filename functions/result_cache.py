@@ -0,0 +1,101 @@
+import hashlib
+import importlib
+import os
+import pickle
+import numpy as np
+
+# Bump to drop every cached result, e.g. after changing how metrics are computed outside of strats/ and functions/
+CACHE_VERSION = '1'
+
+# The simulator turns the signals into metrics, so its source is part of every strategy's fingerprint
+SIMULATOR_MODULE = 'functions.portfolio'
+
+
+def data_fingerprint(df):
+    # Hash of the OHLC values and the index of a window, the same candles give the same key whatever the file
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(df[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=np.float64)).tobytes())
+    h.update(np.ascontiguousarray(df.index.values).tobytes())
+    return h.hexdigest()
+
+def code_fingerprint(module_name):
+    # Hash of the strategy module source and of every strats/ or functions/ module it takes code from
+    module = importlib.import_module(module_name)
+    names = {module_name, SIMULATOR_MODULE}
+    for obj in vars(module).values():
+        owner = getattr(obj, '__module__', None)
+        if owner and owner.split('.')[0] in ('strats', 'functions'):
+            names.add(owner)
+
+    h = hashlib.sha1(CACHE_VERSION.encode())
+    for name in sorted(names):
+        with open(importlib.import_module(name).__file__, 'rb') as f:
+            h.update(name.encode())
+            h.update(f.read())
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    On-disk cache of in-sample evaluations. Each file holds the metrics of every parameter combination
+    evaluated on one window and is named after a hash of everything else a result depends on: the window's
+    OHLC data, the source of the strategy (and simulator) code, freq, fees and init_cash. Rerunning a WFO
+    with an extended or shifted parameter range, or an unchanged one, only evaluates what is new.
+
+    Only the parent process reads and writes the cache, files are replaced atomically.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._code = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def window_key(self, df, module_name, freq, fees, init_cash, context=None):
+        # context: anything else the results depend on, e.g. the bars the indicators were warmed up on
+        if module_name not in self._code:
+            self._code[module_name] = code_fingerprint(module_name)
+        h = hashlib.sha1()
+        parts = [data_fingerprint(df), self._code[module_name], str(freq), repr(float(fees)), repr(float(init_cash))]
+        if context is not None:
+            parts.append(str(context))
+        for part in parts:
+            h.update(part.encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def load(self, key):
+        # {params tuple: metrics dict}, empty when the window was never evaluated (or the file is unreadable)
+        try:
+            with open(self.path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return {}
+
+    def lookup(self, key, param_combinations, param_names, metric_names=None):
+        # One result dict (same layout as the WFO results) or None per combination. With metric_names, results are
+        # cut down to these metrics and the ones missing any of them count as not cached
+        entries = self.load(key)
+        wanted = None if metric_names is None else set(metric_names) | {'total_trades'}
+        cached = []
+        for params in param_combinations:
+            metrics = entries.get(tuple(params))
+            if metrics is not None and wanted is not None:
+                metrics = {name: value for name, value in metrics.items() if name in wanted}
+                if len(metrics) < len(wanted):
+                    metrics = None
+            cached.append(None if metrics is None else {'params': dict(zip(param_names, params)), **metrics})
+        return cached
+
+    def store(self, key, param_combinations, results):
+        if not param_combinations:
+            return
+        entries = self.load(key)
+        for params, result in zip(param_combinations, results):
+            # Merged with what is already stored, a run computing fewer metrics doesn't drop the others
+            entries[tuple(params)] = {**entries.get(tuple(params), {}), **{name: value for name, value in result.items() if name != 'params'}}
+        tmp_path = self.path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(key))
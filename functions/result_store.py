@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Parquet when pyarrow is installed, .npy structured arrays otherwise
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa, pq = None, None
+
+# Partition folders from the top, hive-style (name=value)
+PARTITION_KEYS = ('strategy', 'pair_freq', 'run', 'wfo_window')
+
+# File names of the two kinds of tables in a window partition
+TABLE_KINDS = ('grid', 'summary')
+
+
+def _write_table(path, data):
+    # data: structured array, written as <path>.parquet or <path>.npy (replaced atomically)
+    if pq is not None:
+        tmp_path = path + '.parquet.tmp'
+        pq.write_table(pa.table({name: data[name] for name in data.dtype.names}), tmp_path)
+        os.replace(tmp_path, path + '.parquet')
+    else:
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, data)
+        os.replace(tmp_path, path + '.npy')
+
+def _read_table(path, columns=None):
+    # DataFrame of the given columns (all by default) of a table written by _write_table, None if there is none.
+    # Only these columns are read: Parquet by column, .npy memory-mapped
+    if os.path.exists(path + '.parquet'):
+        if pq is None:
+            raise ImportError(f"pyarrow is needed to read {path}.parquet")
+        return pq.read_table(path + '.parquet', columns=columns).to_pandas()
+    if os.path.exists(path + '.npy'):
+        data = np.load(path + '.npy', mmap_mode='r')
+        return pd.DataFrame({name: np.asarray(data[name]) for name in (columns or data.dtype.names)})
+    return None
+
+def summary_row(result, in_index, out_index):
+    # One-row structured array of a WFO window result: its dates, the chosen parameters and the out-of-sample stats
+    # (columns as in wfo_results.csv), the stats that are not numbers, dates or durations are left out
+    row = {'wfo_window': result['window'],
+           'in_start': in_index[0], 'in_end': in_index[-1], 'out_start': out_index[0], 'out_end': out_index[-1],
+           **result['chosen_params']}
+    for name, value in result['out_sample_result']['stats'].items():
+        if isinstance(value, (int, float, np.number, pd.Timestamp, pd.Timedelta)) and not isinstance(value, (bool, np.bool_)):
+            row[f'OutOfSample_{name}'] = value
+    return pd.DataFrame([row]).to_records(index=False)
+
+class ResultStore:
+    """
+    Columnar store of walk-forward results for analysis across runs, one partition folder per strategy,
+    pair_freq, run and window: <root>/strategy=<name>/pair_freq=<name>/run=<id>/wfo_window=<i>/. Each
+    window holds its whole in-sample grid (grid: a row per combination with its parameters and metrics)
+    and a summary (one row: dates, chosen parameters and out-of-sample stats).
+
+    Tables are Parquet files when pyarrow is installed (the root then also reads as a hive-partitioned
+    pyarrow dataset), .npy structured arrays otherwise. query() only opens the partitions matching its
+    filters and reads only the asked columns.
+    """
+
+    def __init__(self, root, strategy=None, pair_freq=None, run=None):
+        # strategy, pair_freq and run locate the partitions the save_* methods write to
+        self.root = root
+        self.strategy = strategy
+        self.pair_freq = pair_freq
+        self.run = run
+
+    def partition(self, i):
+        return os.path.join(self.root, f'strategy={self.strategy}', f'pair_freq={self.pair_freq}', f'run={self.run}', f'wfo_window={i}')
+
+    def save_grid(self, i, table):
+        # table: the window's ResultTable (a full one, see TopResults.full)
+        os.makedirs(self.partition(i), exist_ok=True)
+        _write_table(os.path.join(self.partition(i), 'grid'), table.data)
+
+    def save_summary(self, i, result, in_index, out_index):
+        os.makedirs(self.partition(i), exist_ok=True)
+        _write_table(os.path.join(self.partition(i), 'summary'), summary_row(result, in_index, out_index))
+
+    def partitions(self, **filters):
+        # ({key: value}, path) of every window partition under root matching the filters, e.g. strategy='x' or
+        # wfo_window=[0, 1]. Partition values are compared as strings, the wfo_window values come back as int
+        def matches(key, value):
+            wanted = filters.get(key)
+            if wanted is None:
+                return True
+            wanted = wanted if isinstance(wanted, (list, tuple, set, range)) else [wanted]
+            return value in {str(w) for w in wanted}
+
+        level = [({}, self.root)]
+        for key in PARTITION_KEYS:
+            next_level = []
+            for values, path in level:
+                if not os.path.isdir(path):
+                    continue
+                for entry in sorted(os.listdir(path)):
+                    name, _, value = entry.partition('=')
+                    if name == key and matches(key, value) and os.path.isdir(os.path.join(path, entry)):
+                        next_level.append(({**values, key: int(value) if key == 'wfo_window' else value}, os.path.join(path, entry)))
+            level = next_level
+        return level
+
+    def query(self, kind='grid', columns=None, **filters):
+        # One DataFrame of the kind ('grid' or 'summary') tables of the matching partitions, with the partition
+        # values as columns. columns limits the columns read
+        if kind not in TABLE_KINDS:
+            raise ValueError(f"Unknown table kind {kind!r}, expected one of {TABLE_KINDS}")
+        frames = []
+        for values, path in self.partitions(**filters):
+            frame = _read_table(os.path.join(path, kind), [c for c in columns if c not in values] if columns else None)
+            if frame is None:
+                continue
+            for key, value in values.items():
+                if key not in frame:
+                    frame[key] = value
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=list(columns or PARTITION_KEYS))
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,184 @@
+import os
+import numpy as np
+import pandas as pd
+
+from functions.portfolio import METRIC_NAMES
+from functions.optimizers import RANK_METRICS
+
+
+class ResultTable:
+    """
+    In-sample results of a list of parameter combinations in one preallocated structured numpy array: one
+    row per combination (in the order given), a typed column per parameter and one per computed metric
+    (float64, total_trades int64). Rows are filled from the simulator's metric arrays (set_metrics) or from
+    result dicts (set_results, e.g. cached results), then ranked with ranked() or top(k). records() gives
+    result dicts in the layout of the WFO results for the few rows that need them.
+    """
+
+    def __init__(self, param_ranges, param_combinations, metric_names=METRIC_NAMES):
+        self.param_names = list(param_ranges)
+        self.metric_names = [name for name in METRIC_NAMES if name in metric_names or name == 'total_trades']
+        self.rank_metrics = [name for name in RANK_METRICS if name in self.metric_names]
+        dtype = ([(name, np.asarray(list(values)).dtype) for name, values in param_ranges.items()] +
+                 [(name, np.int64 if name == 'total_trades' else np.float64) for name in self.metric_names])
+        self.data = np.zeros(len(param_combinations), dtype=dtype)
+        for name, values in zip(self.param_names, zip(*param_combinations)):
+            self.data[name] = values
+        for name in self.metric_names:
+            if name != 'total_trades':
+                self.data[name] = np.nan
+
+    @classmethod
+    def from_array(cls, data, param_names):
+        # Table around an existing structured array with the same columns (e.g. a memory-mapped one)
+        table = cls.__new__(cls)
+        table.param_names = list(param_names)
+        table.metric_names = [name for name in METRIC_NAMES if name in data.dtype.names]
+        table.rank_metrics = [name for name in RANK_METRICS if name in table.metric_names]
+        table.data = data
+        return table
+
+    @classmethod
+    def from_records(cls, param_ranges, results, metric_names=METRIC_NAMES):
+        # Table of a list of result dicts, e.g. the combinations an optimizer tested
+        table = cls(param_ranges, [tuple(result['params'].values()) for result in results], metric_names)
+        table.set_results(np.arange(len(results)), results)
+        return table
+
+    def __len__(self):
+        return len(self.data)
+
+    def set_metrics(self, rows, metrics):
+        # metrics: (len(rows), len(METRIC_NAMES)) array as returned by the simulator
+        if len(rows) == 0:
+            return
+        metrics = np.asarray(metrics, dtype=np.float64).reshape(len(rows), len(METRIC_NAMES))
+        for name in self.metric_names:
+            self.data[name][rows] = metrics[:, METRIC_NAMES.index(name)]
+
+    def set_results(self, rows, results):
+        # results: result dicts, a metric they don't hold is left NaN
+        if len(rows) == 0:
+            return
+        for name in self.metric_names:
+            self.data[name][rows] = [result.get(name, np.nan) for result in results]
+
+    def metrics(self, rows):
+        # (len(rows), len(METRIC_NAMES)) array of the given rows, NaN for the metrics not in the table
+        metrics = np.full((len(rows), len(METRIC_NAMES)), np.nan)
+        for name in self.metric_names:
+            metrics[:, METRIC_NAMES.index(name)] = self.data[name][rows]
+        return metrics
+
+    def _sort(self, rows):
+        # Best first by the rank metrics, descending with NaN last, ties keep the row order (like DataFrame.sort_values)
+        keys = [np.where(np.isnan(values), np.inf, -values)
+                for values in (self.data[name][rows] for name in reversed(self.rank_metrics))]
+        return rows[np.lexsort(keys)] if keys else rows
+
+    def ranked(self):
+        # Rows of the combinations with trades, best first
+        return self._sort(np.flatnonzero(self.data['total_trades'] > 0))
+
+    def top(self, k):
+        # First k rows of ranked() without sorting the whole table: only the rows that can make the top k on the
+        # first rank metric are sorted
+        rows = np.flatnonzero(self.data['total_trades'] > 0)
+        if 0 < k < len(rows) and self.rank_metrics:
+            values = self.data[self.rank_metrics[0]][rows]
+            primary = np.where(np.isnan(values), np.inf, -values)
+            rows = rows[primary <= np.partition(primary, k - 1)[k - 1]]
+        return self._sort(rows)[:k]
+
+    def params(self, row):
+        return {name: self.data[name][row].item() for name in self.param_names}
+
+    def records(self, rows=None):
+        # Result dicts ({'params': {...}, metric: value, ...}) of the given rows, all rows by default
+        rows = np.arange(len(self.data)) if rows is None else rows
+        records = []
+        for row in rows:
+            record = {'params': self.params(row)}
+            for name in self.metric_names:
+                record[name] = self.data[name][row].item()
+            records.append(record)
+        return records
+
+    def to_frame(self):
+        # One column per parameter and metric, e.g. for plots
+        return pd.DataFrame(self.data)
+
+    def full(self):
+        # Every row is kept in memory, see TopResults
+        return self
+
+class TopResults:
+    """
+    Streaming stand-in for a ResultTable on grids too large to keep: chunks of results are added as they come
+    back from the pool and only the k best rows are kept, so memory doesn't grow with the grid. Ties are broken
+    by the position in param_combinations (a list or a ParamGrid), the top rows are the same as the ones of
+    the whole ResultTable.
+
+    With spill_path every added row is also appended to that file, full() then memory-maps all of them as a
+    ResultTable (e.g. for plots). release() removes the file.
+    """
+
+    def __init__(self, param_ranges, param_combinations, k, metric_names=METRIC_NAMES, spill_path=None):
+        self.param_ranges = param_ranges
+        self.param_combinations = param_combinations
+        self.k = k
+        self.metric_names = metric_names
+        self.spill_path = spill_path
+        self.best = ResultTable(param_ranges, [], metric_names)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.param_names = self.best.param_names
+        if spill_path is not None:
+            open(spill_path, 'wb').close()
+
+    def set_metrics(self, positions, metrics):
+        # Adds rows: positions are indices into param_combinations (the rows of the whole ResultTable), metrics the
+        # simulator output for them
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        chunk = ResultTable(self.param_ranges, [self.param_combinations[p] for p in positions], self.metric_names)
+        chunk.set_metrics(np.arange(len(positions)), metrics)
+        if self.spill_path is not None:
+            with open(self.spill_path, 'ab') as f:
+                chunk.data.tofile(f)
+
+        # Merged in grid order so ties keep the order of the whole table
+        positions = np.concatenate([self.positions, positions])
+        order = np.argsort(positions, kind='stable')
+        merged = ResultTable.from_array(np.concatenate([self.best.data, chunk.data])[order], self.param_names)
+        rows = np.sort(merged.top(self.k))
+        self.best = ResultTable.from_array(merged.data[rows], self.param_names)
+        self.positions = positions[order][rows]
+
+    def set_results(self, positions, results):
+        # Same as set_metrics for result dicts
+        if len(positions) == 0:
+            return
+        table = ResultTable.from_records(self.param_ranges, results, self.metric_names)
+        self.set_metrics(positions, table.metrics(np.arange(len(table))))
+
+    def top(self, k):
+        return self.best.top(min(k, self.k))
+
+    def records(self, rows=None):
+        return self.best.records(rows)
+
+    def full(self):
+        # Every added row from the spill file, None without one
+        if self.spill_path is None:
+            return None
+        if os.path.getsize(self.spill_path) == 0:
+            return ResultTable.from_array(np.empty(0, dtype=self.best.data.dtype), self.param_names)
+        return ResultTable.from_array(np.memmap(self.spill_path, dtype=self.best.data.dtype, mode='r'), self.param_names)
+
+    def release(self):
+        if self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
@@ -0,0 +1,199 @@
+import math
+import time
+import numpy as np
+
+from functions.param_grid import GridChunk, ParamGrid
+from functions.worker_pool import terminate_pool
+
+# Wanted run time of one chunk once the cost per combination is known: long enough to make the IPC negligible,
+# short enough to keep the pool balanced
+TARGET_CHUNK_SECONDS = 0.5
+MIN_CHUNKS_PER_WORKER = 2
+# Used before any cost was measured (first window of a run)
+DEFAULT_CHUNKS_PER_WORKER = 4
+
+# Measured seconds per (combination x bar), keyed by task kind, kept for the lifetime of the process
+_costs = {}
+
+
+def estimate_cost(kind, n_bars):
+    # Expected seconds per parameter combination on n_bars, None until a chunk of this kind was measured
+    if kind not in _costs:
+        return None
+    return _costs[kind] * n_bars
+
+def record_cost(kind, n_combinations, n_bars, seconds):
+    cost = seconds / max(1, n_combinations * n_bars)
+    # Exponential moving average so the estimate follows the run without jumping on one slow chunk
+    _costs[kind] = cost if kind not in _costs else 0.5 * _costs[kind] + 0.5 * cost
+
+def plan_chunks(param_combinations, group_index, n_workers, seconds_per_combination=None):
+    """
+    Split a parameter grid into chunks, each a list of indices into param_combinations. Combinations
+    are ordered by their group_index parameter (the one the grid kernel shares, e.g. window or
+    ewm_period) and chunks are cut at group boundaries where possible, so each chunk computes as few
+    shared indicators as possible. With a measured cost per combination chunks aim at
+    TARGET_CHUNK_SECONDS, but there are always at least MIN_CHUNKS_PER_WORKER chunks per worker.
+    Largest chunks come first so the pool does not end on a long tail. A ParamGrid is split into
+    GridChunks (bounds in the grid's group order) instead of index lists, nothing the size of the grid
+    is built.
+    """
+    n = len(param_combinations)
+    if n == 0:
+        return []
+
+    max_size = math.ceil(n / (n_workers * MIN_CHUNKS_PER_WORKER))
+    if seconds_per_combination:
+        size = min(max_size, max(1, int(TARGET_CHUNK_SECONDS / seconds_per_combination)))
+    else:
+        size = math.ceil(n / (n_workers * DEFAULT_CHUNKS_PER_WORKER))
+
+    if isinstance(param_combinations, ParamGrid):
+        return plan_grid_chunks(param_combinations, group_index, size)
+
+    order = sorted(range(n), key=lambda j: param_combinations[j][group_index])
+    groups = []
+    for j in order:
+        if groups and param_combinations[groups[-1][0]][group_index] == param_combinations[j][group_index]:
+            groups[-1].append(j)
+        else:
+            groups.append([j])
+
+    chunks = []
+    current = []
+    for group in groups:
+        if len(current) + len(group) <= size:
+            current.extend(group)
+            continue
+        if current:
+            chunks.append(current)
+        # A group larger than a chunk is split, each piece still shares the indicator
+        while len(group) > size:
+            chunks.append(group[:size])
+            group = group[size:]
+        current = list(group)
+    if current:
+        chunks.append(current)
+
+    chunks.sort(key=len, reverse=True)
+    return chunks
+
+def plan_grid_chunks(grid, group_index, size):
+    # plan_chunks of a ParamGrid: its group order makes each value of the group parameter a contiguous run, so
+    # groups and chunks are (start, stop) bounds of that order, counted without the skipped combinations
+    skipped = grid.skipped_in_group_order(group_index)
+    group_size = grid.size // grid.sizes[group_index]
+    count = lambda start, stop: grid.count(start, stop, group_index, skipped)
+
+    chunks = []
+    current_start, current_stop, current_n = 0, 0, 0
+    for value in range(grid.sizes[group_index]):
+        start, stop = value * group_size, (value + 1) * group_size
+        n = count(start, stop)
+        if current_n + n <= size:
+            current_stop, current_n = stop, current_n + n
+            continue
+        if current_n:
+            chunks.append(GridChunk(grid, group_index, current_start, current_stop, current_n))
+        while n > size:
+            # Smallest piece holding size combinations
+            piece_stop = start + size
+            while count(start, piece_stop) < size:
+                piece_stop += size - count(start, piece_stop)
+            chunks.append(GridChunk(grid, group_index, start, piece_stop, size))
+            start, n = piece_stop, n - size
+        current_start, current_stop, current_n = start, stop, n
+    if current_n:
+        chunks.append(GridChunk(grid, group_index, current_start, current_stop, current_n))
+
+    chunks.sort(key=len, reverse=True)
+    return chunks
+
+def chunk_indices(chunk):
+    # Indices into the param_combinations of a chunk of plan_chunks (grid positions for a GridChunk)
+    return chunk.positions() if isinstance(chunk, GridChunk) else chunk
+
+def run_chunk(func, task):
+    # Worker side: evaluates one chunk and reports how long it took, so the parent can size the next chunks
+    indices, param_chunk = task
+    start = time.perf_counter()
+    results = func(param_chunk)
+    return indices, time.perf_counter() - start, results
+
+def run_window_chunk(task):
+    # Worker side of run_window_grids: the window id travels with the chunk so results can be routed back
+    window_id, func, indices, param_chunk = task
+    return (window_id,) + run_chunk(func, (indices, param_chunk))
+
+def assemble_results(n, chunks):
+    # Results of a window in grid order from its (indices, results) chunks: one array (a row per combination)
+    # when the chunks returned arrays, a list otherwise
+    if chunks and isinstance(chunks[0][1], np.ndarray):
+        results = np.empty((n,) + chunks[0][1].shape[1:], dtype=chunks[0][1].dtype)
+        for indices, chunk_results in chunks:
+            results[indices] = chunk_results
+        return results
+    results = [None] * n
+    for indices, chunk_results in chunks:
+        for j, result in zip(indices, chunk_results):
+            results[j] = result
+    return results
+
+def run_window_grids(pool, window_grids, progress=None, on_chunk=None, sinks=None):
+    """
+    Evaluate the in-sample grids of one or more windows in a single pool sweep. window_grids holds
+    (window_id, func, param_combinations, param_chunks, cost_kind, n_bars) tuples, func evaluating a
+    list of combinations of that window. Chunks are queued window after window, and (window_id, results)
+    is yielded, with results in the order of param_combinations, as soon as the last chunk of a window
+    is back, while the workers carry on with the next windows. When func returns arrays (a row per
+    combination) results is a single array, see assemble_results. progress is called with the number of
+    combinations of every finished chunk and on_chunk, if given, with (window_id, combinations, results)
+    of every finished chunk (e.g. to checkpoint it). The chunks of a window with a callable in sinks are
+    passed to it as (indices, results) when they come back instead of being kept, its results are None.
+    param_combinations may be a ParamGrid planned into GridChunks, indices are then grid positions.
+    If the sweep stops early (an exception, Ctrl-C, or the generator is not consumed to the end) the pool
+    is terminated, its queued chunks would otherwise run ahead of the next sweep's.
+    """
+    sinks = sinks or {}
+    grids = {window_id: (param_combinations, cost_kind, n_bars)
+             for window_id, _, param_combinations, _, cost_kind, n_bars in window_grids}
+    chunks = {window_id: [] for window_id in grids}
+    pending = {window_id: len(param_chunks) for window_id, _, _, param_chunks, _, _ in window_grids}
+
+    def window_results(window_id):
+        chunk_list = chunks.pop(window_id)
+        return None if window_id in sinks else assemble_results(len(grids[window_id][0]), chunk_list)
+
+    for window_id in [window_id for window_id in pending if pending[window_id] == 0]:
+        del pending[window_id]
+        yield window_id, window_results(window_id)
+
+    def tasks():
+        # Built as the pool takes them: only the chunks waiting in its queue are held in memory
+        for window_id, func, param_combinations, param_chunks, _, _ in window_grids:
+            for chunk in param_chunks:
+                indices = chunk_indices(chunk)
+                yield window_id, func, indices, [param_combinations[j] for j in indices]
+
+    finished = False
+    try:
+        for window_id, indices, seconds, chunk_results in pool.imap_unordered(run_window_chunk, tasks()):
+            if window_id in sinks:
+                sinks[window_id](indices, chunk_results)
+            else:
+                chunks[window_id].append((indices, chunk_results))
+            _, cost_kind, n_bars = grids[window_id]
+            record_cost(cost_kind, len(indices), n_bars, seconds)
+            if on_chunk is not None:
+                param_combinations = grids[window_id][0]
+                on_chunk(window_id, [param_combinations[j] for j in indices], chunk_results)
+            if progress is not None:
+                progress(len(indices))
+            pending[window_id] -= 1
+            if pending[window_id] == 0:
+                del pending[window_id]
+                yield window_id, window_results(window_id)
+        finished = True
+    finally:
+        if not finished:
+            terminate_pool(pool)
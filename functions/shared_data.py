@@ -0,0 +1,97 @@
+import atexit
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, namedtuple
+from itertools import count
+import numpy as np
+import pandas as pd
+
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+# Workers keep the windows they attached to, the oldest are dropped past this many
+MAX_ATTACHED_WINDOWS = 16
+
+# What gets pickled to the workers: a few paths instead of the whole window DataFrame
+SharedWindow = namedtuple('SharedWindow', ['window_id', 'ohlc_path', 'index_path', 'patterns_path', 'indicator_paths', 'indicator_params'])
+
+_publish_dir = None
+_publish_count = count()
+_attached = OrderedDict()
+
+
+def get_publish_dir():
+    # One temporary folder per process, removed at exit
+    global _publish_dir
+    if _publish_dir is None:
+        _publish_dir = tempfile.mkdtemp(prefix='wfo_shared_')
+        atexit.register(shutil.rmtree, _publish_dir, True)
+    return _publish_dir
+
+def publish_window(window_id, df, patterns=None, indicators=None):
+    """
+    Write the OHLC columns (plus index, candle patterns and precomputed indicators) of a window once
+    into memory-mapped .npy files and return a SharedWindow descriptor. Workers attach zero-copy views
+    with attach_window instead of receiving a pickled copy of the DataFrame with every task.
+    """
+    # The sequence number keeps a later run's window apart from the one a worker may still have cached
+    prefix = os.path.join(get_publish_dir(), f'window_{window_id}_{next(_publish_count)}')
+    # Stored as (4, n_bars) so every column is a contiguous row of the mapping
+    ohlc_path = prefix + '_ohlc.npy'
+    np.save(ohlc_path, np.ascontiguousarray(df[OHLC_COLUMNS].to_numpy(dtype=np.float64).T))
+    index_path = prefix + '_index.npy'
+    np.save(index_path, df.index.values)
+    patterns_path = None
+    if patterns is not None:
+        patterns_path = prefix + '_patterns.npy'
+        np.save(patterns_path, patterns)
+    # Indicator arrays get a file each, the parameter values they were computed for travel with the descriptor
+    indicator_paths = None
+    indicator_params = {}
+    if indicators is not None:
+        indicator_paths = {}
+        for name, values in indicators.items():
+            if isinstance(values, np.ndarray):
+                indicator_paths[name] = f'{prefix}_{name}.npy'
+                np.save(indicator_paths[name], np.ascontiguousarray(values))
+            else:
+                indicator_params[name] = values
+    return SharedWindow(window_id, ohlc_path, index_path, patterns_path, indicator_paths, indicator_params)
+
+def attach_window(shared):
+    # Returns (df, patterns, indicators) backed by the memory-mapped files, cached per worker so each window is attached once.
+    # Windows the parent released since (files deleted) are dropped first, their mappings would keep the disk space
+    for path in [path for path in _attached if not os.path.exists(path)]:
+        del _attached[path]
+    if shared.ohlc_path in _attached:
+        _attached.move_to_end(shared.ohlc_path)
+        return _attached[shared.ohlc_path]
+
+    ohlc = np.asarray(np.load(shared.ohlc_path, mmap_mode='c'))
+    index = pd.Index(np.load(shared.index_path, mmap_mode='r'))
+    df = pd.DataFrame(ohlc.T, columns=OHLC_COLUMNS, index=index, copy=False)
+    patterns = None
+    if shared.patterns_path is not None:
+        patterns = np.asarray(np.load(shared.patterns_path, mmap_mode='c'))
+    indicators = None
+    if shared.indicator_paths is not None:
+        indicators = dict(shared.indicator_params)
+        for name, path in shared.indicator_paths.items():
+            indicators[name] = np.asarray(np.load(path, mmap_mode='c'))
+
+    _attached[shared.ohlc_path] = (df, patterns, indicators)
+    while len(_attached) > MAX_ATTACHED_WINDOWS:
+        _attached.popitem(last=False)
+    return df, patterns, indicators
+
+def release_window(shared):
+    # Called by the parent once a window is done. Workers that still map the files keep valid views until their next
+    # attach_window, which drops them
+    _attached.pop(shared.ohlc_path, None)
+    for path in (shared.ohlc_path, shared.index_path, shared.patterns_path, *(shared.indicator_paths or {}).values()):
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                # Windows refuses to delete a mapped file, the folder is removed at exit instead
+                pass
@@ -0,0 +1,34 @@
+import pandas as pd
+
+
+class StrategyResult:
+    """
+    Arrays produced by a strategy's process_arrays, keyed by the column names process_dataframe writes.
+    Columns are read like a DataFrame (result['direction']) but stay plain numpy arrays, so running a
+    combination never copies the OHLC data or grows a DataFrame. to_dataframe() builds one on request.
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def keys(self):
+        return self.columns.keys()
+
+    def to_dataframe(self, df=None, index=None, columns=None):
+        # Writes the columns into df like process_dataframe does, or builds a new DataFrame on index
+        names = list(self.columns) if columns is None else columns
+        if df is None:
+            return pd.DataFrame({name: self.columns[name] for name in names}, index=index)
+        for name in names:
+            df[name] = self.columns[name]
+        return df
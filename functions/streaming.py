@@ -0,0 +1,83 @@
+import math
+from collections import deque
+
+# Incremental counterparts of the batch indicators, used by the bar-by-bar strategy engines.
+# Each update is O(1) and reproduces the batch arithmetic exactly, so a live engine emits the same values
+# as process_dataframe over the same history.
+
+
+class RollingWindow:
+    # calculate_rolling_sum / calculate_rolling_mean one value at a time. Keeps the last window + 1 prefix sums,
+    # so the result is the same prefix difference the batch version computes
+    def __init__(self, window):
+        self.window = window
+        self.prefix = deque([0.0], maxlen=window + 1)
+        self.nan_count = deque([0], maxlen=window + 1)
+
+    def update(self, value, mean=False):
+        if math.isnan(value):
+            self.prefix.append(self.prefix[-1])
+            self.nan_count.append(self.nan_count[-1] + 1)
+        else:
+            self.prefix.append(self.prefix[-1] + value)
+            self.nan_count.append(self.nan_count[-1])
+
+        # Expanding window until `window` values were seen, any NaN inside the window yields NaN
+        if self.nan_count[-1] - self.nan_count[0] > 0:
+            return math.nan
+        total = self.prefix[-1] - self.prefix[0]
+        if mean:
+            return total / (len(self.prefix) - 1)
+        return total
+
+
+class StreamingEWM:
+    # calculate_ewm one value at a time (pandas ewm(span=span, adjust=False).mean())
+    def __init__(self, span):
+        com = (span - 1) / 2
+        self.alpha = 1. / (1. + com)
+        self.old_wt = 1.
+        self.value = math.nan
+
+    def update(self, value):
+        if not math.isnan(self.value):
+            self.old_wt *= 1. - self.alpha
+            if not math.isnan(value):
+                if self.value != value:
+                    self.value = ((self.old_wt * self.value) + (self.alpha * value)) / (self.old_wt + self.alpha)
+                self.old_wt = 1.
+        elif not math.isnan(value):
+            self.value = value
+        return self.value
+
+
+class StreamingATR:
+    # calculate_atr one bar at a time. The batch version seeds bars 1-14 with the mean of the first 14 true ranges,
+    # so the value stays NaN until the 15th bar has closed and is then valid for the 14 bars before it as well
+    def __init__(self, period=14):
+        self.period = period
+        self.true_ranges = []
+        self.prev_close = math.nan
+        self.value = math.nan
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count > self.period
+
+    def update(self, high, low, close):
+        if self.count > 0:
+            tr = max(high - low, max(abs(high - self.prev_close), abs(low - self.prev_close)))
+            if self.count <= self.period:
+                self.true_ranges.append(tr)
+                if self.count == self.period:
+                    total = 0.0
+                    for value in self.true_ranges:
+                        total += value
+                    self.value = total / self.period
+            else:
+                self.value = (self.value * (self.period - 1) + tr) / self.period
+
+        self.prev_close = close
+        self.count += 1
+        return self.value
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from numba import njit
+
+from functions.ohlcv_cache import load_ohlcv
+
+
+@njit(cache=True)
+def valid_rows(prices):
+    # Bars where a symbol has a price. Aligned on the union of timestamps, a symbol is NaN before it lists, after it
+    # delists and on every candle missing from its own data, the kernels only see its own candles
+    return np.flatnonzero(~np.isnan(prices))
+
+def align_universe(frames):
+    """
+    Align per-symbol OHLC DataFrames (dict of symbol -> DataFrame with Open/High/Low/Close columns)
+    on the union of their timestamps. Returns (index, symbols, open, high, low, close), the price
+    arrays being 2D (bars x symbols) float64 with NaN where a symbol has no candle.
+    """
+    symbols = list(frames)
+    index = frames[symbols[0]].index
+    for symbol in symbols[1:]:
+        index = index.union(frames[symbol].index)
+
+    prices = []
+    for column in ['Open', 'High', 'Low', 'Close']:
+        aligned = pd.concat({symbol: frames[symbol][column] for symbol in symbols}, axis=1).reindex(index)
+        prices.append(np.ascontiguousarray(aligned.to_numpy(dtype=np.float64)))
+
+    return index, symbols, prices[0], prices[1], prices[2], prices[3]
+
+def load_universe(paths):
+    # paths maps each symbol to its OHLCV csv, in the same format as the files in data/binance_data
+    frames = {symbol: load_ohlcv(path) for symbol, path in paths.items()}
+    return align_universe(frames)
@@ -0,0 +1,52 @@
+import atexit
+import multiprocessing
+import numba
+
+_pool = None
+_processes = None
+
+
+def init_worker():
+    # The pool already runs a process per core: the parallel (prange) kernels each worker calls would otherwise start
+    # their own numba thread per core on top, cpu_count() ** 2 threads competing for the cores
+    numba.set_num_threads(1)
+
+def get_pool(processes=None):
+    """
+    Long-lived multiprocessing.Pool shared by every WFO window, and by every run made from the same
+    process. It is created on first use, so when the kernels were warmed up before (functions.jit_cache)
+    forked workers start with them compiled and keep them, and any data they cache, between windows.
+    Asking for a different number of processes replaces the pool. Closed by close_pool() or at exit,
+    terminate_pool() drops it with its queued tasks when a run stops early. Workers run the parallel
+    kernels on a single numba thread, see init_worker.
+    """
+    global _pool, _processes
+    if _pool is not None and processes is not None and processes != _processes:
+        close_pool()
+    if _pool is None:
+        _pool = multiprocessing.Pool(processes, initializer=init_worker)
+        _processes = processes
+    return _pool
+
+def terminate_pool(pool=None):
+    # Stops the workers at once, dropping the tasks still queued (e.g. after a run was interrupted, they would otherwise
+    # run ahead of the next run's tasks). Without pool, or with the shared one, the next get_pool() starts a fresh pool
+    global _pool, _processes
+    pool = pool or _pool
+    if pool is None:
+        return
+    pool.terminate()
+    pool.join()
+    if pool is _pool:
+        _pool = None
+        _processes = None
+
+def close_pool():
+    global _pool, _processes
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+        _processes = None
+
+atexit.register(close_pool)
@@ -1,84 +1,49 @@
+import math
 import pandas as pd
 import numpy as np
 from numba import njit, prange
 
-@njit
+from functions.patterns import calculate_candle_patterns, candle_pattern_flags, BULLISH_PATTERNS, BEARISH_PATTERNS
+from functions.indicators import calculate_rolling_sum, calculate_rolling_mean, calculate_rolling_sum_bank, calculate_rolling_mean_bank
+from functions.streaming import RollingWindow, StreamingATR
+from functions.strategy_result import StrategyResult
+from functions.universe import valid_rows
+
+@njit(cache=True)
 def calculate_log_return(close):
     return np.log(close[1:] / close[:-1])
 
-@njit
-def calculate_rolling_sum(arr, window):
-    result = np.empty_like(arr)
-    for i in range(len(arr)):
-        if i < window:
-            result[i] = np.sum(arr[:i+1])
-        else:
-            result[i] = np.sum(arr[i-window+1:i+1])
-    return result
-
-@njit
+@njit(cache=True)
 def calculate_percentage_candle_size(high, low):
     return np.abs((high - low) / low) * 100
 
-@njit
-def calculate_rolling_mean(arr, window):
-    result = np.empty_like(arr)
-    for i in range(len(arr)):
-        if i < window:
-            result[i] = np.mean(arr[:i+1])
-        else:
-            result[i] = np.mean(arr[i-window+1:i+1])
-    return result
-
-@njit(parallel=True)
-def calculate_signals(log_return, window, open_prices, high_prices, low_prices, close_prices, desired_return, avg_candle_size, curr_candle_size):
-    n = len(log_return)
-    period_return = calculate_rolling_sum(log_return, window)
-
-    prev_open = open_prices[:-1]
-    prev_close = close_prices[:-1]
-    curr_open = open_prices[1:]
-    curr_close = close_prices[1:]
-    curr_high = high_prices[1:]
-    curr_low = low_prices[1:]
-
-    engulfing_bull = np.zeros(n, dtype=np.int32)
-    engulfing_bear = np.zeros(n, dtype=np.int32)
-    hammer_bull = np.zeros(n, dtype=np.int32)
-    hammer_bear = np.zeros(n, dtype=np.int32)
-
-    for i in prange(n):
-        # Engulfing Bullish pattern
-        if prev_open[i] < curr_close[i] and curr_open[i] < curr_close[i] and prev_open[i] > prev_close[i]:
-            engulfing_bull[i] = 1
-
-        # Engulfing Bearish pattern
-        if prev_open[i] > curr_close[i] and curr_open[i] > curr_close[i] and prev_open[i] < prev_close[i]:
-            engulfing_bear[i] = 1
-
-        # Hammer Bullish pattern
-        if (curr_open[i] < curr_close[i] and
-            prev_open[i] < prev_close[i] and
-            (curr_open[i] - curr_low[i]) > (0.9 * (prev_close[i] - low_prices[i]))):
-            hammer_bull[i] = 1
-
-        # Hammer Bearish pattern
-        if (curr_open[i] > curr_close[i] and
-            prev_open[i] > prev_close[i] and
-            (curr_high[i] - curr_open[i]) > (0.9 * (high_prices[i] - prev_close[i]))):
-            hammer_bear[i] = 1
-
-    bearish_signal = ((engulfing_bear | hammer_bear) &
-                      (curr_candle_size > avg_candle_size * 1.5) &
+@njit(cache=True)
+def calculate_indicator_bank(log_return, percentage_candle_size, windows):
+    # period_return and avg_candle_size for every requested window at once, row w belongs to windows[w].
+    # Both are indexed by bar, period_return[w, i] being the return of the window ending on bar i (NaN on bar 0)
+    period_return = np.full((len(windows), len(log_return)), np.nan)
+    period_return[:, 1:] = calculate_rolling_sum_bank(log_return[1:], windows)
+    avg_candle_size = calculate_rolling_mean_bank(percentage_candle_size, windows)
+    return period_return, avg_candle_size
+
+@njit(cache=True)
+def calculate_signals(period_return, patterns, desired_return, avg_candle_size, curr_candle_size):
+    # patterns holds the packed candle pattern flags of each candle against the previous one
+    bullish_pattern = (patterns & BULLISH_PATTERNS) != 0
+    bearish_pattern = (patterns & BEARISH_PATTERNS) != 0
+    large_candle = curr_candle_size > avg_candle_size * 1.5
+
+    bearish_signal = (bearish_pattern &
+                      large_candle &
                       (period_return >= desired_return))
     
-    bullish_signal = ((engulfing_bull | hammer_bull) &
-                      (curr_candle_size > avg_candle_size * 1.5) &
+    bullish_signal = (bullish_pattern &
+                      large_candle &
                       (period_return <= -desired_return))
     
     return bearish_signal, bullish_signal
 
-@njit
+@njit(cache=True)
 def calculate_atr(high, low, close):
     tr = np.maximum(high[1:] - low[1:], 
                     np.maximum(np.abs(high[1:] - close[:-1]),
@@ -90,7 +55,54 @@ def calculate_atr(high, low, close):
         atr[i] = (atr[i-1] * 13 + tr[i-1]) / 14
     return atr
 
-@njit
+@njit(cache=True)
+def update_trade_step(open_price, high, low, close, atr, bearish_signal, bullish_signal,
+                      direction, in_trade, atr_trail_sl, pending_exit, pending_exit_price, atr_multiplier):
+    # One bar of the trade state machine, shared by update_trade_status and the bar-by-bar engine
+    exit_price = np.nan
+    entry_price = np.nan
+
+    if pending_exit:
+        return 0, False, np.nan, pending_exit_price, entry_price, False, np.nan
+
+    if bullish_signal and direction != 1:
+        if in_trade:
+            exit_price = open_price
+        direction = 1
+        in_trade = True
+        entry_price = open_price
+        atr_trail_sl = open_price - atr_multiplier * atr
+    elif bearish_signal and direction != -1:
+        if in_trade:
+            exit_price = open_price
+        direction = -1
+        in_trade = True
+        entry_price = open_price
+        atr_trail_sl = open_price + atr_multiplier * atr
+
+    if in_trade:
+        if direction == 1 and low <= atr_trail_sl:
+            pending_exit = True
+            pending_exit_price = max(low, atr_trail_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+        elif direction == -1 and high >= atr_trail_sl:
+            pending_exit = True
+            pending_exit_price = min(high, atr_trail_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+
+    if in_trade and not pending_exit:
+        if direction == 1:
+            new_sl = close - atr_multiplier * atr
+            atr_trail_sl = max(new_sl, atr_trail_sl)
+        else:
+            new_sl = close + atr_multiplier * atr
+            atr_trail_sl = min(new_sl, atr_trail_sl)
+
+    return direction, in_trade, atr_trail_sl, exit_price, entry_price, pending_exit, pending_exit_price
+
+@njit(cache=True)
 def update_trade_status(open_price, high, low, close, atr, bearish_signal, bullish_signal, 
                         prev_direction, prev_in_trade, prev_atr_trail_sl, atr_multiplier):
     n = len(open_price)
@@ -108,58 +120,17 @@ def update_trade_status(open_price, high, low, close, atr, bearish_signal, bulli
     pending_exit_price = np.nan
 
     for i in range(1, n):
-        direction[i] = direction[i-1]
-        in_trade[i] = in_trade[i-1]
-        atr_trail_sl[i] = atr_trail_sl[i-1]
-
-        if pending_exit:
-            exit_price[i] = pending_exit_price
-            direction[i] = 0
-            in_trade[i] = False
-            atr_trail_sl[i] = np.nan
-            pending_exit = False
-            pending_exit_price = np.nan
-            continue
-
-        if bullish_signal[i-1] and direction[i] != 1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = 1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            atr_trail_sl[i] = open_price[i] - atr_multiplier * atr[i]
-        elif bearish_signal[i-1] and direction[i] != -1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = -1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            atr_trail_sl[i] = open_price[i] + atr_multiplier * atr[i]
-
-        if in_trade[i]:
-            if direction[i] == 1 and low[i] <= atr_trail_sl[i]:
-                pending_exit = True
-                pending_exit_price = max(low[i], atr_trail_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
-            elif direction[i] == -1 and high[i] >= atr_trail_sl[i]:
-                pending_exit = True
-                pending_exit_price = min(high[i], atr_trail_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
-
-        if in_trade[i] and not pending_exit:
-            if direction[i] == 1:
-                new_sl = close[i] - atr_multiplier * atr[i]
-                atr_trail_sl[i] = max(new_sl, atr_trail_sl[i])
-            else:
-                new_sl = close[i] + atr_multiplier * atr[i]
-                atr_trail_sl[i] = min(new_sl, atr_trail_sl[i])
+        (direction[i], in_trade[i], atr_trail_sl[i], exit_price[i], entry_price[i],
+         pending_exit, pending_exit_price) = update_trade_step(
+            open_price[i], high[i], low[i], close[i], atr[i], bearish_signal[i-1], bullish_signal[i-1],
+            direction[i-1], in_trade[i-1], atr_trail_sl[i-1], pending_exit, pending_exit_price, atr_multiplier
+        )
 
     return direction, in_trade, atr_trail_sl, exit_price, entry_price
 
-@njit
-def process_dataframe_numba(open_values, high_values, low_values, close_values, window, desired_return, atr_multiplier):
+@njit(cache=True)
+def calculate_base_indicators(open_values, high_values, low_values, close_values):
+    # Parameter-independent intermediates, shared by every (window, desired_return, atr_multiplier) combination
     n = len(close_values)
     log_return = np.empty(n)
     log_return[0] = np.nan
@@ -168,11 +139,15 @@ def process_dataframe_numba(open_values, high_values, low_values, close_values,
     atr = calculate_atr(high_values, low_values, close_values)
     
     percentage_candle_size = calculate_percentage_candle_size(high_values, low_values)
-    avg_candle_size = calculate_rolling_mean(percentage_candle_size, window)
+    
+    return log_return, atr, percentage_candle_size
+
+@njit(cache=True)
+def process_combination_numba(open_values, high_values, low_values, close_values, atr, percentage_candle_size, patterns, period_return, avg_candle_size, desired_return, atr_multiplier):
+    n = len(close_values)
     
     bearish_signal, bullish_signal = calculate_signals(
-        log_return[1:], window, 
-        open_values[:-1], high_values[:-1], low_values[:-1], close_values[:-1],
+        period_return, patterns[1:],
         desired_return, avg_candle_size[:-1], percentage_candle_size[:-1]
     )
     
@@ -207,31 +182,314 @@ def process_dataframe_numba(open_values, high_values, low_values, close_values,
     final_bullish_signal[0] = False
     final_bullish_signal[1:] = bullish_signal
     
-    return log_return, atr, percentage_candle_size, avg_candle_size, final_direction, final_in_trade, final_atr_trail_sl, exit_price, final_entry_price, final_bearish_signal, final_bullish_signal
+    return final_direction, final_in_trade, final_atr_trail_sl, exit_price, final_entry_price, final_bearish_signal, final_bullish_signal
 
-def process_dataframe(df, window=30, desired_return=0.01, atr_multiplier=5):
-    # Extract numpy arrays from DataFrame
-    open_values = df['Open'].values
-    high_values = df['High'].values
-    low_values = df['Low'].values
-    close_values = df['Close'].values
+@njit(cache=True)
+def process_dataframe_numba(open_values, high_values, low_values, close_values, patterns, window, desired_return, atr_multiplier):
+    log_return, atr, percentage_candle_size = calculate_base_indicators(open_values, high_values, low_values, close_values)
+    period_return = calculate_rolling_sum(log_return[1:], window)
+    avg_candle_size = calculate_rolling_mean(percentage_candle_size, window)
     
-    # Process data using Numba-optimized function
-    log_return, atr, percentage_candle_size, avg_candle_size, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_dataframe_numba(
-        open_values, high_values, low_values, close_values, window, desired_return, atr_multiplier
+    direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_combination_numba(
+        open_values, high_values, low_values, close_values, atr, percentage_candle_size, patterns,
+        period_return, avg_candle_size, desired_return, atr_multiplier
     )
     
+    return log_return, atr, percentage_candle_size, avg_candle_size, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal
+
+@njit(cache=True)
+def process_param_grid_numba(open_values, high_values, low_values, close_values, patterns, windows, desired_returns, atr_multipliers):
+    # Computed once and shared by every combination of the grid
+    log_return, atr, percentage_candle_size = calculate_base_indicators(open_values, high_values, low_values, close_values)
+    
+    # Rolling indicators only depend on the window, so each distinct window is computed once
+    unique_windows = np.unique(windows)
+    period_return, avg_candle_size = calculate_indicator_bank(log_return, percentage_candle_size, unique_windows)
+    
+    return process_param_grid_indicators_numba(open_values, high_values, low_values, close_values, patterns, atr, percentage_candle_size,
+                                               unique_windows, period_return, avg_candle_size, windows, desired_returns, atr_multipliers)
+
+@njit(parallel=True, cache=True)
+def process_param_grid_indicators_numba(open_values, high_values, low_values, close_values, patterns, atr, percentage_candle_size,
+                                        bank_windows, period_return, avg_candle_size, windows, desired_returns, atr_multipliers):
+    # The grid from already computed indicators, row w of the banks belonging to bank_windows[w]
+    n = len(close_values)
+    n_combos = len(windows)
+    window_index = np.searchsorted(bank_windows, windows)
+    
+    direction = np.empty((n_combos, n), dtype=np.int32)
+    entry_price = np.empty((n_combos, n))
+    exit_price = np.empty((n_combos, n))
+    bearish_signal = np.empty((n_combos, n), dtype=np.bool_)
+    bullish_signal = np.empty((n_combos, n), dtype=np.bool_)
+    
+    for c in prange(n_combos):
+        w = window_index[c]
+        combo_direction, _, _, combo_exit_price, combo_entry_price, combo_bearish_signal, combo_bullish_signal = process_combination_numba(
+            open_values, high_values, low_values, close_values, atr, percentage_candle_size, patterns,
+            period_return[w, 1:], avg_candle_size[w], desired_returns[c], atr_multipliers[c]
+        )
+        direction[c] = combo_direction
+        entry_price[c] = combo_entry_price
+        exit_price[c] = combo_exit_price
+        bearish_signal[c] = combo_bearish_signal
+        bullish_signal[c] = combo_bullish_signal
+    
+    return direction, entry_price, exit_price, bearish_signal, bullish_signal
+
+def process_arrays(open_values, high_values, low_values, close_values, window=30, desired_return=0.01, atr_multiplier=5, patterns=None, indicators=None):
+    # Array-in/array-out version of process_dataframe, nothing is copied or written into a DataFrame.
+    # indicators from calculate_grid_indicators (sliced to these bars) replace the ones computed on the arrays
+    if patterns is None:
+        patterns = calculate_candle_patterns(open_values, high_values, low_values, close_values)
+    
+    if indicators is None:
+        log_return, atr, percentage_candle_size, avg_candle_size, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_dataframe_numba(
+            open_values, high_values, low_values, close_values, patterns, window, desired_return, atr_multiplier
+        )
+    else:
+        w = indicators['windows'].index(window)
+        log_return, atr, percentage_candle_size = indicators['log_return'], indicators['atr'], indicators['percentage_candle_size']
+        avg_candle_size = indicators['avg_candle_size'][w]
+        direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_combination_numba(
+            open_values, high_values, low_values, close_values, atr, percentage_candle_size, patterns,
+            indicators['period_return'][w, 1:], avg_candle_size, desired_return, atr_multiplier
+        )
+    
+    return StrategyResult({
+        'Log_Return': log_return,
+        'ATR': atr,
+        'percentage_candle_size': percentage_candle_size,
+        'avg_candle_size': avg_candle_size,
+        'direction': direction,
+        'in_trade': in_trade,
+        'ATR_trail_sl': atr_trail_sl,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    })
+
+def process_dataframe(df, window=30, desired_return=0.01, atr_multiplier=5, patterns=None):
+    result = process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values,
+                            window, desired_return, atr_multiplier, patterns)
+    
     # Assign results back to DataFrame
-    df['Log_Return'] = log_return
-    df['ATR'] = atr
-    df['percentage_candle_size'] = percentage_candle_size
-    df['avg_candle_size'] = avg_candle_size
-    df['direction'] = direction
-    df['in_trade'] = in_trade
-    df['ATR_trail_sl'] = atr_trail_sl
-    df['entry_price'] = entry_price
-    df['exit_price'] = exit_price
-    df['bearish_signal'] = bearish_signal
-    df['bullish_signal'] = bullish_signal
-    
-    return df
\ No newline at end of file
+    return result.to_dataframe(df)
+
+def calculate_grid_indicators(open_values, high_values, low_values, close_values, param_combinations):
+    """
+    Indicators shared by the combinations of a grid, for every window in param_combinations: log
+    returns, ATR, candle sizes and the rolling banks, all indexed by bar. Computed once over a whole
+    history, functions.indicators.slice_indicators gives the indicators of any window of it with the
+    warm-up taken from the bars before, to pass to process_param_grid or process_arrays.
+    """
+    params = np.asarray(param_combinations, dtype=np.float64).reshape(-1, 3)
+    windows = np.unique(params[:, 0].astype(np.int64))
+    log_return, atr, percentage_candle_size = calculate_base_indicators(open_values, high_values, low_values, close_values)
+    period_return, avg_candle_size = calculate_indicator_bank(log_return, percentage_candle_size, windows)
+    return {
+        'windows': tuple(int(w) for w in windows),
+        'log_return': log_return,
+        'atr': atr,
+        'percentage_candle_size': percentage_candle_size,
+        'period_return': period_return,
+        'avg_candle_size': avg_candle_size
+    }
+
+def process_param_grid(df, param_combinations, patterns=None, indicators=None):
+    """
+    Run the strategy for many (window, desired_return, atr_multiplier) combinations in a single
+    compiled call. Log returns, ATR and candle sizes are computed once and shared by all combinations,
+    the rolling period return and average candle size once per distinct window. Candle patterns from
+    functions.patterns.calculate_candle_patterns can be passed in when already computed for df, and
+    indicators from calculate_grid_indicators (sliced to df) to skip computing them.
+
+    Returns a dict of 2D arrays shaped (n_combinations, n_bars), row i matching param_combinations[i]
+    and the columns process_dataframe would produce for it.
+    """
+    params = np.asarray(param_combinations, dtype=np.float64).reshape(-1, 3)
+    
+    if patterns is None:
+        patterns = calculate_candle_patterns(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values)
+    
+    if indicators is None:
+        direction, entry_price, exit_price, bearish_signal, bullish_signal = process_param_grid_numba(
+            df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, patterns,
+            params[:, 0].astype(np.int64), params[:, 1], params[:, 2]
+        )
+    else:
+        direction, entry_price, exit_price, bearish_signal, bullish_signal = process_param_grid_indicators_numba(
+            df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, patterns,
+            indicators['atr'], indicators['percentage_candle_size'], np.asarray(indicators['windows'], dtype=np.int64),
+            indicators['period_return'], indicators['avg_candle_size'], params[:, 0].astype(np.int64), params[:, 1], params[:, 2]
+        )
+    
+    return {
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    }
+
+@njit(parallel=True, cache=True)
+def process_universe_numba(open_values, high_values, low_values, close_values, window, desired_return, atr_multiplier):
+    # open/high/low/close are aligned (bars x symbols) arrays, each symbol runs on its own candles (valid_rows) in parallel
+    n, n_symbols = close_values.shape
+    direction = np.zeros((n, n_symbols), dtype=np.int32)
+    entry_price = np.full((n, n_symbols), np.nan)
+    exit_price = np.full((n, n_symbols), np.nan)
+    bearish_signal = np.zeros((n, n_symbols), dtype=np.bool_)
+    bullish_signal = np.zeros((n, n_symbols), dtype=np.bool_)
+    
+    for s in prange(n_symbols):
+        rows = valid_rows(close_values[:, s])
+        if len(rows) < 2:
+            continue
+        
+        # Contiguous copies of the symbol's candles keep the 1D kernels cache friendly, and the recursive ATR and EWM
+        # never see the NaN of a missing candle
+        symbol_open = open_values[rows, s]
+        symbol_high = high_values[rows, s]
+        symbol_low = low_values[rows, s]
+        symbol_close = close_values[rows, s]
+        patterns = calculate_candle_patterns(symbol_open, symbol_high, symbol_low, symbol_close)
+        _, _, _, _, symbol_direction, _, _, symbol_exit_price, symbol_entry_price, symbol_bearish_signal, symbol_bullish_signal = process_dataframe_numba(
+            symbol_open, symbol_high, symbol_low, symbol_close, patterns, window, desired_return, atr_multiplier
+        )
+        direction[rows, s] = symbol_direction
+        entry_price[rows, s] = symbol_entry_price
+        exit_price[rows, s] = symbol_exit_price
+        bearish_signal[rows, s] = symbol_bearish_signal
+        bullish_signal[rows, s] = symbol_bullish_signal
+    
+    return direction, entry_price, exit_price, bearish_signal, bullish_signal
+
+def process_universe(open_values, high_values, low_values, close_values, window=30, desired_return=0.01, atr_multiplier=5):
+    """
+    Run the strategy over a universe of symbols at once. Inputs are aligned 2D (bars x symbols) price
+    arrays or DataFrames, e.g. from functions.universe.align_universe. Bars where a symbol has no price
+    (before it lists, after it delists, missing candles) are NaN and skipped, the strategy runs on the
+    symbol's own candles and its outputs on the skipped bars are left empty.
+
+    Returns a dict of 2D (bars x symbols) arrays with the columns process_dataframe would produce
+    for each symbol on its own.
+    """
+    prices = [np.ascontiguousarray(np.asarray(values, dtype=np.float64)) for values in (open_values, high_values, low_values, close_values)]
+    
+    direction, entry_price, exit_price, bearish_signal, bullish_signal = process_universe_numba(
+        *prices, window, desired_return, atr_multiplier
+    )
+    
+    return {
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    }
+
+class CandlestickReversionEngine:
+    """
+    Bar-by-bar version of process_dataframe for live trading. Each closed candle is passed to update(),
+    which does O(1) work and returns the row process_dataframe would produce for that candle over the
+    same history, as a dict keyed by the DataFrame columns. Returns None until the ATR is seeded on the
+    15th candle, the candles before it are replayed at that point.
+    """
+
+    def __init__(self, window=30, desired_return=0.01, atr_multiplier=5):
+        self.window = window
+        self.desired_return = desired_return
+        self.atr_multiplier = float(atr_multiplier)
+
+        self.atr = StreamingATR()
+        self.period_return = RollingWindow(window)
+        self.avg_candle_size = RollingWindow(window)
+        self.prev_bar = None
+        self.prev_candle_size = np.nan
+        self.prev_avg_candle_size = np.nan
+        self.warmup_rows = []
+
+        # Trade state as update_trade_status leaves it, process_dataframe reports it one bar later
+        self.direction = 0
+        self.in_trade = False
+        self.atr_trail_sl = np.nan
+        self.entry_price = np.nan
+        self.pending_exit = False
+        self.pending_exit_price = np.nan
+
+    def update(self, open_price, high, low, close):
+        open_price, high, low, close = float(open_price), float(high), float(low), float(close)
+
+        percentage_candle_size = abs((high - low) / low) * 100
+        avg_candle_size = self.avg_candle_size.update(percentage_candle_size, mean=True)
+
+        log_return = np.nan
+        bearish_signal = False
+        bullish_signal = False
+        if self.prev_bar is not None:
+            prev_open, prev_high, prev_low, prev_close = self.prev_bar
+            log_return = math.log(close / prev_close)
+            period_return = self.period_return.update(log_return)
+
+            flags = candle_pattern_flags(prev_open, prev_high, prev_low, prev_close, open_price, high, low, close)
+            large_candle = self.prev_candle_size > self.prev_avg_candle_size * 1.5
+            bearish_signal = (flags & BEARISH_PATTERNS) != 0 and large_candle and period_return >= self.desired_return
+            bullish_signal = (flags & BULLISH_PATTERNS) != 0 and large_candle and period_return <= -self.desired_return
+
+        atr = self.atr.update(high, low, close)
+
+        self.prev_bar = (open_price, high, low, close)
+        self.prev_candle_size = percentage_candle_size
+        self.prev_avg_candle_size = avg_candle_size
+
+        row = {
+            'Open': open_price,
+            'High': high,
+            'Low': low,
+            'Close': close,
+            'Log_Return': log_return,
+            'ATR': atr,
+            'percentage_candle_size': percentage_candle_size,
+            'avg_candle_size': avg_candle_size,
+            'direction': 0,
+            'in_trade': False,
+            'ATR_trail_sl': np.nan,
+            'entry_price': np.nan,
+            'exit_price': np.nan,
+            'bearish_signal': bool(bearish_signal),
+            'bullish_signal': bool(bullish_signal)
+        }
+
+        if not self.atr.ready:
+            self.warmup_rows.append(row)
+            return None
+
+        # The ATR seed also applies to the buffered candles, the first one is never traded (the batch loop starts at 1)
+        for warmup_row in self.warmup_rows[1:]:
+            warmup_row['ATR'] = atr
+            self.update_trade(warmup_row)
+        self.warmup_rows = []
+
+        self.update_trade(row)
+        return row
+
+    def update_trade(self, row):
+        row['direction'] = self.direction
+        row['in_trade'] = self.in_trade
+        row['ATR_trail_sl'] = self.atr_trail_sl
+        row['entry_price'] = self.entry_price
+
+        (self.direction, self.in_trade, self.atr_trail_sl, row['exit_price'], self.entry_price,
+         self.pending_exit, self.pending_exit_price) = update_trade_step(
+            row['Open'], row['High'], row['Low'], row['Close'], row['ATR'], row['bearish_signal'], row['bullish_signal'],
+            self.direction, self.in_trade, self.atr_trail_sl, self.pending_exit, self.pending_exit_price, self.atr_multiplier
+        )
+
+    def load_history(self, df):
+        # Feed already closed candles, returns the row of the last one
+        row = None
+        for open_price, high, low, close in zip(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values):
+            row = self.update(open_price, high, low, close)
+        return row
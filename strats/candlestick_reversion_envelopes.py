@@ -1,60 +1,33 @@
+from collections import deque
 import pandas as pd
 import numpy as np
 from numba import njit, prange
 
-@njit
-def calculate_signals(open_prices, high_prices, low_prices, close_prices, upper_envelope, lower_envelope):
-    n = len(close_prices)
-    prev_open = open_prices[:-1]
-    prev_close = close_prices[:-1]
-    curr_open = open_prices[1:]
-    curr_close = close_prices[1:]
-    curr_high = high_prices[1:]
-    curr_low = low_prices[1:]
-
-    engulfing_bull = np.zeros(n, dtype=np.int32)
-    engulfing_bear = np.zeros(n, dtype=np.int32)
-    hammer_bull = np.zeros(n, dtype=np.int32)
-    hammer_bear = np.zeros(n, dtype=np.int32)
-
-    for i in prange(1, n):
-        # Engulfing Bullish candle + Low outside or equal to envelope curve
-        if (prev_open[i-1] < curr_close[i] and curr_open[i] < curr_close[i] and prev_open[i-1] > prev_close[i-1] and
-            curr_low[i] <= lower_envelope[i]):
-            engulfing_bull[i] = 1
-
-        # Engulfing Bearish candle + High outside or equal envelope curve
-        if (prev_open[i-1] > curr_close[i] and curr_open[i] > curr_close[i] and prev_open[i-1] < prev_close[i-1] and
-            curr_high[i] >= upper_envelope[i]):
-            engulfing_bear[i] = 1
-
-        # Custom type of bullish hammer + Low outside or equal to envelope curve
-        if (curr_open[i] < curr_close[i] and
-            prev_open[i-1] < prev_close[i-1] and
-            (curr_open[i] - curr_low[i]) > (0.9 * (prev_close[i-1] - low_prices[i])) and
-            curr_low[i] <= lower_envelope[i]):
-            hammer_bull[i] = 1
-
-        # Custom type of bearish hammer + High outside or equal envelope curve
-        if (curr_open[i] > curr_close[i] and
-            prev_open[i-1] > prev_close[i-1] and
-            (curr_high[i] - curr_open[i]) > (0.9 * (high_prices[i] - prev_close[i-1])) and
-            curr_high[i] >= upper_envelope[i]):
-            hammer_bear[i] = 1
-
-    # Signals
-    bearish_signal = engulfing_bear | hammer_bear
-    bullish_signal = engulfing_bull | hammer_bull
-    
-    # Shift signals to avoid look-ahead bias
-    bearish_signal = np.roll(bearish_signal, 1)
-    bullish_signal = np.roll(bullish_signal, 1)
-    bearish_signal[0] = 0
-    bullish_signal[0] = 0
+from functions.indicators import calculate_ewm, calculate_ewm_bank
+from functions.patterns import calculate_candle_patterns, envelope_pattern_flags, ENVELOPE_BULLISH_PATTERNS, ENVELOPE_BEARISH_PATTERNS
+from functions.streaming import StreamingATR, StreamingEWM
+from functions.strategy_result import StrategyResult
+from functions.universe import valid_rows
+
+@njit(cache=True)
+def calculate_signals(patterns, high_prices, low_prices, upper_envelope, lower_envelope):
+    n = len(patterns)
+    bearish_signal = np.zeros(n, dtype=np.int32)
+    bullish_signal = np.zeros(n, dtype=np.int32)
+
+    # Signals are written one bar later to avoid look-ahead bias
+    for i in range(1, n - 1):
+        # Engulfing Bullish candle or custom bullish hammer + Low outside or equal to envelope curve
+        if (patterns[i] & ENVELOPE_BULLISH_PATTERNS) != 0 and low_prices[i+1] <= lower_envelope[i]:
+            bullish_signal[i+1] = 1
+
+        # Engulfing Bearish candle or custom bearish hammer + High outside or equal envelope curve
+        if (patterns[i] & ENVELOPE_BEARISH_PATTERNS) != 0 and high_prices[i+1] >= upper_envelope[i]:
+            bearish_signal[i+1] = 1
     
     return bearish_signal, bullish_signal
 
-@njit
+@njit(cache=True)
 def calculate_atr(high, low, close):
     tr = np.maximum(high[1:] - low[1:], 
                     np.maximum(np.abs(high[1:] - close[:-1]),
@@ -66,8 +39,55 @@ def calculate_atr(high, low, close):
         atr[i] = (atr[i-1] * 13 + tr[i-1]) / 14
     return atr
 
+@njit(cache=True)
+def update_trade_step(open_price, high, low, close, atr, bearish_signal, bullish_signal,
+                      direction, in_trade, atr_trail_sl, pending_exit, pending_exit_price, atr_multiplier):
+    # One bar of the trade state machine, shared by update_trade_status and the bar-by-bar engine
+    exit_price = np.nan
+    entry_price = np.nan
+
+    if pending_exit:
+        return 0, False, np.nan, pending_exit_price, entry_price, False, np.nan
+
+    if bullish_signal and direction != 1:
+        if in_trade:
+            exit_price = open_price
+        direction = 1
+        in_trade = True
+        entry_price = open_price
+        atr_trail_sl = open_price - atr_multiplier * atr
+    elif bearish_signal and direction != -1:
+        if in_trade:
+            exit_price = open_price
+        direction = -1
+        in_trade = True
+        entry_price = open_price
+        atr_trail_sl = open_price + atr_multiplier * atr
+
+    if in_trade:
+        if direction == 1 and low <= atr_trail_sl:
+            pending_exit = True
+            pending_exit_price = max(low, atr_trail_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+        elif direction == -1 and high >= atr_trail_sl:
+            pending_exit = True
+            pending_exit_price = min(high, atr_trail_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+
+    if in_trade and not pending_exit:
+        if direction == 1:
+            new_sl = close - atr_multiplier * atr
+            atr_trail_sl = max(new_sl, atr_trail_sl)
+        else:
+            new_sl = close + atr_multiplier * atr
+            atr_trail_sl = min(new_sl, atr_trail_sl)
+
+    return direction, in_trade, atr_trail_sl, exit_price, entry_price, pending_exit, pending_exit_price
+
 # Calculations that allow me to dynamically adjust ATR and identify whether the price hit the ATR (tp or sl)
-@njit
+@njit(cache=True)
 def update_trade_status(open_price, high, low, close, atr, bearish_signal, bullish_signal, 
                         prev_direction, prev_in_trade, prev_atr_trail_sl, atr_multiplier):
     n = len(open_price)
@@ -85,64 +105,38 @@ def update_trade_status(open_price, high, low, close, atr, bearish_signal, bulli
     pending_exit_price = np.nan
 
     for i in range(1, n):
-        direction[i] = direction[i-1]
-        in_trade[i] = in_trade[i-1]
-        atr_trail_sl[i] = atr_trail_sl[i-1]
-
-        if pending_exit:
-            exit_price[i] = pending_exit_price
-            direction[i] = 0
-            in_trade[i] = False
-            atr_trail_sl[i] = np.nan
-            pending_exit = False
-            pending_exit_price = np.nan
-            continue
-
-        if bullish_signal[i-1] and direction[i] != 1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = 1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            atr_trail_sl[i] = open_price[i] - atr_multiplier * atr[i]
-        elif bearish_signal[i-1] and direction[i] != -1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = -1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            atr_trail_sl[i] = open_price[i] + atr_multiplier * atr[i]
-
-        if in_trade[i]:
-            if direction[i] == 1 and low[i] <= atr_trail_sl[i]:
-                pending_exit = True
-                pending_exit_price = max(low[i], atr_trail_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
-            elif direction[i] == -1 and high[i] >= atr_trail_sl[i]:
-                pending_exit = True
-                pending_exit_price = min(high[i], atr_trail_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
-
-        if in_trade[i] and not pending_exit:
-            if direction[i] == 1:
-                new_sl = close[i] - atr_multiplier * atr[i]
-                atr_trail_sl[i] = max(new_sl, atr_trail_sl[i])
-            else:
-                new_sl = close[i] + atr_multiplier * atr[i]
-                atr_trail_sl[i] = min(new_sl, atr_trail_sl[i])
+        (direction[i], in_trade[i], atr_trail_sl[i], exit_price[i], entry_price[i],
+         pending_exit, pending_exit_price) = update_trade_step(
+            open_price[i], high[i], low[i], close[i], atr[i], bearish_signal[i-1], bullish_signal[i-1],
+            direction[i-1], in_trade[i-1], atr_trail_sl[i-1], pending_exit, pending_exit_price, atr_multiplier
+        )
 
     return direction, in_trade, atr_trail_sl, exit_price, entry_price
 
-@njit
-def process_dataframe_numba(open_values, high_values, low_values, close_values, atr_multiplier, upper_envelope, lower_envelope):
-    n = len(close_values)
-    
+@njit(cache=True)
+def calculate_envelope_bank(ewm_values, envelopes_percs):
+    # Upper and lower envelopes of one EWM for every envelopes_perc, row p belongs to envelopes_percs[p]
+    upper_envelope = np.empty((len(envelopes_percs), len(ewm_values)))
+    lower_envelope = np.empty((len(envelopes_percs), len(ewm_values)))
+    for p in range(len(envelopes_percs)):
+        upper_envelope[p] = ewm_values * (1 + envelopes_percs[p])
+        lower_envelope[p] = ewm_values * (1 - envelopes_percs[p])
+    return upper_envelope, lower_envelope
+
+@njit(cache=True)
+def process_dataframe_numba(open_values, high_values, low_values, close_values, patterns, atr_multiplier, upper_envelope, lower_envelope):
     atr = calculate_atr(high_values, low_values, close_values)
     
+    direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_indicators_numba(
+        open_values, high_values, low_values, close_values, patterns, atr, atr_multiplier, upper_envelope, lower_envelope
+    )
+    
+    return atr, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal
+
+@njit(cache=True)
+def process_indicators_numba(open_values, high_values, low_values, close_values, patterns, atr, atr_multiplier, upper_envelope, lower_envelope):
     bearish_signal, bullish_signal = calculate_signals(
-        open_values, high_values, low_values, close_values, upper_envelope, lower_envelope
+        patterns, high_values, low_values, upper_envelope, lower_envelope
     )
     
     direction, in_trade, atr_trail_sl, exit_price, entry_price = update_trade_status(
@@ -151,36 +145,322 @@ def process_dataframe_numba(open_values, high_values, low_values, close_values,
         0, False, np.nan, atr_multiplier
     )
     
-    return atr, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal
+    return direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal
 
-def process_dataframe(df, atr_multiplier=5, ewm_period=50, envelopes_perc=0.01):
-    # Extract numpy arrays from DataFrame
-    open_values = df['Open'].values
-    high_values = df['High'].values
-    low_values = df['Low'].values
-    close_values = df['Close'].values
+def process_arrays(open_values, high_values, low_values, close_values, atr_multiplier=5, ewm_period=50, envelopes_perc=0.01, patterns=None, indicators=None):
+    # Array-in/array-out version of process_dataframe, nothing is copied or written into a DataFrame.
+    # indicators from calculate_grid_indicators (sliced to these bars) replace the ones computed on the arrays
+    if patterns is None:
+        patterns = calculate_candle_patterns(open_values, high_values, low_values, close_values)
     
     # Calculate EWM and envelopes
-    ewm_values = df['Close'].ewm(span=ewm_period, adjust=False).mean().values
+    if indicators is None:
+        ewm_values = calculate_ewm(close_values, ewm_period)
+    else:
+        ewm_values = indicators['ewm'][indicators['ewm_spans'].index(ewm_period)]
     upper_envelope = ewm_values * (1 + envelopes_perc)
     lower_envelope = ewm_values * (1 - envelopes_perc)
     
-    # Process data using Numba-optimized function
-    atr, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_dataframe_numba(
-        open_values, high_values, low_values, close_values, atr_multiplier, upper_envelope, lower_envelope
-    )
+    if indicators is None:
+        atr, direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_dataframe_numba(
+            open_values, high_values, low_values, close_values, patterns, atr_multiplier, upper_envelope, lower_envelope
+        )
+    else:
+        atr = indicators['atr']
+        direction, in_trade, atr_trail_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_indicators_numba(
+            open_values, high_values, low_values, close_values, patterns, atr, atr_multiplier, upper_envelope, lower_envelope
+        )
+    
+    return StrategyResult({
+        'ATR': atr,
+        'direction': direction,
+        'in_trade': in_trade,
+        'ATR_trail_sl': atr_trail_sl,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal,
+        'EWM': ewm_values,
+        'Upper_Envelope': upper_envelope,
+        'Lower_Envelope': lower_envelope
+    })
+
+def process_dataframe(df, atr_multiplier=5, ewm_period=50, envelopes_perc=0.01, patterns=None):
+    result = process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values,
+                            atr_multiplier, ewm_period, envelopes_perc, patterns)
     
     # Assign results back to DataFrame
-    df['ATR'] = atr
-    df['direction'] = direction
-    df['in_trade'] = in_trade
-    df['ATR_trail_sl'] = atr_trail_sl
-    df['entry_price'] = entry_price
-    df['exit_price'] = exit_price
-    df['bearish_signal'] = bearish_signal
-    df['bullish_signal'] = bullish_signal
-    df['EWM'] = ewm_values
-    df['Upper_Envelope'] = upper_envelope
-    df['Lower_Envelope'] = lower_envelope
-    
-    return df
\ No newline at end of file
+    return result.to_dataframe(df)
+
+@njit(cache=True)
+def process_param_grid_numba(open_values, high_values, low_values, close_values, patterns, atr_multipliers, ewm_periods, envelopes_percs):
+    # Computed once and shared by every combination of the grid, one EWM per distinct period
+    atr = calculate_atr(high_values, low_values, close_values)
+    unique_periods = np.unique(ewm_periods)
+    ewm_bank = calculate_ewm_bank(close_values, unique_periods)
+    
+    return process_param_grid_indicators_numba(open_values, high_values, low_values, close_values, patterns, atr,
+                                               unique_periods, ewm_bank, atr_multipliers, ewm_periods, envelopes_percs)
+
+@njit(parallel=True, cache=True)
+def process_param_grid_indicators_numba(open_values, high_values, low_values, close_values, patterns, atr,
+                                        ewm_spans, ewm_bank, atr_multipliers, ewm_periods, envelopes_percs):
+    # The grid from already computed indicators, row s of ewm_bank being the EWM for ewm_spans[s]
+    n = len(close_values)
+    n_combos = len(atr_multipliers)
+    
+    # One envelope pair per distinct (period, envelopes_perc)
+    unique_periods = np.unique(ewm_periods)
+    period_index = np.searchsorted(unique_periods, ewm_periods)
+    unique_percs = np.unique(envelopes_percs)
+    perc_index = np.searchsorted(unique_percs, envelopes_percs)
+    
+    upper_envelope = np.empty((len(unique_periods), len(unique_percs), n))
+    lower_envelope = np.empty((len(unique_periods), len(unique_percs), n))
+    for e in range(len(unique_periods)):
+        upper_envelope[e], lower_envelope[e] = calculate_envelope_bank(ewm_bank[np.searchsorted(ewm_spans, unique_periods[e])], unique_percs)
+    
+    direction = np.empty((n_combos, n), dtype=np.int32)
+    entry_price = np.empty((n_combos, n))
+    exit_price = np.empty((n_combos, n))
+    bearish_signal = np.empty((n_combos, n), dtype=np.int32)
+    bullish_signal = np.empty((n_combos, n), dtype=np.int32)
+    
+    for c in prange(n_combos):
+        e = period_index[c]
+        p = perc_index[c]
+        combo_bearish_signal, combo_bullish_signal = calculate_signals(
+            patterns, high_values, low_values, upper_envelope[e, p], lower_envelope[e, p]
+        )
+        combo_direction, _, _, combo_exit_price, combo_entry_price = update_trade_status(
+            open_values, high_values, low_values, close_values, atr,
+            combo_bearish_signal, combo_bullish_signal,
+            0, False, np.nan, atr_multipliers[c]
+        )
+        direction[c] = combo_direction
+        entry_price[c] = combo_entry_price
+        exit_price[c] = combo_exit_price
+        bearish_signal[c] = combo_bearish_signal
+        bullish_signal[c] = combo_bullish_signal
+    
+    return direction, entry_price, exit_price, bearish_signal, bullish_signal
+
+def calculate_grid_indicators(open_values, high_values, low_values, close_values, param_combinations):
+    """
+    Indicators shared by the combinations of a grid: the ATR and the EWM of every ewm_period in
+    param_combinations, indexed by bar. Computed once over a whole history,
+    functions.indicators.slice_indicators gives the indicators of any window of it with the warm-up
+    taken from the bars before, to pass to process_param_grid or process_arrays.
+    """
+    params = np.asarray(param_combinations, dtype=np.float64).reshape(-1, 3)
+    spans = np.unique(params[:, 1].astype(np.int64))
+    return {
+        'ewm_spans': tuple(int(span) for span in spans),
+        'atr': calculate_atr(high_values, low_values, close_values),
+        'ewm': calculate_ewm_bank(close_values, spans)
+    }
+
+def process_param_grid(df, param_combinations, patterns=None, indicators=None):
+    """
+    Run the strategy for many (atr_multiplier, ewm_period, envelopes_perc) combinations in a single
+    compiled call. The ATR is computed once, the EWM once per distinct ewm_period and the envelopes
+    once per distinct (ewm_period, envelopes_perc). Candle patterns from
+    functions.patterns.calculate_candle_patterns can be passed in when already computed for df, and
+    indicators from calculate_grid_indicators (sliced to df) to skip computing them.
+
+    Returns a dict of 2D arrays shaped (n_combinations, n_bars), row i matching param_combinations[i]
+    and the columns process_dataframe would produce for it.
+    """
+    params = np.asarray(param_combinations, dtype=np.float64).reshape(-1, 3)
+    
+    if patterns is None:
+        patterns = calculate_candle_patterns(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values)
+    
+    if indicators is None:
+        direction, entry_price, exit_price, bearish_signal, bullish_signal = process_param_grid_numba(
+            df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, patterns,
+            params[:, 0], params[:, 1].astype(np.int64), params[:, 2]
+        )
+    else:
+        direction, entry_price, exit_price, bearish_signal, bullish_signal = process_param_grid_indicators_numba(
+            df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, patterns, indicators['atr'],
+            np.asarray(indicators['ewm_spans'], dtype=np.int64), indicators['ewm'], params[:, 0], params[:, 1].astype(np.int64), params[:, 2]
+        )
+    
+    return {
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    }
+
+@njit(parallel=True, cache=True)
+def process_universe_numba(open_values, high_values, low_values, close_values, atr_multiplier, ewm_period, envelopes_perc):
+    # open/high/low/close are aligned (bars x symbols) arrays, each symbol runs on its own candles (valid_rows) in parallel
+    n, n_symbols = close_values.shape
+    direction = np.zeros((n, n_symbols), dtype=np.int32)
+    entry_price = np.full((n, n_symbols), np.nan)
+    exit_price = np.full((n, n_symbols), np.nan)
+    bearish_signal = np.zeros((n, n_symbols), dtype=np.int32)
+    bullish_signal = np.zeros((n, n_symbols), dtype=np.int32)
+    
+    for s in prange(n_symbols):
+        rows = valid_rows(close_values[:, s])
+        if len(rows) < 2:
+            continue
+        
+        # Contiguous copies of the symbol's candles keep the 1D kernels cache friendly, and the recursive ATR and EWM
+        # never see the NaN of a missing candle
+        symbol_open = open_values[rows, s]
+        symbol_high = high_values[rows, s]
+        symbol_low = low_values[rows, s]
+        symbol_close = close_values[rows, s]
+        patterns = calculate_candle_patterns(symbol_open, symbol_high, symbol_low, symbol_close)
+        ewm_values = calculate_ewm(symbol_close, ewm_period)
+        upper_envelope = ewm_values * (1 + envelopes_perc)
+        lower_envelope = ewm_values * (1 - envelopes_perc)
+        _, symbol_direction, _, _, symbol_exit_price, symbol_entry_price, symbol_bearish_signal, symbol_bullish_signal = process_dataframe_numba(
+            symbol_open, symbol_high, symbol_low, symbol_close, patterns, atr_multiplier, upper_envelope, lower_envelope
+        )
+        direction[rows, s] = symbol_direction
+        entry_price[rows, s] = symbol_entry_price
+        exit_price[rows, s] = symbol_exit_price
+        bearish_signal[rows, s] = symbol_bearish_signal
+        bullish_signal[rows, s] = symbol_bullish_signal
+    
+    return direction, entry_price, exit_price, bearish_signal, bullish_signal
+
+def process_universe(open_values, high_values, low_values, close_values, atr_multiplier=5, ewm_period=50, envelopes_perc=0.01):
+    """
+    Run the strategy over a universe of symbols at once. Inputs are aligned 2D (bars x symbols) price
+    arrays or DataFrames, e.g. from functions.universe.align_universe. Bars where a symbol has no price
+    (before it lists, after it delists, missing candles) are NaN and skipped, the strategy runs on the
+    symbol's own candles and its outputs on the skipped bars are left empty.
+
+    Returns a dict of 2D (bars x symbols) arrays with the columns process_dataframe would produce
+    for each symbol on its own.
+    """
+    prices = [np.ascontiguousarray(np.asarray(values, dtype=np.float64)) for values in (open_values, high_values, low_values, close_values)]
+    
+    direction, entry_price, exit_price, bearish_signal, bullish_signal = process_universe_numba(
+        *prices, atr_multiplier, ewm_period, envelopes_perc
+    )
+    
+    return {
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    }
+
+class CandlestickReversionEnvelopesEngine:
+    """
+    Bar-by-bar version of process_dataframe for live trading. Each closed candle is passed to update(),
+    which does O(1) work and returns the row process_dataframe would produce for that candle over the
+    same history, as a dict keyed by the DataFrame columns. Returns None until the ATR is seeded on the
+    15th candle, the candles before it are replayed at that point.
+    """
+
+    def __init__(self, atr_multiplier=5, ewm_period=50, envelopes_perc=0.01):
+        self.atr_multiplier = float(atr_multiplier)
+        self.ewm_period = ewm_period
+        self.envelopes_perc = envelopes_perc
+
+        self.atr = StreamingATR()
+        self.ewm = StreamingEWM(ewm_period)
+        self.bars = deque(maxlen=2)
+        self.prev_upper_envelope = np.nan
+        self.prev_lower_envelope = np.nan
+        self.warmup_rows = []
+
+        # Trade state, the entry of a bar reacts to the signal of the bar before it
+        self.direction = 0
+        self.in_trade = False
+        self.atr_trail_sl = np.nan
+        self.pending_exit = False
+        self.pending_exit_price = np.nan
+        self.bearish_signal = 0
+        self.bullish_signal = 0
+
+    def update(self, open_price, high, low, close):
+        open_price, high, low, close = float(open_price), float(high), float(low), float(close)
+
+        ewm_value = self.ewm.update(close)
+        upper_envelope = ewm_value * (1 + self.envelopes_perc)
+        lower_envelope = ewm_value * (1 - self.envelopes_perc)
+
+        bearish_signal = 0
+        bullish_signal = 0
+        if len(self.bars) == 2:
+            first_open, _, _, first_close = self.bars[0]
+            _, mid_high, mid_low, _ = self.bars[1]
+            flags = envelope_pattern_flags(first_open, first_close, mid_high, mid_low, open_price, high, low, close)
+
+            # Engulfing Bullish candle or custom bullish hammer + Low outside or equal to envelope curve
+            if (flags & ENVELOPE_BULLISH_PATTERNS) != 0 and low <= self.prev_lower_envelope:
+                bullish_signal = 1
+
+            # Engulfing Bearish candle or custom bearish hammer + High outside or equal envelope curve
+            if (flags & ENVELOPE_BEARISH_PATTERNS) != 0 and high >= self.prev_upper_envelope:
+                bearish_signal = 1
+
+        atr = self.atr.update(high, low, close)
+
+        self.bars.append((open_price, high, low, close))
+        self.prev_upper_envelope = upper_envelope
+        self.prev_lower_envelope = lower_envelope
+
+        row = {
+            'Open': open_price,
+            'High': high,
+            'Low': low,
+            'Close': close,
+            'ATR': atr,
+            'direction': 0,
+            'in_trade': False,
+            'ATR_trail_sl': np.nan,
+            'entry_price': np.nan,
+            'exit_price': np.nan,
+            'bearish_signal': bearish_signal,
+            'bullish_signal': bullish_signal,
+            'EWM': ewm_value,
+            'Upper_Envelope': upper_envelope,
+            'Lower_Envelope': lower_envelope
+        }
+
+        if not self.atr.ready:
+            self.warmup_rows.append(row)
+            return None
+
+        # The ATR seed also applies to the buffered candles, the first one is never traded (the batch loop starts at 1)
+        for i, warmup_row in enumerate(self.warmup_rows):
+            if i > 0:
+                warmup_row['ATR'] = atr
+                self.update_trade(warmup_row)
+            self.bearish_signal = warmup_row['bearish_signal']
+            self.bullish_signal = warmup_row['bullish_signal']
+        self.warmup_rows = []
+
+        self.update_trade(row)
+        self.bearish_signal = bearish_signal
+        self.bullish_signal = bullish_signal
+        return row
+
+    def update_trade(self, row):
+        (self.direction, self.in_trade, self.atr_trail_sl, row['exit_price'], row['entry_price'],
+         self.pending_exit, self.pending_exit_price) = update_trade_step(
+            row['Open'], row['High'], row['Low'], row['Close'], row['ATR'], self.bearish_signal, self.bullish_signal,
+            self.direction, self.in_trade, self.atr_trail_sl, self.pending_exit, self.pending_exit_price, self.atr_multiplier
+        )
+        row['direction'] = self.direction
+        row['in_trade'] = self.in_trade
+        row['ATR_trail_sl'] = self.atr_trail_sl
+
+    def load_history(self, df):
+        # Feed already closed candles, returns the row of the last one
+        row = None
+        for open_price, high, low, close in zip(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values):
+            row = self.update(open_price, high, low, close)
+        return row
@@ -1,84 +1,79 @@
+import math
 import pandas as pd
 import numpy as np
 from numba import njit, prange
 
-@njit
+from functions.patterns import calculate_candle_patterns, candle_pattern_flags, BULLISH_PATTERNS, BEARISH_PATTERNS
+from functions.indicators import calculate_rolling_sum, calculate_rolling_mean
+from functions.streaming import RollingWindow
+from functions.strategy_result import StrategyResult
+from functions.universe import valid_rows
+
+@njit(cache=True)
 def calculate_log_return(close):
     return np.log(close[1:] / close[:-1])
 
-@njit
-def calculate_rolling_sum(arr, window):
-    result = np.empty_like(arr)
-    for i in range(len(arr)):
-        if i < window:
-            result[i] = np.sum(arr[:i+1])
-        else:
-            result[i] = np.sum(arr[i-window+1:i+1])
-    return result
-
-@njit
+@njit(cache=True)
 def calculate_percentage_candle_size(high, low):
     return np.abs((high - low) / low) * 100
 
-@njit
-def calculate_rolling_mean(arr, window):
-    result = np.empty_like(arr)
-    for i in range(len(arr)):
-        if i < window:
-            result[i] = np.mean(arr[:i+1])
-        else:
-            result[i] = np.mean(arr[i-window+1:i+1])
-    return result
-
-@njit(parallel=True)
-def calculate_signals(log_return, window, open_prices, high_prices, low_prices, close_prices, desired_return, avg_candle_size, curr_candle_size):
-    n = len(log_return)
-    period_return = calculate_rolling_sum(log_return, window)
-
-    prev_open = open_prices[:-1]
-    prev_close = close_prices[:-1]
-    curr_open = open_prices[1:]
-    curr_close = close_prices[1:]
-    curr_high = high_prices[1:]
-    curr_low = low_prices[1:]
-
-    engulfing_bull = np.zeros(n, dtype=np.int32)
-    engulfing_bear = np.zeros(n, dtype=np.int32)
-    hammer_bull = np.zeros(n, dtype=np.int32)
-    hammer_bear = np.zeros(n, dtype=np.int32)
-
-    for i in prange(n):
-        # Engulfing Bullish pattern
-        if prev_open[i] < curr_close[i] and curr_open[i] < curr_close[i] and prev_open[i] > prev_close[i]:
-            engulfing_bull[i] = 1
-
-        # Engulfing Bearish pattern
-        if prev_open[i] > curr_close[i] and curr_open[i] > curr_close[i] and prev_open[i] < prev_close[i]:
-            engulfing_bear[i] = 1
-
-        # Hammer Bullish pattern
-        if (curr_open[i] < curr_close[i] and
-            prev_open[i] < prev_close[i] and
-            (curr_open[i] - curr_low[i]) > (0.9 * (prev_close[i] - low_prices[i]))):
-            hammer_bull[i] = 1
-
-        # Hammer Bearish pattern
-        if (curr_open[i] > curr_close[i] and
-            prev_open[i] > prev_close[i] and
-            (curr_high[i] - curr_open[i]) > (0.9 * (high_prices[i] - prev_close[i]))):
-            hammer_bear[i] = 1
-
-    bearish_signal = ((engulfing_bear | hammer_bear) &
-                      (curr_candle_size > avg_candle_size * 1.5) &
+@njit(cache=True)
+def calculate_signals(period_return, patterns, desired_return, avg_candle_size, curr_candle_size):
+    # patterns holds the packed candle pattern flags of each candle against the previous one
+    bullish_pattern = (patterns & BULLISH_PATTERNS) != 0
+    bearish_pattern = (patterns & BEARISH_PATTERNS) != 0
+    large_candle = curr_candle_size > avg_candle_size * 1.5
+
+    bearish_signal = (bearish_pattern &
+                      large_candle &
                       (period_return >= desired_return))
     
-    bullish_signal = ((engulfing_bull | hammer_bull) &
-                      (curr_candle_size > avg_candle_size * 1.5) &
+    bullish_signal = (bullish_pattern &
+                      large_candle &
                       (period_return <= -desired_return))
     
     return bearish_signal, bullish_signal
 
-@njit
+@njit(cache=True)
+def update_trade_step(open_price, high, low, prev_high, prev_low, bearish_signal, bullish_signal,
+                      direction, in_trade, fixed_sl, pending_exit, pending_exit_price):
+    # One bar of the trade state machine, shared by update_trade_status and the bar-by-bar engine
+    exit_price = np.nan
+    entry_price = np.nan
+
+    if pending_exit:
+        return 0, False, np.nan, pending_exit_price, entry_price, False, np.nan
+
+    if bullish_signal and direction != 1:
+        if in_trade:
+            exit_price = open_price
+        direction = 1
+        in_trade = True
+        entry_price = open_price
+        fixed_sl = prev_low - 1  # Set SL $1 below the low of the signal candle
+    elif bearish_signal and direction != -1:
+        if in_trade:
+            exit_price = open_price
+        direction = -1
+        in_trade = True
+        entry_price = open_price
+        fixed_sl = prev_high + 1  # Set SL $1 above the high of the signal candle
+
+    if in_trade:
+        if direction == 1 and low <= fixed_sl:
+            pending_exit = True
+            pending_exit_price = max(low, fixed_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+        elif direction == -1 and high >= fixed_sl:
+            pending_exit = True
+            pending_exit_price = min(high, fixed_sl)
+            if entry_price == open_price:
+                entry_price = np.nan
+
+    return direction, in_trade, fixed_sl, exit_price, entry_price, pending_exit, pending_exit_price
+
+@njit(cache=True)
 def update_trade_status(open_price, high, low, close, bearish_signal, bullish_signal, 
                         prev_direction, prev_in_trade, prev_fixed_sl):
     n = len(open_price)
@@ -96,50 +91,16 @@ def update_trade_status(open_price, high, low, close, bearish_signal, bullish_si
     pending_exit_price = np.nan
 
     for i in range(1, n):
-        direction[i] = direction[i-1]
-        in_trade[i] = in_trade[i-1]
-        fixed_sl[i] = fixed_sl[i-1]
-
-        if pending_exit:
-            exit_price[i] = pending_exit_price
-            direction[i] = 0
-            in_trade[i] = False
-            fixed_sl[i] = np.nan
-            pending_exit = False
-            pending_exit_price = np.nan
-            continue
-
-        if bullish_signal[i-1] and direction[i] != 1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = 1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            fixed_sl[i] = low[i-1] - 1  # Set SL $1 below the low of the signal candle
-        elif bearish_signal[i-1] and direction[i] != -1:
-            if in_trade[i]:
-                exit_price[i] = open_price[i]
-            direction[i] = -1
-            in_trade[i] = True
-            entry_price[i] = open_price[i]
-            fixed_sl[i] = high[i-1] + 1  # Set SL $1 above the high of the signal candle
-
-        if in_trade[i]:
-            if direction[i] == 1 and low[i] <= fixed_sl[i]:
-                pending_exit = True
-                pending_exit_price = max(low[i], fixed_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
-            elif direction[i] == -1 and high[i] >= fixed_sl[i]:
-                pending_exit = True
-                pending_exit_price = min(high[i], fixed_sl[i])
-                if entry_price[i] == open_price[i]:
-                    entry_price[i] = np.nan
+        (direction[i], in_trade[i], fixed_sl[i], exit_price[i], entry_price[i],
+         pending_exit, pending_exit_price) = update_trade_step(
+            open_price[i], high[i], low[i], high[i-1], low[i-1], bearish_signal[i-1], bullish_signal[i-1],
+            direction[i-1], in_trade[i-1], fixed_sl[i-1], pending_exit, pending_exit_price
+        )
 
     return direction, in_trade, fixed_sl, exit_price, entry_price
 
-@njit
-def process_dataframe_numba(open_values, high_values, low_values, close_values, window, desired_return):
+@njit(cache=True)
+def process_dataframe_numba(open_values, high_values, low_values, close_values, patterns, window, desired_return):
     n = len(close_values)
     log_return = np.empty(n)
     log_return[0] = np.nan
@@ -147,10 +108,10 @@ def process_dataframe_numba(open_values, high_values, low_values, close_values,
     
     percentage_candle_size = calculate_percentage_candle_size(high_values, low_values)
     avg_candle_size = calculate_rolling_mean(percentage_candle_size, window)
+    period_return = calculate_rolling_sum(log_return[1:], window)
     
     bearish_signal, bullish_signal = calculate_signals(
-        log_return[1:], window, 
-        open_values[:-1], high_values[:-1], low_values[:-1], close_values[:-1],
+        period_return, patterns[1:],
         desired_return, avg_candle_size[:-1], percentage_candle_size[:-1]
     )
     
@@ -187,28 +148,170 @@ def process_dataframe_numba(open_values, high_values, low_values, close_values,
     
     return log_return, percentage_candle_size, avg_candle_size, final_direction, final_in_trade, final_fixed_sl, exit_price, final_entry_price, final_bearish_signal, final_bullish_signal
 
-def process_dataframe(df, window=30, desired_return=0.01):
-    # Extract numpy arrays from DataFrame
-    open_values = df['Open'].values
-    high_values = df['High'].values
-    low_values = df['Low'].values
-    close_values = df['Close'].values
+def process_arrays(open_values, high_values, low_values, close_values, window=30, desired_return=0.01, patterns=None):
+    # Array-in/array-out version of process_dataframe, nothing is copied or written into a DataFrame
+    if patterns is None:
+        patterns = calculate_candle_patterns(open_values, high_values, low_values, close_values)
     
-    # Process data using Numba-optimized function
     log_return, percentage_candle_size, avg_candle_size, direction, in_trade, fixed_sl, exit_price, entry_price, bearish_signal, bullish_signal = process_dataframe_numba(
-        open_values, high_values, low_values, close_values, window, desired_return
+        open_values, high_values, low_values, close_values, patterns, window, desired_return
     )
     
+    return StrategyResult({
+        'Log_Return': log_return,
+        'percentage_candle_size': percentage_candle_size,
+        'avg_candle_size': avg_candle_size,
+        'direction': direction,
+        'in_trade': in_trade,
+        'fixed_sl': fixed_sl,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    })
+
+def process_dataframe(df, window=30, desired_return=0.01, patterns=None):
+    result = process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values,
+                            window, desired_return, patterns)
+    
     # Assign results back to DataFrame
-    df['Log_Return'] = log_return
-    df['percentage_candle_size'] = percentage_candle_size
-    df['avg_candle_size'] = avg_candle_size
-    df['direction'] = direction
-    df['in_trade'] = in_trade
-    df['fixed_sl'] = fixed_sl
-    df['entry_price'] = entry_price
-    df['exit_price'] = exit_price
-    df['bearish_signal'] = bearish_signal
-    df['bullish_signal'] = bullish_signal
+    return result.to_dataframe(df)
+
+@njit(parallel=True, cache=True)
+def process_universe_numba(open_values, high_values, low_values, close_values, window, desired_return):
+    # open/high/low/close are aligned (bars x symbols) arrays, each symbol runs on its own candles (valid_rows) in parallel
+    n, n_symbols = close_values.shape
+    direction = np.zeros((n, n_symbols), dtype=np.int32)
+    entry_price = np.full((n, n_symbols), np.nan)
+    exit_price = np.full((n, n_symbols), np.nan)
+    bearish_signal = np.zeros((n, n_symbols), dtype=np.bool_)
+    bullish_signal = np.zeros((n, n_symbols), dtype=np.bool_)
+    
+    for s in prange(n_symbols):
+        rows = valid_rows(close_values[:, s])
+        if len(rows) < 2:
+            continue
+        
+        # Contiguous copies of the symbol's candles keep the 1D kernels cache friendly, and the recursive ATR and EWM
+        # never see the NaN of a missing candle
+        symbol_open = open_values[rows, s]
+        symbol_high = high_values[rows, s]
+        symbol_low = low_values[rows, s]
+        symbol_close = close_values[rows, s]
+        patterns = calculate_candle_patterns(symbol_open, symbol_high, symbol_low, symbol_close)
+        _, _, _, symbol_direction, _, _, symbol_exit_price, symbol_entry_price, symbol_bearish_signal, symbol_bullish_signal = process_dataframe_numba(
+            symbol_open, symbol_high, symbol_low, symbol_close, patterns, window, desired_return
+        )
+        direction[rows, s] = symbol_direction
+        entry_price[rows, s] = symbol_entry_price
+        exit_price[rows, s] = symbol_exit_price
+        bearish_signal[rows, s] = symbol_bearish_signal
+        bullish_signal[rows, s] = symbol_bullish_signal
+    
+    return direction, entry_price, exit_price, bearish_signal, bullish_signal
+
+def process_universe(open_values, high_values, low_values, close_values, window=30, desired_return=0.01):
+    """
+    Run the strategy over a universe of symbols at once. Inputs are aligned 2D (bars x symbols) price
+    arrays or DataFrames, e.g. from functions.universe.align_universe. Bars where a symbol has no price
+    (before it lists, after it delists, missing candles) are NaN and skipped, the strategy runs on the
+    symbol's own candles and its outputs on the skipped bars are left empty.
+
+    Returns a dict of 2D (bars x symbols) arrays with the columns process_dataframe would produce
+    for each symbol on its own.
+    """
+    prices = [np.ascontiguousarray(np.asarray(values, dtype=np.float64)) for values in (open_values, high_values, low_values, close_values)]
     
-    return df
\ No newline at end of file
+    direction, entry_price, exit_price, bearish_signal, bullish_signal = process_universe_numba(
+        *prices, window, desired_return
+    )
+    
+    return {
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'bearish_signal': bearish_signal,
+        'bullish_signal': bullish_signal
+    }
+
+class CandlestickReversionNewEngine:
+    """
+    Bar-by-bar version of process_dataframe for live trading. Each closed candle is passed to update(),
+    which does O(1) work and returns the row process_dataframe would produce for that candle over the
+    same history, as a dict keyed by the DataFrame columns.
+    """
+
+    def __init__(self, window=30, desired_return=0.01):
+        self.window = window
+        self.desired_return = desired_return
+
+        self.period_return = RollingWindow(window)
+        self.avg_candle_size = RollingWindow(window)
+        self.prev_bar = None
+        self.prev_candle_size = np.nan
+        self.prev_avg_candle_size = np.nan
+
+        # Trade state as update_trade_status leaves it, process_dataframe reports it one bar later
+        self.direction = 0
+        self.in_trade = False
+        self.fixed_sl = np.nan
+        self.entry_price = np.nan
+        self.pending_exit = False
+        self.pending_exit_price = np.nan
+
+    def update(self, open_price, high, low, close):
+        open_price, high, low, close = float(open_price), float(high), float(low), float(close)
+
+        percentage_candle_size = abs((high - low) / low) * 100
+        avg_candle_size = self.avg_candle_size.update(percentage_candle_size, mean=True)
+
+        row = {
+            'Open': open_price,
+            'High': high,
+            'Low': low,
+            'Close': close,
+            'Log_Return': np.nan,
+            'percentage_candle_size': percentage_candle_size,
+            'avg_candle_size': avg_candle_size,
+            'direction': self.direction,
+            'in_trade': self.in_trade,
+            'fixed_sl': self.fixed_sl,
+            'entry_price': self.entry_price,
+            'exit_price': np.nan,
+            'bearish_signal': False,
+            'bullish_signal': False
+        }
+
+        # The first candle has no previous one to compare against and is never traded
+        if self.prev_bar is not None:
+            prev_open, prev_high, prev_low, prev_close = self.prev_bar
+            log_return = math.log(close / prev_close)
+            period_return = self.period_return.update(log_return)
+
+            flags = candle_pattern_flags(prev_open, prev_high, prev_low, prev_close, open_price, high, low, close)
+            large_candle = self.prev_candle_size > self.prev_avg_candle_size * 1.5
+            bearish_signal = (flags & BEARISH_PATTERNS) != 0 and large_candle and period_return >= self.desired_return
+            bullish_signal = (flags & BULLISH_PATTERNS) != 0 and large_candle and period_return <= -self.desired_return
+
+            row['Log_Return'] = log_return
+            row['bearish_signal'] = bool(bearish_signal)
+            row['bullish_signal'] = bool(bullish_signal)
+
+            (self.direction, self.in_trade, self.fixed_sl, row['exit_price'], self.entry_price,
+             self.pending_exit, self.pending_exit_price) = update_trade_step(
+                open_price, high, low, prev_high, prev_low, row['bearish_signal'], row['bullish_signal'],
+                self.direction, self.in_trade, self.fixed_sl, self.pending_exit, self.pending_exit_price
+            )
+
+        self.prev_bar = (open_price, high, low, close)
+        self.prev_candle_size = percentage_candle_size
+        self.prev_avg_candle_size = avg_candle_size
+
+        return row
+
+    def load_history(self, df):
+        # Feed already closed candles, returns the row of the last one
+        row = None
+        for open_price, high, low, close in zip(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values):
+            row = self.update(open_price, high, low, close)
+        return row
@@ -0,0 +1,10 @@
+import os
+import sys
+import numba
+
+# The tests import functions/ and strats/ from the project root, as the WFO scripts do
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Same threading layer as the WFO scripts set in __main__: tests fork the worker pool after running parallel kernels
+if 'NUMBA_THREADING_LAYER' not in os.environ:
+    numba.config.THREADING_LAYER = 'workqueue'
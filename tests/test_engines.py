@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from functions.jit_cache import make_warmup_ohlcv
+from strats import candlestick_reversion, candlestick_reversion_envelopes, candlestick_reversion_envelopes_upgraded, candlestick_reversion_new
+
+ENGINES = [
+    (candlestick_reversion, candlestick_reversion.CandlestickReversionEngine, {'window': 20, 'desired_return': 0.005, 'atr_multiplier': 2}),
+    (candlestick_reversion_envelopes, candlestick_reversion_envelopes.CandlestickReversionEnvelopesEngine,
+     {'atr_multiplier': 2, 'ewm_period': 10, 'envelopes_perc': 0.004}),
+    (candlestick_reversion_envelopes_upgraded, candlestick_reversion_envelopes_upgraded.CandlestickReversionEnvelopesUpgradedEngine,
+     {'atr_multiplier': 2, 'ewm_period': 10, 'envelopes_perc': 0.004}),
+    (candlestick_reversion_new, candlestick_reversion_new.CandlestickReversionNewEngine, {'window': 20, 'desired_return': 0.005}),
+]
+
+
+@pytest.mark.parametrize('strategy, engine_class, params', ENGINES)
+def test_engine_matches_process_dataframe(strategy, engine_class, params):
+    # Bars fed one at a time give the rows process_dataframe computes over the whole history
+    df = make_warmup_ohlcv(n_bars=600)
+    expected = strategy.process_dataframe(df, **params)
+    engine = engine_class(**params)
+    rows = [engine.update(*bar) for bar in df[['Open', 'High', 'Low', 'Close']].to_numpy()]
+    
+    first = next(i for i, row in enumerate(rows) if row is not None)
+    assert first < 20 and all(row is not None for row in rows[first:])
+    for column in expected.columns:
+        streamed = np.array([row[column] for row in rows[first:]])
+        batch = expected[column].to_numpy()[first:]
+        if streamed.dtype.kind == 'f':
+            np.testing.assert_allclose(streamed, batch.astype(np.float64), rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=column)
+        else:
+            np.testing.assert_array_equal(streamed, batch.astype(streamed.dtype), err_msg=column)
+    assert expected['bullish_signal'].any() and expected['bearish_signal'].any() and expected['direction'].any()
@@ -0,0 +1,32 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from functions.jit_cache import make_warmup_ohlcv
+from strats import candlestick_reversion, candlestick_reversion_envelopes, candlestick_reversion_envelopes_upgraded
+
+GRIDS = [
+    (candlestick_reversion, {'window': [10, 20], 'desired_return': [0.005, 0.01], 'atr_multiplier': [2, 3]}),
+    (candlestick_reversion_envelopes, {'atr_multiplier': [2, 3], 'ewm_period': [10, 20], 'envelopes_perc': [0.004, 0.01]}),
+    (candlestick_reversion_envelopes_upgraded, {'atr_multiplier': [2, 3], 'ewm_period': [10, 20], 'envelopes_perc': [0.004, 0.01]}),
+]
+COLUMNS = ['direction', 'entry_price', 'exit_price', 'bearish_signal', 'bullish_signal']
+
+
+@pytest.mark.parametrize('strategy, param_ranges', GRIDS)
+@pytest.mark.parametrize('shared_indicators', [False, True])
+def test_grid_kernel_matches_single_combinations(strategy, param_ranges, shared_indicators):
+    # Row i of the batched grid is what the per-combination path (process_arrays) gives for param_combinations[i],
+    # with the indicators computed by the kernel or passed in from calculate_grid_indicators
+    df = make_warmup_ohlcv(n_bars=600)
+    values = df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values
+    param_combinations = list(product(*param_ranges.values()))
+    indicators = strategy.calculate_grid_indicators(*values, param_combinations) if shared_indicators else None
+    grid = strategy.process_param_grid(df, param_combinations, indicators=indicators)
+    
+    for i, params in enumerate(param_combinations):
+        single = strategy.process_arrays(*values, **dict(zip(param_ranges, params)))
+        for column in COLUMNS:
+            np.testing.assert_array_equal(grid[column][i], np.asarray(single[column]).astype(grid[column].dtype), err_msg=f"{params} {column}")
+    assert grid['direction'].any()
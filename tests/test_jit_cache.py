@@ -0,0 +1,37 @@
+import glob
+import importlib
+import logging
+import os
+import sys
+
+from functions.jit_cache import invalidate_stale_kernels
+
+KERNEL_SOURCE = '''from numba import njit
+
+@njit(cache=True)
+def double(x):
+    return 2 * x
+'''
+
+
+def test_stale_kernels_are_deleted_without_numba_cache_api(tmp_path, monkeypatch, caplog):
+    # A numba without the private Cache.flush / _cache_path: the cache files are found and deleted by name
+    (tmp_path / 'cached_kernel.py').write_text(KERNEL_SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module('cached_kernel')
+    try:
+        assert module.double(2) == 4
+        cache_files = lambda: glob.glob(os.path.join(tmp_path, '__pycache__', 'cached_kernel.*.nb[ic]'))
+        assert cache_files()
+        
+        monkeypatch.setattr(module.double, '_cache', None)
+        with caplog.at_level(logging.INFO, logger='functions.jit_cache'):
+            assert invalidate_stale_kernels([module]) == 1
+        assert not cache_files()
+        assert 'deleting the cache files of cached_kernel' in caplog.text
+        assert os.path.exists(os.path.join(tmp_path, '__pycache__', 'cached_kernel.deps'))
+        
+        # Unchanged sources keep the cache
+        assert invalidate_stale_kernels([module]) == 0
+    finally:
+        sys.modules.pop('cached_kernel', None)
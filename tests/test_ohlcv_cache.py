@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from functions.ohlcv_cache import load_ohlcv
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'binance_data', 'btcusdt_ohlcv_1h.csv')
+
+
+def read_after_rebuild(csv_path, cache_dir, loaded, rebuilt, conn):
+    # Another process holding a frame of the cache while it is rebuilt
+    df = load_ohlcv(csv_path, cache_dir)
+    close = df['Close'].to_numpy().copy()
+    loaded.set()
+    rebuilt.wait()
+    conn.send((len(df), np.array_equal(df['Close'].to_numpy(), close), float(df['Close'].sum())))
+
+def test_rebuild_keeps_frames_loaded_before(tmp_path):
+    csv_path, cache_dir = str(tmp_path / 'ohlcv.csv'), str(tmp_path / 'cache')
+    pd.read_csv(DATA_FILE).iloc[-500:].to_csv(csv_path, index=False)
+    load_ohlcv(csv_path, cache_dir)
+
+    context = multiprocessing.get_context('fork')
+    loaded, rebuilt = context.Event(), context.Event()
+    receiver, sender = context.Pipe(duplex=False)
+    reader = context.Process(target=read_after_rebuild, args=(csv_path, cache_dir, loaded, rebuilt, sender))
+    reader.start()
+    assert loaded.wait(60)
+
+    # A shorter file with other prices: rewriting the mapped files in place would truncate them under the reader
+    changed = pd.read_csv(DATA_FILE).iloc[-200:]
+    changed['Close'] *= 2
+    changed.to_csv(csv_path, index=False)
+    df = load_ohlcv(csv_path, cache_dir)
+    rebuilt.set()
+    reader.join(60)
+
+    assert reader.exitcode == 0
+    n, unchanged, _ = receiver.recv()
+    assert n == 500 and unchanged
+    expected = pd.read_csv(csv_path, parse_dates=['Date'], index_col='Date')
+    pd.testing.assert_frame_equal(df, expected)
+    pd.testing.assert_frame_equal(load_ohlcv(csv_path, cache_dir), expected)
+    assert len([entry for entry in os.listdir(cache_dir) if entry.startswith('data-')]) == 1
@@ -0,0 +1,43 @@
+import tracemalloc
+from itertools import product
+
+import numpy as np
+
+from functions.param_grid import ParamGrid
+from functions.scheduling import plan_chunks, chunk_indices
+
+
+PARAM_RANGES = {'atr_multiplier': [0.5, 1.0, 1.5], 'window': range(3, 9), 'desired_return': [0.005, 0.01], 'side': ['long', 'short']}
+
+def test_grid_decodes_the_product():
+    grid = ParamGrid(PARAM_RANGES)
+    param_combinations = list(product(*PARAM_RANGES.values()))
+    assert len(grid) == len(param_combinations)
+    assert [grid[j] for j in range(len(grid))] == param_combinations
+    assert [grid.index(params) for params in param_combinations] == list(range(len(grid)))
+    assert grid.index((2.0, 3, 0.005, 'long')) is None
+
+def test_grid_chunks_match_list_chunks():
+    param_combinations = list(product(*PARAM_RANGES.values()))
+    skip = [0, 5, 17, 40, 41, 42, 60, len(param_combinations) - 1]
+    grid = ParamGrid(PARAM_RANGES, skip)
+    rest = [params for j, params in enumerate(param_combinations) if j not in skip]
+    group_index = list(PARAM_RANGES).index('window')
+    for n_workers, seconds_per_combination in ((1, None), (3, None), (2, 0.5 / 7)):
+        chunks = plan_chunks(grid, group_index, n_workers, seconds_per_combination)
+        positions = [chunk_indices(chunk) for chunk in chunks]
+        # Every combination not skipped exactly once, in chunks of the same sizes as for the list
+        assert sorted(np.concatenate(positions).tolist()) == sorted(set(range(len(param_combinations))) - set(skip))
+        assert [len(chunk) for chunk in chunks] == [len(p) for p in positions]
+        assert sorted(map(len, chunks)) == sorted(map(len, plan_chunks(rest, group_index, n_workers, seconds_per_combination)))
+
+def test_planning_a_large_grid_does_not_list_it():
+    param_ranges = {'window': range(2, 102), 'x': np.arange(100), 'y': np.arange(100), 'z': range(10)}
+    tracemalloc.start()
+    try:
+        chunks = plan_chunks(ParamGrid(param_ranges), 0, 8, 2e-4)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert sum(map(len, chunks)) == 10_000_000
+    assert peak < 5e6
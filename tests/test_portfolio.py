@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from functions.jit_cache import make_warmup_ohlcv
+from functions.portfolio import validate_against_vectorbt, METRIC_NAMES
+from strats import candlestick_reversion
+
+
+@pytest.mark.parametrize('fees', [0.0, 0.001])
+def test_native_simulator_matches_vectorbt(fees):
+    # Signals of a real strategy on synthetic candles: long and short positions, stop exits and reversals
+    df = make_warmup_ohlcv(n_bars=1000)
+    result = candlestick_reversion.process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values,
+                                                  window=20, desired_return=0.005, atr_multiplier=2)
+    assert {-1, 1} <= set(np.unique(result['direction']))
+    
+    # Raises on any metric or equity bar differing from vbt.Portfolio.from_signals
+    native = validate_against_vectorbt(df, result['bullish_signal'], result['bearish_signal'], result['direction'],
+                                       result['exit_price'], '1h', fees, 100000)
+    assert set(METRIC_NAMES) <= set(native)
+    assert native['total_trades'] > 5
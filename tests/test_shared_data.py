@@ -0,0 +1,26 @@
+import os
+
+from functions.jit_cache import make_warmup_ohlcv
+from functions import shared_data
+
+
+def mapped_paths():
+    with open('/proc/self/maps') as f:
+        return f.read()
+
+def test_released_windows_are_unmapped_on_next_attach():
+    df = make_warmup_ohlcv()
+    first = shared_data.publish_window(0, df)
+    second = shared_data.publish_window(1, df)
+    shared_data.attach_window(first)
+    assert first.ohlc_path in mapped_paths()
+    
+    # Released by the parent (its files deleted) while a worker still has it attached
+    os.remove(first.ohlc_path)
+    os.remove(first.index_path)
+    assert first.ohlc_path in mapped_paths()
+    
+    shared_data.attach_window(second)
+    assert first.ohlc_path not in shared_data._attached
+    assert first.ohlc_path not in mapped_paths()
+    shared_data.release_window(second)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from functions.jit_cache import make_warmup_ohlcv
+from functions.portfolio import simulate_portfolio, simulate_universe, METRIC_NAMES
+from functions.universe import align_universe
+from strats import candlestick_reversion, candlestick_reversion_envelopes, candlestick_reversion_envelopes_upgraded, candlestick_reversion_new
+
+STRATEGIES = [
+    (candlestick_reversion, {'window': 20, 'desired_return': 0.005, 'atr_multiplier': 2}),
+    (candlestick_reversion_envelopes, {'atr_multiplier': 2, 'ewm_period': 10, 'envelopes_perc': 0.004}),
+    (candlestick_reversion_envelopes_upgraded, {'atr_multiplier': 2, 'ewm_period': 10, 'envelopes_perc': 0.004}),
+    (candlestick_reversion_new, {'window': 20, 'desired_return': 0.005}),
+]
+
+
+def make_universe():
+    # A: every candle, B: one candle missing in the middle, C: lists later and misses a candle
+    df = make_warmup_ohlcv(n_bars=600)
+    frames = {'A': df, 'B': df.drop(df.index[300]), 'C': df.iloc[100:].drop(df.index[400]) * 1.1}
+    return frames, align_universe(frames)
+
+@pytest.mark.parametrize('strategy, params', STRATEGIES)
+def test_universe_skips_missing_candles(strategy, params):
+    # Every symbol gives the same signals and metrics as the strategy run on its own candles, a missing candle
+    # doesn't leave the ATR or EWM NaN for the rest of the series
+    frames, (index, symbols, open_values, high_values, low_values, close_values) = make_universe()
+    result = strategy.process_universe(open_values, high_values, low_values, close_values, **params)
+    metrics = simulate_universe(open_values, result['bullish_signal'], result['bearish_signal'], result['direction'],
+                                result['exit_price'], '1h', 0.0005, 100000)
+    
+    for s, symbol in enumerate(symbols):
+        df = frames[symbol]
+        rows = index.get_indexer(df.index)
+        own = strategy.process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, **params)
+        for column in ['direction', 'entry_price', 'exit_price', 'bearish_signal', 'bullish_signal']:
+            np.testing.assert_array_equal(result[column][rows, s], np.asarray(own[column]).astype(result[column].dtype))
+        
+        own_metrics = simulate_portfolio(df['Open'].values, own['bullish_signal'], own['bearish_signal'], own['direction'],
+                                         own['exit_price'], '1h', 0.0005, 100000)
+        np.testing.assert_allclose(metrics[s], [own_metrics[name] for name in METRIC_NAMES], equal_nan=True)
+        assert own_metrics['total_trades'] > 0
@@ -0,0 +1,33 @@
+import logging
+import os
+import pytest
+
+from functions.custom_functions import wfo_split
+from functions.ohlcv_cache import load_ohlcv
+from wfo_backtest import wfo_candlestick_reversion as wfo
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'binance_data', 'btcusdt_ohlcv_1h.csv')
+PARAM_RANGES = {'window': range(10, 30, 10), 'desired_return': [0.005, 0.01], 'atr_multiplier': range(2, 4)}
+
+
+def one_window():
+    df = load_ohlcv(DATA_FILE).iloc[-1300:]
+    (in_ohlcv, in_indexes), (out_ohlcv, out_indexes) = wfo_split(df, 1000, 300)
+    return in_ohlcv, out_ohlcv, in_indexes, out_indexes
+
+def test_reduced_metric_set_runs_a_window(monkeypatch, tmp_path, caplog):
+    # Without sharpe_ratio the plot and the logs use the first rank metric left, total_return
+    monkeypatch.setattr(wfo, 'IN_SAMPLE_METRICS', ('total_return', 'max_drawdown'))
+    caplog.set_level(logging.INFO)
+    results = wfo.walk_forward_optimization(*one_window(), PARAM_RANGES, '1h', 0.0005, 100000, True, str(tmp_path))
+    
+    assert len(results) == 1
+    top = results[0]['in_sample_results'][0]
+    assert set(top) == {'params', 'total_return', 'max_drawdown', 'total_trades'}
+    assert os.path.exists(results[0]['plot_filename'])
+    assert "In-sample top Total Return" in caplog.text
+
+def test_metric_set_without_rank_metric_is_rejected(monkeypatch, tmp_path):
+    monkeypatch.setattr(wfo, 'IN_SAMPLE_METRICS', ('max_drawdown',))
+    with pytest.raises(ValueError):
+        wfo.walk_forward_optimization(*one_window(), PARAM_RANGES, '1h', 0.0005, 100000, True, str(tmp_path))
@@ -0,0 +1,13 @@
+import numba
+
+from functions.worker_pool import get_pool, close_pool
+
+
+def worker_threads(_):
+    return numba.get_num_threads()
+
+def test_workers_run_kernels_on_one_thread():
+    try:
+        assert set(get_pool(2).map(worker_threads, range(8))) == {1}
+    finally:
+        close_pool()
@@ -7,6 +7,7 @@ import logging
 import importlib
 from functools import partial
 import sys
+import numba
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -19,8 +20,35 @@ logger = logging.getLogger(__name__)
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
-from functions.custom_functions import wfo_rolling_split_params
-from strats.candlestick_reversion_envelopes import process_dataframe
+from functions.custom_functions import wfo_rolling_split_params, wfo_anchored_split, wfo_split
+from functions.ohlcv_cache import load_ohlcv
+from functions.jit_cache import warm_up
+from functions.worker_pool import get_pool
+from functions.scheduling import plan_chunks, run_window_grids, estimate_cost
+from functions.patterns import calculate_candle_patterns_df
+from functions.shared_data import publish_window, attach_window, release_window, get_publish_dir
+from functions.result_cache import ResultCache
+from functions.result_table import ResultTable, TopResults
+from functions.param_grid import ParamGrid
+from functions.result_store import ResultStore
+from functions.checkpoint import RunCheckpoint, WindowStore, run_key
+from functions.history import HistoryIndicators
+from functions.optimizers import SuccessiveHalving, TPESampler, CoarseToFine, grid_size, optimizer_settings, rank_metrics, MIN_SUBSET_BARS
+from functions.portfolio import simulate_grid, simulate_grid_prefixes, validate_against_vectorbt, METRIC_NAMES
+from strats.candlestick_reversion_envelopes import process_arrays, process_param_grid, calculate_grid_indicators
+
+# Metrics the native simulator computes for every in-sample combination, METRIC_NAMES or a subset of it holding at least
+# one of the RANK_METRICS (total_trades is always there). The ranking, the plots and the logs use the ones present among
+# RANK_METRICS, fewer metrics make the in-sample sweep faster and its results smaller. The full vectorbt stats are only computed for the
+# out-of-sample test of the chosen parameters
+IN_SAMPLE_METRICS = METRIC_NAMES
+
+# With a number, only the STREAM_TOP_K best in-sample combinations of a window (at least the 5 reported) are kept while
+# its chunks come back from the pool, instead of a row per combination, so memory doesn't grow with the grid. Used for
+# the whole grid only (not with an optimizer) and the result cache is left out. The parameter plot needs SPILL_RESULTS,
+# every result is then also written to a temporary file on disk
+STREAM_TOP_K = None
+SPILL_RESULTS = False
 
 
 def calculate_signals(bullish_signal, bearish_signal, direction, exit_price):
@@ -35,17 +63,19 @@ def calculate_signals(bullish_signal, bearish_signal, direction, exit_price):
     
     return long_entries, short_entries, short_exits, long_exits
 
-def process_param_combination(df, params, freq, fees, init_cash):
+def process_param_combination(df, params, freq, fees, init_cash, patterns=None, indicators=None):
     param_dict = dict(zip(['atr_multiplier', 'ewm_period', 'envelopes_perc'], params))
     
-    df = process_dataframe(df.copy(), **param_dict)
+    # Arrays in, arrays out: the OHLC data is never copied, only the four signal columns get the DataFrame index
+    result = process_arrays(df['Open'].values, df['High'].values, df['Low'].values, df['Close'].values, patterns=patterns, indicators=indicators, **param_dict)
+    signals = result.to_dataframe(index=df.index, columns=['bullish_signal', 'bearish_signal', 'direction', 'exit_price'])
     
     long_entries, short_entries, short_exits, long_exits = calculate_signals(
-        df['bullish_signal'], df['bearish_signal'], 
-        df['direction'], df['exit_price']
+        signals['bullish_signal'], signals['bearish_signal'], 
+        signals['direction'], signals['exit_price']
     )
     
-    open_prices = df['Open'].where(np.isnan(df['exit_price']), df['exit_price'])
+    open_prices = df['Open'].where(np.isnan(signals['exit_price']), signals['exit_price'])
     
     pf = vbt.Portfolio.from_signals(
         open_prices,
@@ -72,6 +102,29 @@ def process_param_combination(df, params, freq, fees, init_cash):
         'stats': stats
     }
 
+def process_param_chunk(shared, param_chunk, freq, fees, init_cash, validate=False, ends=None, metric_names=METRIC_NAMES):
+    # Zero-copy views of the window published by process_window, attached once per worker
+    df, patterns, indicators = attach_window(shared)
+    
+    # One compiled call computes the signals of the whole chunk, sharing the ATR, EWMs and envelopes
+    grid = process_param_grid(df, param_chunk, patterns=patterns, indicators=indicators)
+    
+    # The native simulator returns the selection metrics without building a vectorbt Portfolio per combination.
+    # With ends (anchored windows) every combination gets the metrics of each window from a single simulation
+    if ends is None:
+        metrics = simulate_grid(df['Open'].values, grid['bullish_signal'], grid['bearish_signal'],
+                                grid['direction'], grid['exit_price'], freq, fees, init_cash, metric_names)
+    else:
+        metrics = simulate_grid_prefixes(df['Open'].values, grid['bullish_signal'], grid['bearish_signal'],
+                                         grid['direction'], grid['exit_price'], freq, fees, init_cash, ends, metric_names)
+    
+    if validate:
+        for c in range(len(param_chunk)):
+            validate_against_vectorbt(df, grid['bullish_signal'][c], grid['bearish_signal'][c],
+                                      grid['direction'][c], grid['exit_price'][c], freq, fees, init_cash)
+    # Only the metric array goes back to the parent, which writes it into the window's ResultTable
+    return metrics
+
 ## Use this to select the one with most trades among top 5
 # def auto_select_params(results_df):
 #     # Select top 5 results based on Sharpe ratio
@@ -88,25 +141,129 @@ def auto_select_params(results_df):
     
     return selected['params']
 
-def process_window(i, in_ohlcv_i, out_ohlcv_i, param_ranges, freq, fees, init_cash, auto_select, subfolder):
-    param_combinations = list(product(*param_ranges.values()))
-    
-    with multiprocessing.Pool() as pool:
-        process_func = partial(process_param_combination, in_ohlcv_i, freq=freq, fees=fees, init_cash=init_cash)
-        results = list(tqdm(pool.imap(process_func, param_combinations), 
-                            total=len(param_combinations), 
-                            desc=f"Processing window {i+1}"))
-    
-    results_df = pd.DataFrame(results)
-    results_df = results_df[results_df['total_trades'] > 0]  # Filter out results with no trades
-    results_df = results_df.sort_values(['sharpe_ratio', 'sortino_ratio', 'calmar_ratio', 'total_return'], 
-                                        ascending=[False, False, False, False]).reset_index(drop=True)
-    
-    plot_filename = create_combined_parameter_sharpe_plot(results, i, subfolder)
-    
-    logger.info(f"Combined Parameter-Sharpe plot saved as {plot_filename}")
-    
-    if auto_select:
+def top_results(i, param_ranges, param_combinations, stream_top_k):
+    # Streaming stand-in for the ResultTable of window i, see STREAM_TOP_K
+    spill_path = os.path.join(get_publish_dir(), f'window_{i}_results.bin') if SPILL_RESULTS else None
+    return TopResults(param_ranges, param_combinations, max(stream_top_k, 5), IN_SAMPLE_METRICS, spill_path)
+
+def stream_grid(param_ranges, done_by_window):
+    # Grid of a streamed run, decoded lazily instead of listed: the combinations every window already has (done_by_window,
+    # a {params: metrics} per window loaded from the checkpoint) are skipped. Returns the grid and the (positions, metrics)
+    # of the skipped combinations for each window, for its TopResults
+    grid = ParamGrid(param_ranges)
+    done_positions = [{grid.index(params): metrics for params, metrics in done.items()} for done in done_by_window]
+    skip = sorted(set.intersection(*(set(done) for done in done_positions)) - {None}) if done_positions else []
+    return ParamGrid(param_ranges, skip), [(skip, [done[j] for j in skip]) for done in done_positions]
+
+def window_sink(cached):
+    # run_window_grids sink adding the chunks of a streamed window to its TopResults, None for a ResultTable. A streamed
+    # window runs a ParamGrid, its indices already are grid positions
+    _, table, rows = cached
+    if not isinstance(table, TopResults):
+        return None
+    return table.set_metrics
+
+def prepare_window(i, in_ohlcv_i, param_ranges, freq, fees, init_cash, validate_simulator=False, result_cache=None, checkpoint=None, param_combinations=None, history_indicators=None, stream_top_k=None):
+    # Publishes the in-sample data of window i and plans its chunks, returns (shared, grid, cached) where grid is
+    # what run_window_grids evaluates and cached the window's ResultTable, already holding the cached results, with
+    # what complete_window_results needs to fill in the rest. Evaluates the whole param_ranges grid unless given a
+    # list of param_combinations. With stream_top_k the table is a TopResults fed by window_sink(cached) and the grid a
+    # ParamGrid, nothing the size of the grid is kept
+    if param_combinations is None and stream_top_k is None:
+        param_combinations = list(product(*param_ranges.values()))
+    
+    if history_indicators is None:
+        # Candle patterns don't depend on the parameters, compute them once for the whole window
+        patterns = calculate_candle_patterns_df(in_ohlcv_i)
+        indicators, warm_up_key = None, None
+    else:
+        # Patterns and indicators computed once over the whole history, warmed up on the bars before the window
+        patterns, indicators, warm_up_key = history_indicators.window(in_ohlcv_i)
+    
+    cache_key = None
+    if stream_top_k is not None:
+        # Checkpointed combinations are skipped by the grid, the rest is evaluated
+        done = checkpoint.load_chunks(i) if checkpoint is not None else {}
+        param_combinations, [(rows, metrics)] = stream_grid(param_ranges, [done])
+        table = top_results(i, param_ranges, param_combinations, stream_top_k)
+        table.set_metrics(rows, metrics)
+        if done:
+            logger.info(f"Window {i+1}: {len(done)} combinations loaded from the checkpoint")
+        rows = None
+        missing = None
+    else:
+        # One row per combination, typed columns instead of a dict per result
+        table = ResultTable(param_ranges, param_combinations, IN_SAMPLE_METRICS)
+        missing = np.ones(len(param_combinations), dtype=bool)
+    
+    # Combinations already evaluated on the same candles, with the same code and settings, are read from the cache
+    if result_cache is not None and missing is not None:
+        cache_key = result_cache.window_key(in_ohlcv_i, process_param_grid.__module__, freq, fees, init_cash, warm_up_key)
+        cached = result_cache.lookup(cache_key, param_combinations, list(param_ranges), IN_SAMPLE_METRICS)
+        rows = [j for j, result in enumerate(cached) if result is not None]
+        table.set_results(rows, [cached[j] for j in rows])
+        missing[rows] = False
+        logger.info(f"Window {i+1}: {len(rows)} of {len(param_combinations)} combinations loaded from the result cache")
+    
+    # Chunks finished before an interrupted run stopped
+    if checkpoint is not None and missing is not None:
+        done = checkpoint.load_chunks(i)
+        if done:
+            rows = [j for j, params in enumerate(param_combinations) if missing[j] and tuple(params) in done]
+            table.set_metrics(rows, [done[tuple(param_combinations[j])] for j in rows])
+            missing[rows] = False
+            logger.info(f"Window {i+1}: {len(done)} combinations loaded from the checkpoint")
+    if missing is not None:
+        rows = np.flatnonzero(missing)
+        param_combinations = [param_combinations[j] for j in rows]
+    
+    # Chunks group the combinations sharing an ewm_period (one set of EWM and envelopes per group in the grid kernel)
+    # and are sized from the cost per combination measured on the previous windows
+    n_bars = len(in_ohlcv_i)
+    cost_kind = process_param_grid.__module__
+    param_chunks = plan_chunks(param_combinations, list(param_ranges).index('ewm_period'), multiprocessing.cpu_count(),
+                               estimate_cost(cost_kind, n_bars))
+    
+    # The window is written once to memory-mapped files, tasks only carry their paths instead of a pickled DataFrame
+    shared = publish_window(i, in_ohlcv_i, patterns, indicators)
+    
+    process_func = partial(process_param_chunk, shared, freq=freq, fees=fees, init_cash=init_cash, validate=validate_simulator, metric_names=IN_SAMPLE_METRICS)
+    return shared, (i, process_func, param_combinations, param_chunks, cost_kind, n_bars), (cache_key, table, rows)
+
+def complete_window_results(grid, cached, results, result_cache=None):
+    # Writes the freshly evaluated combinations into the window's ResultTable (and the result cache), returns the table.
+    # A TopResults already got them from its sink
+    cache_key, table, rows = cached
+    if isinstance(table, TopResults):
+        return table
+    table.set_metrics(rows, results)
+    if result_cache is not None:
+        result_cache.store(cache_key, grid[2], table.records(rows))
+    return table
+
+def finish_window(i, table, out_ohlcv_i, param_ranges, freq, fees, init_cash, auto_select, subfolder, checkpoint=None, history_indicators=None, result_store=None):
+    # Ranks the in-sample results of window i (a ResultTable or TopResults), picks the parameters and runs the
+    # out-of-sample test. Combinations without trades are left out, only the top 5 become result dicts
+    results_df = pd.DataFrame(table.records(table.top(5)))
+    
+    # A TopResults only has every result when they were spilled to disk
+    full_table = table.full()
+    plot_filename = None
+    if full_table is not None:
+        plot_filename = create_combined_parameter_sharpe_plot(full_table, i, subfolder)
+        logger.info(f"Combined Parameter-Sharpe plot saved as {plot_filename}")
+        if result_store is not None:
+            result_store.save_grid(i, full_table)
+    else:
+        logger.info(f"Window {i+1}: only the top in-sample results were kept, no parameter plot (see SPILL_RESULTS)")
+    if isinstance(table, TopResults):
+        del full_table
+        table.release()
+    
+    chosen_params = checkpoint.load_selection(i) if checkpoint is not None else None
+    if chosen_params is not None:
+        logger.info(f"Parameters selected before the interruption: {chosen_params}")
+    elif auto_select:
         chosen_params = auto_select_params(results_df)
         logger.info(f"Automatically selected parameters: {chosen_params}")
     else:
@@ -125,16 +282,213 @@ def process_window(i, in_ohlcv_i, out_ohlcv_i, param_ranges, freq, fees, init_ca
                 except ValueError:
                     print("Invalid input. Please enter a number.")
     
+    if checkpoint is not None:
+        checkpoint.save_selection(i, chosen_params)
+    
     # Process out-of-sample data with chosen parameters
-    out_result = process_param_combination(out_ohlcv_i, tuple(chosen_params.values()), freq, fees, init_cash)
+    patterns, indicators = None, None
+    if history_indicators is not None:
+        patterns, indicators, _ = history_indicators.window(out_ohlcv_i)
+    out_result = process_param_combination(out_ohlcv_i, tuple(chosen_params.values()), freq, fees, init_cash, patterns, indicators)
     
-    return {
+    result = {
         'window': i,
         'in_sample_results': results_df.head(5).to_dict('records'),
         'chosen_params': chosen_params,
         'out_sample_result': out_result,
         'plot_filename': plot_filename
     }
+    if checkpoint is not None:
+        checkpoint.save_window(i, result)
+    return result
+
+def evaluate_window_grid(i, in_ohlcv_i, param_ranges, freq, fees, init_cash, validate_simulator=False, result_cache=None, checkpoint=None, param_combinations=None, desc=None, history_indicators=None, stream_top_k=None):
+    # In-sample results of window i for the whole grid (or the given param_combinations), in grid order
+    shared, grid, cached = prepare_window(i, in_ohlcv_i, param_ranges, freq, fees, init_cash, validate_simulator, result_cache, checkpoint, param_combinations, history_indicators,
+                                          stream_top_k)
+    sink = window_sink(cached)
+    
+    # The pool outlives the window, so its workers are spawned (and keep their compiled kernels) once per run
+    pool = get_pool()
+    
+    try:
+        with tqdm(total=len(grid[2]), desc=desc or f"Processing window {i+1}") as pbar:
+            for _, results in run_window_grids(pool, [grid], pbar.update, checkpoint.save_chunk if checkpoint is not None else None,
+                                               {i: sink} if sink is not None else None):
+                pass
+    finally:
+        release_window(shared)
+    
+    return complete_window_results(grid, cached, results, result_cache)
+
+def run_optimizer(i, in_ohlcv_i, param_ranges, optimizer, freq, fees, init_cash, validate_simulator=False, result_cache=None, checkpoint=None, history_indicators=None):
+    # Lets an adaptive optimizer (functions.optimizers) pick the combinations to test, round after round
+    search = optimizer.start(param_ranges)
+    n_evaluations = 0
+    while True:
+        request = search.ask()
+        if request is None:
+            break
+        fraction, param_combinations = request
+        # Data subsets are the most recent bars of the window, the closest to the out-of-sample period.
+        # Only results on the whole window go to the checkpoint, which is keyed by window
+        n_bars = min(len(in_ohlcv_i), max(MIN_SUBSET_BARS, int(round(len(in_ohlcv_i) * fraction))))
+        results = evaluate_window_grid(i, in_ohlcv_i.iloc[-n_bars:], param_ranges, freq, fees, init_cash, validate_simulator, result_cache,
+                                       checkpoint if n_bars == len(in_ohlcv_i) else None, param_combinations,
+                                       f"Window {i+1}: {len(param_combinations)} combinations on {n_bars} bars", history_indicators)
+        search.tell(param_combinations, results.records())
+        n_evaluations += len(param_combinations)
+    
+    logger.info(f"{type(optimizer).__name__} ran {n_evaluations} evaluations ({len(search.results())} on the whole window) for a grid of {grid_size(param_ranges)} combinations")
+    return ResultTable.from_records(param_ranges, search.results(), IN_SAMPLE_METRICS)
+
+def process_window(i, in_ohlcv_i, out_ohlcv_i, param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator=False, result_cache=None, checkpoint=None, optimizer=None, history_indicators=None, result_store=None):
+    if optimizer is None:
+        results = evaluate_window_grid(i, in_ohlcv_i, param_ranges, freq, fees, init_cash, validate_simulator, result_cache, checkpoint,
+                                       history_indicators=history_indicators, stream_top_k=STREAM_TOP_K)
+    else:
+        results = run_optimizer(i, in_ohlcv_i, param_ranges, optimizer, freq, fees, init_cash, validate_simulator, result_cache, checkpoint, history_indicators)
+    
+    return finish_window(i, results, out_ohlcv_i, param_ranges, freq, fees, init_cash, auto_select, subfolder, checkpoint, history_indicators, result_store)
+
+def load_finished_windows(n_windows, checkpoint=None, stored=None):
+    # {i: result} of the windows that don't run again: loaded from the window store (stored) or completed before an
+    # interrupted run stopped
+    results = dict(stored or {})
+    for i in range(n_windows):
+        result = results.get(i)
+        if result is None and checkpoint is not None:
+            result = checkpoint.load_window(i)
+        if result is not None:
+            results[i] = result
+            log_window_result(result)
+    return results
+
+def process_windows_concurrently(in_ohlcv, out_ohlcv, n_windows, param_ranges, freq, fees, init_cash, subfolder, validate_simulator=False, result_cache=None, checkpoint=None, history_indicators=None, stored=None, result_store=None):
+    # Every window's in-sample grid is queued into the pool at once and each window's out-of-sample test runs as soon
+    # as its own grid is done, so the workers don't idle on the tail of one window before the next one starts
+    results = load_finished_windows(n_windows, checkpoint, stored)
+    
+    prepared = {i: prepare_window(i, in_ohlcv[i], param_ranges, freq, fees, init_cash, validate_simulator, result_cache, checkpoint,
+                                 history_indicators=history_indicators, stream_top_k=STREAM_TOP_K)
+                for i in range(n_windows) if i not in results}
+    grids = [grid for _, grid, _ in prepared.values()]
+    sinks = {i: window_sink(cached) for i, (_, _, cached) in prepared.items() if window_sink(cached) is not None}
+    
+    try:
+        with tqdm(total=sum(len(grid[2]) for grid in grids), desc=f"Processing {n_windows} windows") as pbar:
+            for i, window_results in run_window_grids(get_pool(), grids, pbar.update, checkpoint.save_chunk if checkpoint is not None else None, sinks):
+                shared, grid, cached = prepared[i]
+                release_window(shared)
+                window_results = complete_window_results(grid, cached, window_results, result_cache)
+                results[i] = finish_window(i, window_results, out_ohlcv[i], param_ranges, freq, fees, init_cash, True, subfolder, checkpoint, history_indicators, result_store)
+                log_window_result(results[i])
+    finally:
+        for shared, _, _ in prepared.values():
+            release_window(shared)
+    
+    return [results[i] for i in range(n_windows)]
+
+def process_anchored_windows(in_ohlcv, out_ohlcv, n_windows, param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator=False, result_cache=None, checkpoint=None, history_indicators=None, stored=None, result_store=None):
+    # Anchored windows all start at the first candle, so every in-sample window is the start of the longest one. The
+    # strategy and the simulator only look back, so each combination is run once over the longest window, its state
+    # carried from one window end to the next, and its metrics are taken at every window end on the way
+    results = load_finished_windows(n_windows, checkpoint, stored)
+    pending = [i for i in range(n_windows) if i not in results]
+    if not pending:
+        return [results[i] for i in range(n_windows)]
+    
+    last = max(pending, key=lambda i: len(in_ohlcv[i]))
+    longest = in_ohlcv[last]
+    ohlc = longest[['Open', 'High', 'Low', 'Close']].to_numpy()
+    for i in pending:
+        if not np.array_equal(in_ohlcv[i][['Open', 'High', 'Low', 'Close']].to_numpy(), ohlc[:len(in_ohlcv[i])], equal_nan=True):
+            raise ValueError(f"In-sample window {i+1} is not the start of window {last+1}, anchored mode needs windows sharing their first candle")
+    ends = [len(in_ohlcv[i]) for i in pending]
+    
+    if history_indicators is None:
+        patterns = calculate_candle_patterns_df(longest)
+        indicators, warm_up_key = None, None
+    else:
+        patterns, indicators, warm_up_key = history_indicators.window(longest)
+    
+    # Cached and checkpointed results are looked up per window, a combination is run again if any window misses it
+    if STREAM_TOP_K is not None:
+        # Streamed: the grid is decoded lazily, the combinations every window has in the checkpoint are skipped (the
+        # others come from the sweep, a TopResults must get every row once)
+        done_by_window = [checkpoint.load_chunks(i) if checkpoint is not None else {} for i in pending]
+        missing, checkpointed = stream_grid(param_ranges, done_by_window)
+        tables = {}
+        for i, (rows, metrics) in zip(pending, checkpointed):
+            tables[i] = top_results(i, param_ranges, missing, STREAM_TOP_K)
+            tables[i].set_metrics(rows, metrics)
+        rows, result_cache = None, None
+        logger.info(f"Anchored windows: {missing.size - len(missing)} of {missing.size} combinations loaded from the checkpoint")
+    else:
+        param_combinations = list(product(*param_ranges.values()))
+        tables = {}
+        missing = np.zeros(len(param_combinations), dtype=bool)
+        cache_keys = {}
+        checkpointed = {}
+        for i in pending:
+            tables[i] = ResultTable(param_ranges, param_combinations, IN_SAMPLE_METRICS)
+            known = np.zeros(len(param_combinations), dtype=bool)
+            if result_cache is not None:
+                cache_keys[i] = result_cache.window_key(in_ohlcv[i], process_param_grid.__module__, freq, fees, init_cash, warm_up_key)
+                cached = result_cache.lookup(cache_keys[i], param_combinations, list(param_ranges), IN_SAMPLE_METRICS)
+                rows = [j for j, result in enumerate(cached) if result is not None]
+                tables[i].set_results(rows, [cached[j] for j in rows])
+                known[rows] = True
+            if checkpoint is not None:
+                done = checkpoint.load_chunks(i)
+                rows = [j for j, params in enumerate(param_combinations) if not known[j] and tuple(params) in done]
+                checkpointed[i] = (rows, [done[tuple(param_combinations[j])] for j in rows])
+                known[rows] = True
+            missing |= ~known
+        for i, (rows, metrics) in checkpointed.items():
+            # Combinations run again for another window come from the sweep
+            keep = [k for k, j in enumerate(rows) if not missing[j]]
+            tables[i].set_metrics([rows[k] for k in keep], [metrics[k] for k in keep])
+        rows = np.flatnonzero(missing)
+        missing = [param_combinations[j] for j in rows]
+        logger.info(f"Anchored windows: {len(param_combinations) - len(missing)} of {len(param_combinations)} combinations loaded from the result cache or the checkpoint")
+    
+    n_bars = len(longest)
+    cost_kind = process_param_grid.__module__ + ':anchored'
+    param_chunks = plan_chunks(missing, list(param_ranges).index('ewm_period'), multiprocessing.cpu_count(),
+                               estimate_cost(cost_kind, n_bars))
+    shared = publish_window(last, longest, patterns, indicators)
+    process_func = partial(process_param_chunk, shared, freq=freq, fees=fees, init_cash=init_cash, validate=validate_simulator, ends=ends,
+                           metric_names=IN_SAMPLE_METRICS)
+    
+    def save_chunk(_, param_chunk, chunk_results):
+        # Every chunk holds the results of all the windows, each window's share goes to its own chunk file
+        for k, i in enumerate(pending):
+            checkpoint.save_chunk(i, param_chunk, chunk_results[:, k])
+    
+    def add_chunk(indices, chunk_results):
+        # Streamed windows (STREAM_TOP_K) get their share of every chunk as it comes back, indices are grid positions
+        for k, i in enumerate(pending):
+            tables[i].set_metrics(indices, chunk_results[:, k])
+    
+    try:
+        with tqdm(total=len(missing), desc=f"Processing {len(pending)} anchored windows on {n_bars} bars") as pbar:
+            for _, sweep_results in run_window_grids(get_pool(), [(last, process_func, missing, param_chunks, cost_kind, n_bars)],
+                                                     pbar.update, save_chunk if checkpoint is not None else None,
+                                                     {last: add_chunk} if STREAM_TOP_K is not None else None):
+                pass
+    finally:
+        release_window(shared)
+    
+    for k, i in enumerate(pending):
+        if sweep_results is not None and len(rows):
+            tables[i].set_metrics(rows, sweep_results[:, k])
+        if result_cache is not None:
+            result_cache.store(cache_keys[i], missing, tables[i].records(rows))
+        results[i] = finish_window(i, tables[i], out_ohlcv[i], param_ranges, freq, fees, init_cash, auto_select, subfolder, checkpoint, history_indicators, result_store)
+        log_window_result(results[i])
+    
+    return [results[i] for i in range(n_windows)]
 
 def save_results_to_csv(results, output_file):
     data = []
@@ -183,52 +537,115 @@ def save_results(results, output_file_md, output_file_csv):
     # Save to CSV
     save_results_to_csv(results, output_file_csv)
 
-def walk_forward_optimization(in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash, auto_select, subfolder):
-    results = []
-    for i in range(len(in_indexes)):
-        result = process_window(i, in_ohlcv[i], out_ohlcv[i], param_ranges, freq, fees, init_cash, auto_select, subfolder)
-        results.append(result)
-        
-        logger.info(f"\nWindow {i+1} Results:")
-        logger.info(f"In-sample top Sharpe: {result['in_sample_results'][0]['sharpe_ratio']:.4f}")
-        logger.info(f"Chosen parameters: {result['chosen_params']}")
-        logger.info(f"Out-of-sample Sharpe: {result['out_sample_result']['sharpe_ratio']:.4f}")
+def log_window_result(result):
+    # The in-sample results hold the IN_SAMPLE_METRICS, the first rank metric among them is shown
+    top = result['in_sample_results'][0]
+    metric = rank_metrics(top)[0]
+    logger.info(f"\nWindow {result['window']+1} Results:")
+    logger.info(f"In-sample top {metric.replace('_', ' ').title()}: {top[metric]:.4f}")
+    logger.info(f"Chosen parameters: {result['chosen_params']}")
+    logger.info(f"Out-of-sample Sharpe: {result['out_sample_result']['sharpe_ratio']:.4f}")
+
+def walk_forward_optimization(in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator=False, concurrent_windows=False, result_cache=None, checkpoint=None, optimizer=None, history=None, anchored=False, window_store=None, result_store=None):
+    # A metric set that can't be ranked is rejected before any window runs
+    rank_metrics(IN_SAMPLE_METRICS)
+    
+    # With history (the whole OHLCV the windows were split from), indicators are computed once over it and every window
+    # is warmed up on the bars before it. The windows get their dates back so they can be found in the history
+    history_indicators = None
+    if history is not None:
+        history_indicators = HistoryIndicators(history, calculate_grid_indicators, param_ranges)
+        in_ohlcv = [in_ohlcv[i].set_axis(in_indexes[i]) for i in range(len(in_indexes))]
+        out_ohlcv = [out_ohlcv[i].set_axis(out_indexes[i]) for i in range(len(out_indexes))]
+    
+    # Windows with the same candles (and warm-up candles), code, params and settings as in an earlier run are loaded from
+    # the window store, e.g. every window but the new trailing ones once candles were appended to the data file. The code is
+    # the strategy module's and this script's (__name__ is '__main__' when the script runs directly)
+    stored = {}
+    window_keys = []
+    if window_store is not None:
+        for i in range(len(in_indexes)):
+            warm_up_key = history_indicators.window(in_ohlcv[i])[2] if history_indicators is not None else None
+            window_keys.append(window_store.key((process_param_grid.__module__, __name__), i, in_ohlcv[i], out_ohlcv[i], in_indexes[i], out_indexes[i], param_ranges, freq, fees, init_cash,
+                                                (warm_up_key, auto_select, optimizer_settings(optimizer), IN_SAMPLE_METRICS)))
+            result = window_store.load(window_keys[i])
+            if result is not None:
+                stored[i] = result
+        logger.info(f"{len(stored)} of {len(in_indexes)} windows loaded from the window store")
+    
+    # Anchored windows share their first candle, the grid is run once over the longest one for all of them
+    if anchored and optimizer is None:
+        results = process_anchored_windows(in_ohlcv, out_ohlcv, len(in_indexes), param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator, result_cache, checkpoint, history_indicators, stored,
+                                           result_store)
+    
+    # With automatic selection nothing waits for the user between windows, so all of them can run in one sweep.
+    # An adaptive optimizer decides each round from the previous one, its windows run one after the other
+    elif auto_select and concurrent_windows and optimizer is None:
+        results = process_windows_concurrently(in_ohlcv, out_ohlcv, len(in_indexes), param_ranges, freq, fees, init_cash, subfolder, validate_simulator, result_cache, checkpoint, history_indicators, stored,
+                                               result_store)
+    
+    else:
+        # Windows completed before an interrupted run stopped (or stored by an earlier run) are not processed again
+        finished = load_finished_windows(len(in_indexes), checkpoint, stored)
+        results = []
+        for i in range(len(in_indexes)):
+            result = finished.get(i)
+            if result is None:
+                result = process_window(i, in_ohlcv[i], out_ohlcv[i], param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator, result_cache, checkpoint, optimizer, history_indicators,
+                                        result_store)
+                log_window_result(result)
+            results.append(result)
+    
+    if window_store is not None:
+        for i, result in enumerate(results):
+            if i not in stored:
+                window_store.save(window_keys[i], result)
+    
+    # Every window's selection and out-of-sample stats, its in-sample grid was stored when it was evaluated
+    if result_store is not None:
+        for i, result in enumerate(results):
+            result_store.save_summary(i, result, in_indexes[i], out_indexes[i])
     
     return results
 
-def create_combined_parameter_sharpe_plot(results, window_index, subfolder):
-    # Convert results to a DataFrame
-    df = pd.DataFrame(results)
+def create_combined_parameter_sharpe_plot(table, window_index, subfolder):
+    # Columns of the ResultTable to a DataFrame
+    df = table.to_frame()
     
-    # Sort by Sharpe ratio
-    df = df.sort_values('sharpe_ratio', ascending=False)
+    # Calculate Calmar ratio
+    if 'total_return' in df and 'max_drawdown' in df:
+        df['calmar_ratio'] = df['total_return'] / df['max_drawdown'].abs()
     
-    # Create a parameter combination string for each result
-    df['param_combination'] = df['params'].apply(lambda x: ', '.join(f"{k}:{v}" for k, v in x.items()))
+    # Plotted against the first rank metric computed in-sample, the Sharpe ratio unless IN_SAMPLE_METRICS leaves it out
+    metric = table.rank_metrics[0]
+    label = metric.replace('_', ' ').title()
+    df = df.sort_values(metric, ascending=False)
     
-    # Calculate Calmar ratio
-    df['calmar_ratio'] = df['total_return'] / df['max_drawdown'].abs()
+    # Create a parameter combination string for each result
+    df['param_combination'] = [', '.join(f"{k}:{v}" for k, v in zip(table.param_names, values))
+                               for values in zip(*(df[name].tolist() for name in table.param_names))]
     
     # Create the scatter plot
     fig = go.Figure()
     
-    hover_text = df.apply(lambda row: f"Params: {row['param_combination']}<br>"
-                                      f"Sharpe Ratio: {row['sharpe_ratio']:.4f}<br>"
-                                      f"Sortino Ratio: {row['sortino_ratio']:.4f}<br>"
-                                      f"Calmar Ratio: {row['calmar_ratio']:.4f}<br>"
-                                      f"Total Return: {row['total_return']:.2%}<br>"
-                                      f"Total Trades: {row['total_trades']}", axis=1)
+    # Only the metrics computed in-sample (IN_SAMPLE_METRICS) are shown
+    hover_metrics = [(label, name, fmt) for label, name, fmt in [('Sharpe Ratio', 'sharpe_ratio', '.4f'), ('Sortino Ratio', 'sortino_ratio', '.4f'),
+                                                                 ('Calmar Ratio', 'calmar_ratio', '.4f'), ('Total Return', 'total_return', '.2%'),
+                                                                 ('Total Trades', 'total_trades', '')]
+                     if name in df]
+    hover_text = df.apply(lambda row: f"Params: {row['param_combination']}<br>" +
+                                      "<br>".join(f"{label}: {row[name]:{fmt}}" for label, name, fmt in hover_metrics), axis=1)
     
     scatter = go.Scatter(
         x=list(range(len(df))),
-        y=df['sharpe_ratio'],
+        y=df[metric],
         mode='markers',
         marker=dict(
             size=10,
-            color=df['sharpe_ratio'],
+            color=df[metric],
             colorscale='Viridis',
             showscale=True,
-            colorbar=dict(title='Sharpe Ratio')
+            colorbar=dict(title=label)
         ),
         text=hover_text,
         hoverinfo='text'
@@ -236,8 +653,8 @@ def create_combined_parameter_sharpe_plot(results, window_index, subfolder):
     
     fig.add_trace(scatter)
     
-    # Add horizontal lines at Sharpe ratios -2, 0, and 2
-    for y in [-2, 0, 2]:
+    # Add horizontal lines at ratios of -2, 0, and 2 (only 0 for the total return)
+    for y in ([-2, 0, 2] if metric.endswith('_ratio') else [0]):
         fig.add_shape(
             type="line",
             x0=0,
@@ -249,9 +666,9 @@ def create_combined_parameter_sharpe_plot(results, window_index, subfolder):
     
     # Update layout
     fig.update_layout(
-        title=f'Parameter Combinations vs Sharpe Ratio (Window {window_index + 1})',
-        xaxis_title='Parameter Combinations (sorted by Sharpe Ratio)',
-        yaxis_title='Sharpe Ratio',
+        title=f'Parameter Combinations vs {label} (Window {window_index + 1})',
+        xaxis_title=f'Parameter Combinations (sorted by {label})',
+        yaxis_title=label,
         hovermode='closest',
         height=800,  # Increased height
         width=1200,  # Increased width
@@ -282,19 +699,34 @@ if __name__ == "__main__":
     os.makedirs(subfolder, exist_ok=True)
 
 
-    raw_ohlcv = pd.read_csv(input_file, parse_dates=['Date'], index_col='Date')
+    # Parsed once into a binary cache next to the csv (memory-mapped afterwards), rebuilt when the csv changes
+    raw_ohlcv = load_ohlcv(input_file)
     logger.info(f"Loaded data with {len(raw_ohlcv)} rows")
 
     # You can tweak the insample_percentage as well as the n number of periods for walk-forward optimization. This will output new variables which i process in my custom function 'wfo_rolling_split_params'
-    n, window_len, set_lens = wfo_rolling_split_params(total_candles=len(raw_ohlcv), insample_percentage=0.80, n=20)
-    logger.info(f"Data split into {n} windows")
+    insample_percentage = 0.80
+    n, window_len, set_lens = wfo_rolling_split_params(total_candles=len(raw_ohlcv), insample_percentage=insample_percentage, n=20)
+    # Anchored (expanding) windows: every in-sample window starts at the first candle and grows by one out-of-sample
+    # segment from one window to the next. The grid is then run once over the longest window instead of once per window
+    anchored = False
+    
+    # Fixed window lengths in candles, e.g. insample_len, outsample_len = 365 * 24, 7 * 24 for a year of 1h candles in-sample
+    # and a week out-of-sample. Candles appended to the data file then only add windows at the end and the windows of
+    # earlier runs come from the window store. With None the data is split into n windows which all move when candles are appended
+    insample_len, outsample_len = None, None
     
     # This function will split our data making them ready to perform walk-forward backtest
-    (in_ohlcv, in_indexes), (out_ohlcv, out_indexes) = raw_ohlcv.vbt.rolling_split(
-        n=n,
-        window_len=window_len,
-        set_lens=set_lens,
-    )
+    if insample_len is not None:
+        (in_ohlcv, in_indexes), (out_ohlcv, out_indexes) = wfo_split(raw_ohlcv, insample_len, outsample_len, anchored)
+    elif anchored:
+        (in_ohlcv, in_indexes), (out_ohlcv, out_indexes) = wfo_anchored_split(raw_ohlcv, n=n, insample_percentage=insample_percentage)
+    else:
+        (in_ohlcv, in_indexes), (out_ohlcv, out_indexes) = raw_ohlcv.vbt.rolling_split(
+            n=n,
+            window_len=window_len,
+            set_lens=set_lens,
+        )
+    logger.info(f"Data split into {len(in_indexes)} windows")
 
     # Change the param ranges based on your preferences
     param_ranges = {
@@ -308,6 +740,23 @@ if __name__ == "__main__":
     freq = '30m' # Don't forget to change the freq based on the provided data granularity
     fees = 0.0005 # Binance taker fee 0.05%, maker fee 0.025%
     init_cash = 100000
+    validate_simulator = False  # Set to True to check every in-sample combination of the native simulator against vectorbt (slow)
+    concurrent_windows = True  # With automatic selection, run all windows' in-sample grids in one pool sweep
+    use_result_cache = True  # Reuse the in-sample results of earlier runs on the same data, code and settings (results/cache)
+    # None tests the whole grid, the optimizers below test a fraction of it (see guide.md, item 9). Tweak their arguments here
+    optimizer_name = None
+    optimizers = {
+        'successive_halving': SuccessiveHalving(),
+        'tpe': TPESampler(n_trials=200),
+        'coarse_to_fine': CoarseToFine(budget=300),
+    }
+    if optimizer_name is not None and optimizer_name not in optimizers:
+        raise ValueError(f"Unknown optimizer_name {optimizer_name!r}, expected None or one of {list(optimizers)}")
+    optimizer = optimizers.get(optimizer_name)
+    use_history_indicators = False  # True computes the indicators once over the whole data, every window warmed up on the bars before it (results differ slightly)
+    resume = True  # Continue an interrupted run of the same data, code, params and settings from its checkpoint (<subfolder>/checkpoint)
+    use_window_store = True  # Load the windows earlier runs computed on the same candles, code, params and settings (<subfolder>/windows), e.g. after appending candles
+    use_result_store = True  # Keep every window's in-sample grid, selection and out-of-sample stats in results/store, partitioned by strategy, pair_freq, run and window
 
     # This allows you either select your own parameters combination each processed window or let automatically select the params combination from Top 5 of the last in-sample test
     while True:
@@ -318,7 +767,28 @@ if __name__ == "__main__":
         else:
             print("Invalid input. Please enter 'y' or 'n'.")
 
-    results = walk_forward_optimization(in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash, auto_select, subfolder)
+    # The pool workers are forked from this process after warm_up ran the parallel kernels here. numba's TBB layer is not
+    # safe across that fork (this process then hangs at exit), nor is GNU OpenMP (a forked worker aborts on its first
+    # parallel kernel), the workqueue layer is. Has to be set before the first parallel kernel runs, NUMBA_THREADING_LAYER
+    # in the environment takes precedence
+    if 'NUMBA_THREADING_LAYER' not in os.environ:
+        numba.config.THREADING_LAYER = 'workqueue'
+
+    # Compile the kernels once in the parent (or load them from numba's on-disk cache), forked pool workers inherit them
+    warm_up(strategy_module, next(product(*param_ranges.values())), freq, fees, init_cash)
+
+    result_cache = ResultCache(os.path.join('results', 'cache')) if use_result_cache else None
+    window_store = WindowStore(os.path.join(subfolder, 'windows')) if use_window_store else None
+    checkpoint = RunCheckpoint(os.path.join(subfolder, 'checkpoint'),
+                               run_key(strategy_module.__name__, in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash,
+                                       {'history_indicators': use_history_indicators, 'optimizer': optimizer_settings(optimizer),
+                                        'in_sample_metrics': IN_SAMPLE_METRICS}),
+                               resume)
+    # The run partition is named after the checkpoint key: the same data, code, params and settings write to the same one
+    result_store = ResultStore(os.path.join('results', 'store'), strategy_name, pair_freq, checkpoint.key[:16]) if use_result_store else None
+
+    results = walk_forward_optimization(in_ohlcv, out_ohlcv, in_indexes, out_indexes, param_ranges, freq, fees, init_cash, auto_select, subfolder, validate_simulator, concurrent_windows, result_cache, checkpoint, optimizer,
+                                        raw_ohlcv if use_history_indicators else None, anchored, window_store, result_store)
 
     # Save results in the subfolder
     save_results(results, 